@@ -0,0 +1,212 @@
+"""
+Time hot paths on deterministic synthetic inputs and compare with baselines recorded on this machine.
+
+    $ python -m benchmarks.run --update        # record baselines (once per machine and python version)
+    $ python -m benchmarks.run                 # fails when a benchmark is slower than its baseline + threshold
+"""
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import click
+
+from benchmarks import synthetic
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name: str, requires: tuple = ()):
+    """
+    Register `func(inputs)`, skipped when a required executable or module is missing.
+    """
+    def decorator(func: Callable):
+        BENCHMARKS[name] = (func, requires)
+        return func
+    return decorator
+
+
+def is_available(requirement: str) -> bool:
+    if shutil.which(requirement):
+        return True
+    try:
+        __import__(requirement)
+        return True
+    except ImportError:
+        return False
+
+
+class Inputs:
+    def __init__(self, workdir: str, duration: float, lines: int, seed: int):
+        self.workdir = workdir
+        self.duration = duration
+        self.silences = synthetic.speech_and_silences(duration, seed=seed)
+        self.path_to_wav = os.path.join(workdir, 'synthetic.wav')
+        synthetic.write_synthetic_wav(self.path_to_wav, duration, self.silences, seed=seed)
+        self.transcript = synthetic.synthetic_transcript(lines, seed=seed)
+        self.alignment = synthetic.synthetic_alignment(self.transcript, self.silences, seed=seed)
+
+
+@benchmark('vad.detect_silences', requires=('webrtcvad', 'ffprobe'))
+def bench_vad_detect_silences(inputs: Inputs):
+    from training_speech import vad
+    vad.detect_silences(inputs.path_to_wav)
+
+
+@benchmark('ffmpeg.detect_silences', requires=('ffmpeg', 'ffprobe'))
+def bench_ffmpeg_detect_silences(inputs: Inputs):
+    from training_speech import ffmpeg
+    ffmpeg.detect_silences(inputs.path_to_wav)
+
+
+@benchmark('silence.intersect')
+def bench_silence_intersect(inputs: Inputs):
+    from training_speech import silence
+    shifted = [(begin + 0.05, end + 0.05) for begin, end in inputs.silences]
+    for _ in range(100):
+        silence.intersect(inputs.silences, shifted)
+
+
+@benchmark('utils.fix_alignment')
+def bench_fix_alignment(inputs: Inputs):
+    from training_speech import utils
+    utils.fix_alignment(inputs.alignment, inputs.silences)
+
+
+@benchmark('utils.transition_silences')
+def bench_transition_silences(inputs: Inputs):
+    from training_speech import utils
+    for left, right in zip(inputs.alignment[:-1], inputs.alignment[1:]):
+        try:
+            utils.transition_silences(left, right, inputs.silences)
+        except NotImplementedError:
+            pass
+
+
+@benchmark('utils.merge_overlaps')
+def bench_merge_overlaps(inputs: Inputs):
+    from training_speech import utils
+    for _ in range(100):
+        list(utils.merge_overlaps(inputs.silences, margin=0.3))
+
+
+@benchmark('utils.maybe_normalize')
+def bench_maybe_normalize(inputs: Inputs):
+    from training_speech import utils
+    for line in inputs.transcript:
+        utils.maybe_normalize(line)
+
+
+@benchmark('cut fragments')
+def bench_cut_fragments(inputs: Inputs):
+    from training_speech import archive, wav
+    with wav.PCM(inputs.path_to_wav) as pcm:
+        for fragment in inputs.alignment:
+            archive.fragment_wav(pcm, fragment)
+
+
+@benchmark('cut fragments (store)')
+def bench_cut_fragments_store(inputs: Inputs):
+    from training_speech import fragments, wav
+    path_to_store = os.path.join(inputs.workdir, 'fragments')
+    shutil.rmtree(path_to_store, ignore_errors=True)
+    with wav.PCM(inputs.path_to_wav) as pcm, fragments.FragmentStore(path_to_store) as store:
+        for _ in range(2):  # cut then read back
+            for fragment in inputs.alignment:
+                fragments.cut_fragment_audio(store, 'synthetic', fragment, pcm.rate, lambda: pcm)
+
+
+def measure(func: Callable, inputs: Inputs, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(inputs)
+        timings.append(time.perf_counter() - start)
+    # NB: min is the least noisy estimate of the actual cost
+    return min(timings)
+
+
+def environment() -> dict:
+    """
+    What timings depend on besides the code: baselines recorded elsewhere are not compared.
+    """
+    return dict(
+        host=platform.node(),
+        machine=platform.machine(),
+        processor=platform.processor(),
+        cpus=os.cpu_count(),
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+    )
+
+
+@click.command()
+@click.option('--duration', type=float, default=3600, help='synthetic audio duration in seconds')
+@click.option('--lines', type=int, default=3000, help='synthetic transcript lines')
+@click.option('--seed', type=int, default=0)
+@click.option('--repeat', type=int, default=3)
+@click.option('--threshold', type=float, default=0.2, help='max slowdown allowed relative to the baseline')
+@click.option('--min-delta', type=float, default=0.005, help='ignore slowdowns below this many seconds (ie. timer noise)')
+@click.option('--only', multiple=True, help='run only these benchmarks')
+@click.option('--update', is_flag=True, default=False, help='save results as new baselines')
+@click.option('--baselines', 'path_to_baselines', default=None,
+              help='baselines file (default: benchmarks.json in the cache directory)')
+def main(duration, lines, seed, repeat, threshold, min_delta, only, update, path_to_baselines):
+    from training_speech import utils
+    # NB: timings only compare on the machine they were recorded on => baselines are not versioned
+    path_to_baselines = path_to_baselines or os.path.join(utils.CACHE_DIR, 'benchmarks.json')
+    params = dict(duration=duration, lines=lines, seed=seed)
+    baselines = {}
+    if os.path.isfile(path_to_baselines):
+        with open(path_to_baselines) as f:
+            stored = json.load(f)
+        if stored['params'] != params:
+            print(f'baselines were recorded with {stored["params"]} => not compared')
+        elif stored.get('environment') != environment():
+            print(f'baselines were recorded on {stored.get("environment")} => not compared')
+        else:
+            baselines = stored['results']
+    elif not update:
+        print(f'no baselines in {path_to_baselines} => not compared, record them with --update')
+
+    results = dict(baselines) if update else {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f'generating {duration}s of audio and {lines} transcript lines...')
+        inputs = Inputs(workdir, duration, lines, seed)
+
+        for name, (func, requires) in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            missing = [r for r in requires if not is_available(r)]
+            if missing:
+                print(f'{name:<30} skipped (missing {", ".join(missing)})')
+                continue
+            elapsed = measure(func, inputs, repeat)
+            results[name] = round(elapsed, 4)
+            baseline = baselines.get(name)
+            line = f'{name:<30} {elapsed:9.4f}s'
+            if baseline:
+                ratio = elapsed / baseline
+                line += f'  baseline {baseline:9.4f}s  {ratio - 1:+.1%}'
+                if ratio > 1 + threshold and elapsed - baseline > min_delta:
+                    regressions.append(name)
+                    line += '  REGRESSION'
+            print(line)
+
+    if update:
+        with open(path_to_baselines, 'w') as f:
+            json.dump(dict(params=params, environment=environment(), results=results), f, indent=2, sort_keys=True)
+        print(f'baselines saved to {path_to_baselines}')
+    elif regressions:
+        print(f'{len(regressions)} regression(s) above {threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import random
+from typing import List, Tuple
+
+import numpy as np
+
+from training_speech import wav
+
+WORDS = (
+    'le la les un une des et à de du en dans sur pour par avec sans sous chez mais ou donc or ni car '
+    'maison jardin chemin fenêtre soleil nuit matin soir homme femme enfant ville campagne rivière '
+    'regarder marcher parler penser attendre répondre entendre ouvrir fermer sourire pleurer '
+    'grand petit vieux jeune beau triste heureux sombre clair lointain proche silencieux'
+).split()
+PUNCTUATIONS = [',', ';', ':', '!', '?', '…', ' —']
+
+
+def speech_and_silences(duration: float, seed: int = 0) -> List[Tuple[float, float]]:
+    """
+    Return (start, end) of silences alternating with speech-like bursts of 0.3-4s.
+    """
+    rng = random.Random(seed)
+    silences = []
+    t = rng.uniform(0.1, 0.5)
+    silences.append((0., t))
+    while t < duration:
+        t += rng.uniform(0.3, 4.)  # speech burst
+        if t >= duration:
+            break
+        # mostly short pauses between words and longer ones between sentences
+        silence = rng.uniform(0.05, 0.25) if rng.random() < 0.7 else rng.uniform(0.4, 1.5)
+        silences.append((round(t, 3), round(min(t + silence, duration), 3)))
+        t += silence
+    return silences
+
+
+def write_synthetic_wav(path: str, duration: float, silences: List[Tuple[float, float]], rate: int = 16000,
+                        seed: int = 0, chunk_duration: float = 60.):
+    """
+    Write int16 mono samples: voiced-like harmonics modulated at a syllable rate, with low noise in silences.
+    Samples are generated by chunk so that hours of audio do not have to fit in memory.
+    """
+    rng = np.random.RandomState(seed)
+    n = int(duration * rate)
+    chunk_size = int(chunk_duration * rate)
+    phase_offset = 0.
+    with open(path, 'wb') as f:
+        f.write(wav.header(rate, 1, 2, n * 2))
+        for chunk_start in range(0, n, chunk_size):
+            size = min(chunk_size, n - chunk_start)
+            t = (chunk_start + np.arange(size)) / rate
+            pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t)
+            phase = phase_offset + 2 * np.pi * np.cumsum(pitch) / rate
+            phase_offset = phase[-1]
+            voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+            syllables = (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)) ** 2
+            samples = 0.3 * voiced * syllables + 0.02 * rng.randn(size)
+            chunk_end = chunk_start + size
+            for start, end in silences:
+                start, end = max(int(start * rate), chunk_start), min(int(end * rate), chunk_end)
+                if start < end:
+                    samples[start - chunk_start:end - chunk_start] = 0.001 * rng.randn(end - start)
+            f.write((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+
+
+def synthetic_transcript(n_lines: int, seed: int = 0) -> List[str]:
+    """
+    French-like lines, with numbers, roman numerals and punctuation to normalize.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n_lines):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 25))]
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words)), str(rng.randint(1, 3000)))
+        if rng.random() < 0.05:
+            words.insert(0, f'CHAPITRE {rng.choice(["I", "IV", "XII", "XX"])}')
+        line = ' '.join(words)
+        if rng.random() < 0.5:
+            line += rng.choice(PUNCTUATIONS) + ' ' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+        lines.append(line[0].upper() + line[1:] + '.')
+    return lines
+
+
+def synthetic_alignment(transcript: List[str], silences: List[Tuple[float, float]], seed: int = 0) -> List[dict]:
+    """
+    One fragment per line, cut in (or close to) silences, as aeneas would.
+    """
+    rng = random.Random(seed)
+    cuts = silences[1:]
+    step = max(len(cuts) // len(transcript), 1)
+    alignment = []
+    begin = silences[0][1]
+    for i, text in enumerate(transcript):
+        if (i + 1) * step >= len(cuts):
+            break
+        start, end = cuts[(i + 1) * step]
+        cut = round(rng.uniform(start - 0.1, end + 0.1), 3)
+        alignment.append(dict(begin=begin, end=cut, text=text))
+        begin = cut
+    return alignment
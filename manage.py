@@ -4,12 +4,10 @@ import json
 import logging
 import os
 import shutil
-import subprocess
+import sqlite3
 import tempfile
-import zipfile
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 from typing import List, Tuple
 
@@ -19,7 +17,7 @@ from tabulate import tabulate
 from termcolor import colored
 
 import training_speech
-from training_speech import utils, ffmpeg, sox, exceptions, vad
+from training_speech import utils, ffmpeg, sox, exceptions, silence, journal, player, pipeline, archive, wav, shards, dataset, buckets, runner, fragments, profiling, accounting, memory, catalog, search, storage
 
 CURRENT_DIR = os.path.dirname(__file__)
 
@@ -28,8 +26,41 @@ logger = logging.getLogger()
 
 
 @click.group()
-def cli():
-    pass
+@click.option('--profile', 'path_to_trace', type=click.Path(dir_okay=False), default=None,
+              help='time each stage, print a summary and write a Chrome trace (chrome://tracing, ui.perfetto.dev) to this file')
+@click.option('--processes', 'report_processes', is_flag=True, default=False,
+              help='print the number, duration and callers of the external processes spawned by the command')
+@click.option('--memory', 'report_memory', is_flag=True, default=False,
+              help='print peak memory and top allocation sites of each stage')
+@click.option('--max-memory', default=None,
+              help='fail as soon as the command (and its child processes) uses more memory than this (ie. 7.5G)')
+@click.pass_context
+def cli(ctx, path_to_trace, report_processes, report_memory, max_memory):
+    if report_processes:
+        ctx.call_on_close(lambda: click.echo('\n' + tabulate(accounting.histogram(), headers=accounting.HISTOGRAM_HEADERS)))
+    if report_memory or max_memory:
+        try:
+            max_memory = memory.parse_size(max_memory) if max_memory else None
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--max-memory')
+        memory.enable(trace=report_memory, max_memory=max_memory)
+        if report_memory:
+            ctx.call_on_close(lambda: click.echo('\n' + tabulate(memory.summary(), headers=memory.SUMMARY_HEADERS)))
+        ctx.with_resource(memory.stage(f'manage.{ctx.invoked_subcommand}'))
+    if path_to_trace is None:
+        return
+    profiling.enable()
+
+    def _report():
+        profiling.export_chrome_trace(path_to_trace)
+        click.echo('\n' + tabulate(
+            profiling.summary(),
+            headers=['Span', 'Calls', 'Total (s)', 'Self (s)', 'Mean (ms)', 'Max (ms)'],
+        ))
+        click.echo(f'trace written to {path_to_trace}')
+
+    ctx.call_on_close(_report)
+    ctx.with_resource(profiling.span(f'manage.{ctx.invoked_subcommand}'))
 
 
 @cli.command()
@@ -48,88 +79,42 @@ def build_transcript(source_name, yes, add_to_git):
         f.writelines(utils.read_epub(path_to_epub, path_to_xhtmls=source.get('ebook_parts', ['part1.xhtml'])))
 
     if add_to_git:
-        subprocess.call(f'git add {path_to_transcript}'.split(' '))
+        runner.run(f'git add {path_to_transcript}'.split(' '))
     click.echo(f'transcript {path_to_transcript} added to git')
 
 
-audio_player = None
-
-
-def cut_fragment_audio(fragment: dict, input_file: str, output_dir: str=utils.CACHE_DIR, salt: str=None, force=False):
-    if not os.path.isdir(output_dir):
-        os.mkdir(output_dir)
-
-    fragment_hash = utils.get_fragment_hash(fragment, salt=salt)
-    path_to_fragment_audio = os.path.join(output_dir, f'{fragment_hash}.wav')
-    if force or not os.path.isfile(path_to_fragment_audio):
-        ffmpeg.cut(input_file, path_to_fragment_audio, from_=fragment['begin'], to=fragment['end'])
-    return path_to_fragment_audio
-
-
-def cut_fragments_audio(fragments: List[dict], input_file: str, output_dir: str=utils.CACHE_DIR):
-    # generate fragments
-    with click.progressbar(length=len(fragments), show_eta=True, label='cut audio into fragments') as bar:
-        def _cut(f: dict):
-            p = cut_fragment_audio(f, input_file, output_dir)
-            bar.update(1)
-            return p
-
-        with ThreadPoolExecutor() as executor:
-            return executor.map(_cut, fragments)
-
-
 @cli.command()
 @click.argument('source_name')
 @click.option('-r', '--restart', is_flag=True, default=False, help='restart validation from scratch')
 @click.option('-s', '--speed', default=1.3, help='set audio speed')
 @click.option('-ar', '--audio-rate', default=16000)
-@click.option('-nc', '--no-cache', is_flag=True, default=None)
+@click.option('-nc', '--no-cache', is_flag=True, default=None,
+              help='decode audio, detect silences and build alignment again (persistent stores are kept)')
 @click.option('-f', '--fast', is_flag=True, default=False)
 @click.option('--start', type=int, default=0)
-def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, start):
+@click.option('--save-interval', type=float, default=300,
+              help='rewrite alignment and transcript every N seconds (0: after each fragment), edits are journaled in between')
+def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, start, save_interval):
     import inquirer
     source = training_speech.get_source(source_name)
     path_to_alignment = os.path.join(CURRENT_DIR, f'data/alignments/{source_name}.json')
     path_to_transcript = os.path.join(CURRENT_DIR, f'data/transcripts/{source_name}.txt')
-    path_to_mp3 = os.path.join(CURRENT_DIR, 'data/mp3', source['audio'])
-
-    if no_cache and os.path.isdir(utils.CACHE_DIR):
-        shutil.rmtree(utils.CACHE_DIR)
-        os.mkdir(utils.CACHE_DIR)
-
-    # generate wav if do not exists yet
-    with open(path_to_mp3, 'rb') as f:
-        file_hash = utils.hash_file(f)
-    path_to_wav = os.path.join(utils.CACHE_DIR, f'{file_hash}.wav')
-    if not os.path.exists(path_to_wav):
-        ffmpeg.convert(
-            from_=path_to_mp3,
-            to=os.path.join(utils.CACHE_DIR, f'{file_hash}.wav'),
-            rate=audio_rate,
-            channels=1
-        )
 
-    # retrieve transcript
-    with open(path_to_transcript) as f:
-        transcript = [l.strip() for l in f.readlines()]
-    transcript = [l for l in transcript if l]  # rm empty lines
-
-    # detect silences through VAD
-    silences = vad.list_silences(path_to_wav=path_to_wav, frame_duration=20)
-
-    if not restart and os.path.isfile(path_to_alignment):
-        with open(path_to_alignment) as f:
-            existing_alignment = json.load(f)
-    else:
-        existing_alignment = []
-
-    alignment = utils.build_alignment(
-        transcript=transcript,
-        path_to_audio=path_to_wav,
-        existing_alignment=existing_alignment,
-        silences=silences,
-        generate_labels=True,
-    )
+    if no_cache:
+        pipeline.clear_cache()
+
+    # replay edits of a previous session that did not terminate properly
+    recovered = journal.recover(path_to_alignment, path_to_transcript)
+    if recovered:
+        click.echo(f'{recovered} edits recovered from previous session')
+
+    prepared = pipeline.Pipeline(source_name, audio_rate=audio_rate, restart=restart).run()
+    path_to_wav = prepared.path_to_wav
+    silences = prepared.silences
+    alignment = prepared.alignment
+    edit_log = journal.Journal(path_to_alignment, path_to_transcript, interval=save_interval)
+    edit_log.checkpoint(alignment)
+    audio_player = player.Player(path_to_wav)
 
     def _check_alignment(index: int, alignment: List[dict]):
         click.clear()
@@ -150,24 +135,15 @@ def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, sta
             for next_ in next_fragments:
                 print(colored(next_['text'], 'grey'))
 
-        todo = set()
-        pool = ThreadPoolExecutor()
-
-        def play_audio():
-            path_to_audio = cut_fragment_audio(fragment, path_to_wav)
-            global audio_player
-
-            with sox.play(path_to_audio, speed=speed) as player:
-                audio_player = player
+        def play_audio(speed_=speed):
+            # NB: read from the memory-mapped wav => no need to cut fragments ahead
+            audio_player.play(audio_player.read(fragment['begin'], fragment['end']), speed=speed_)
 
-        def play_audio_slow():
-            path_to_audio = cut_fragment_audio(fragment, path_to_wav)
-            global audio_player
+        play_audio()
 
-            with sox.play(path_to_audio) as player:
-                audio_player = player
-
-        todo.add(pool.submit(play_audio))
+        def journal_moves(*indexes):
+            for index_ in indexes:
+                edit_log.append('move', index=index_, begin=alignment[index_]['begin'], end=alignment[index_]['end'])
 
         def ask_right_transcript(current: List[str]):
             new_text = click.edit(text='\n'.join(current), require_save=False)
@@ -222,20 +198,17 @@ def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, sta
             except Exception:
                 next_ = 'quit'
 
-            global audio_player
-            try:
-                audio_player.kill()
-            except:
-                pass
+            audio_player.stop()
 
             if next_ == 'repeat':
-                todo.add(pool.submit(play_audio_slow))
-                todo.add(pool.submit(ask_what_next))
+                play_audio(speed_=None)
+                return True
             elif next_ == 'toggle_fast_mode':
                 raise exceptions.ToggleFastModeException
             elif next_ == 'go_back':
                 prev_fragments[-1].pop('disabled', None)
                 prev_fragments[-1].pop('approved', None)
+                edit_log.append('reset', index=i - 1)
                 raise exceptions.GoBackException
             elif next_ == 'edit':
                 new_transcript = ask_right_transcript([t['text'] for t in prev_fragments + [fragment] + next_fragments])
@@ -250,62 +223,54 @@ def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, sta
                 silence_before, _, _ = utils.transition_silences(prev_fragment, fragment, silences)
                 fragment['begin'] = round(max(silence_before[1] - 0.35, silence_before[1]), 3)
                 prev_fragment['end'] = round(min(silence_before[0] + 0.35, silence_before[1]), 3)
-                cut_fragment_audio(fragment, input_file=path_to_wav)
-                cut_fragment_audio(fragment, input_file=path_to_wav)
-                todo.add(pool.submit(play_audio))
-                todo.add(pool.submit(ask_what_next))
+                journal_moves(i - 1, i)
+                play_audio()
+                return True
             elif next_ == 'wrong_start__cut_on_next_silence':
                 prev_fragment = prev_fragments[-1]
                 _, _, silence_after = utils.transition_silences(prev_fragment, fragment, silences)
                 prev_fragment['end'] = round(min(silence_after[0] + 0.35, silence_after[1]), 3)
                 fragment['begin'] = round(max(silence_after[1] - 0.35, silence_after[0]), 3)
-                cut_fragment_audio(prev_fragment, input_file=path_to_wav)
-                cut_fragment_audio(fragment, input_file=path_to_wav)
-                todo.add(pool.submit(play_audio))
-                todo.add(pool.submit(ask_what_next))
+                journal_moves(i - 1, i)
+                play_audio()
+                return True
             elif next_ == 'wrong_end__cut_on_previous_silence':
                 next_fragment = next_fragments[0]
                 silence_before, _, _ = utils.transition_silences(fragment, next_fragment, silences)
                 fragment['end'] = round(min(silence_before[0] + 0.35, silence_before[1]), 3)
                 next_fragment['begin'] = round(max(silence_before[1] - 0.35, silence_before[1]), 3)
-                cut_fragment_audio(fragment, input_file=path_to_wav)
-                cut_fragment_audio(next_fragment, input_file=path_to_wav)
-                todo.add(pool.submit(play_audio))
-                todo.add(pool.submit(ask_what_next))
+                journal_moves(i, i + 1)
+                play_audio()
+                return True
             elif next_ == 'wrong_end__cut_on_next_silence':
                 next_fragment = next_fragments[0]
                 _, _, silence_after = utils.transition_silences(fragment, next_fragment, silences)
                 fragment['end'] = round(min(silence_after[0] + 0.35, silence_after[1]), 3)
                 next_fragment['begin'] = round(max(silence_after[1] - 0.35, silence_after[0]), 3)
-                cut_fragment_audio(fragment, input_file=path_to_wav)
-                cut_fragment_audio(next_fragment, input_file=path_to_wav)
-                todo.add(pool.submit(play_audio))
-                todo.add(pool.submit(ask_what_next))
+                journal_moves(i, i + 1)
+                play_audio()
+                return True
             elif next_ == 'approve':
                 fragment['approved'] = True
+                edit_log.append('approve', index=i)
             elif next_ == 'pass':
                 fragment.pop('approved', None)
             elif next_ == 'disable':
                 fragment['disabled'] = True
                 fragment.pop('approved', None)
-            elif next_ == 'enabled':
+                edit_log.append('disable', index=i)
+            elif next_ == 'enable':
                 fragment['approved'] = True
                 fragment.pop('disabled', None)
+                edit_log.append('enable', index=i)
             elif next_ == 'quit':
                 raise exceptions.QuitException
             else:
                 raise NotImplementedError
+            return False
 
-        todo.add(pool.submit(ask_what_next))
-
-        while todo:
-            for future in as_completed(t for t in todo):
-                todo.remove(future)
-                future.result()
-
-        pool.shutdown(wait=True)
-
-    cut_fragments_audio(alignment, input_file=path_to_wav)
+        while ask_what_next():
+            pass
 
     # iterate over successive fragments
     start = start - 1
@@ -324,6 +289,7 @@ def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, sta
                 approved=True,
                 approved_auto=True,
             )
+            edit_log.append('approve', index=i, auto=True)
             click.echo(f'approve fragment#{i} {fragment["text"]}')
             i += 1
             continue
@@ -337,14 +303,14 @@ def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, sta
             i -= 1
             continue
         except exceptions.QuitException:
-            try:
-                audio_player.kill()
-            except:
-                pass
+            audio_player.close()
+            edit_log.checkpoint(alignment)
+            edit_log.close()
             exit(1)
         except exceptions.SplitException as e:
             fragment.pop('approved', None)
             fragment.pop('disabled', None)
+            edit_log.append('reset', index=i)
             audio_start: float = alignment[e.start]['begin']
             audio_end: float = alignment[e.end]['end']
 
@@ -382,75 +348,134 @@ def check_alignment(source_name, restart, speed, audio_rate, no_cache, fast, sta
                     sub_alignment +
                     alignment[e.end+1:]
             )
-            cut_fragments_audio(alignment, input_file=path_to_wav)
+            edit_log.append('splice', start=e.start, end=e.end, fragments=sub_alignment)
             i -= e.start
 
         # save progress
-        with open(path_to_alignment, 'w') as dest:
-            to_save = deepcopy(alignment)
-            for f in to_save:
-                f.pop('warn', None)
-            json.dump(
-                obj=to_save,
-                fp=dest,
-                sort_keys=True,
-                indent=2,
-            )
-        with open(path_to_transcript, 'w') as f:
-            f.writelines('\n'.join(f['text'] for f in alignment) + '\n')
+        edit_log.maybe_checkpoint(alignment)
 
         i += 1
 
+    audio_player.close()
+    edit_log.checkpoint(alignment)
+    edit_log.close()
+
 
+@cli.command()
+@click.argument('source_names', nargs=-1)
+def compact(source_names):
+    for source_name in source_names or training_speech.sources().keys():
+        path_to_alignment = os.path.join(CURRENT_DIR, f'data/alignments/{source_name}.json')
+        path_to_transcript = os.path.join(CURRENT_DIR, f'data/transcripts/{source_name}.txt')
+        count = journal.recover(path_to_alignment, path_to_transcript)
+        if count:
+            click.echo(f'{source_name}: {count} edits applied')
+
+
+@cli.command()
+@click.argument('source_names', nargs=-1)
+@click.option('-a', '--all', 'all_sources', is_flag=True, default=False, help='prepare every source with mp3 available')
+@click.option('-ar', '--audio-rate', default=16000)
+@click.option('-j', '--jobs', type=int, default=os.cpu_count(), help='max number of sources prepared in parallel')
+@click.option('--until', type=click.Choice(list(pipeline.STAGES)), default='alignment')
+@click.option('--silence-backend', type=click.Choice(list(silence.BACKENDS)), default=silence.DEFAULT_BACKEND)
+def prepare(source_names, all_sources, audio_rate, jobs, until, silence_backend):
+    if all_sources:
+        source_names = [
+            name
+            for name, metadata in training_speech.sources().items()
+            if os.path.isfile(os.path.join(CURRENT_DIR, 'data/mp3', metadata['audio']))
+        ]
+    with click.progressbar(length=len(source_names), show_eta=True, label=f'prepare sources until {until}') as bar:
+        for source_name, error in pipeline.prepare_many(source_names, jobs=jobs, until=until, audio_rate=audio_rate,
+                                                        silence_backend=silence_backend):
+            if error:
+                print(f'cannot prepare source {source_name}. {error}')
+            bar.update(1)
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('-b', '--backend', type=click.Choice(list(silence.BACKENDS)), default=silence.DEFAULT_BACKEND)
+@click.option('-j', '--jobs', type=int, default=os.cpu_count(), help='max number of files processed in parallel')
+@click.option('-f', '--force', is_flag=True, default=False, help='ignore cached silences')
+def detect_silences(paths, backend, jobs, force):
+    rows = []
+    for path, silences, error in silence.list_silences_many(paths, backend=backend, jobs=jobs, force=force):
+        if error:
+            print(f'cannot detect silences of {path}. {error}')
+            continue
+        rows.append([path, len(silences), timedelta(seconds=round(sum(e - s for s, e in silences)))])
+    print(tabulate(sorted(rows), headers=['Audio', 'Silences', 'Total duration']))
+
+
+DEFAULT_REMOTE = 's3://audiocorp/'
 MAPPINGS = [
-    ('s3://audiocorp/epubs/', os.path.join(CURRENT_DIR, 'data/epubs/'), 'ebook'),  # epubs
-    ('s3://audiocorp/mp3/', os.path.join(CURRENT_DIR, 'data/mp3/'), 'audio'),  # mp3
-    ('s3://audiocorp/releases/', os.path.join(CURRENT_DIR, 'data/releases/'), 'releases'),
+    ('epubs/', os.path.join(CURRENT_DIR, 'data/epubs/'), 'ebook'),  # epubs
+    ('mp3/', os.path.join(CURRENT_DIR, 'data/mp3/'), 'audio'),  # mp3
+    ('releases/', os.path.join(CURRENT_DIR, 'data/releases/'), 'releases'),
 ]
 
 
+def _sync_storages(src: storage.Storage, dst: storage.Storage, jobs: int, dry_run: bool, **kwargs):
+    click.echo(f'sync {src.url} => {dst.url}')
+    result = storage.sync(
+        src, dst, jobs=jobs, dry_run=dry_run,
+        on_transfer=lambda info: click.echo(f'  {"(dry run) " if dry_run else ""}{info.key} ({info.size / 2 ** 20:.1f}MB)'),
+        **kwargs
+    )
+    click.echo(f'  {len(result.transferred)} {"to transfer" if dry_run else "transferred"} ({result.size / 2 ** 20:.1f}MB), '
+               f'{result.skipped} up to date')
+
+
 @cli.command()
 @click.option('-s', '--source_name', default=None)
-def download(source_name):
-    for s3, local, key in MAPPINGS:
+@click.option('--remote', default=DEFAULT_REMOTE, help='s3://bucket/prefix/ or a local mirror directory')
+@click.option('-j', '--jobs', type=int, default=storage.DEFAULT_JOBS, help='number of parallel transfers')
+@click.option('--dry-run', is_flag=True, default=False)
+def download(source_name, remote, jobs, dry_run):
+    for prefix, local, key in MAPPINGS:
         if key in {'releases'}:
             continue
-        local = os.path.abspath(local)
-        options = ''
+        include = None
         if source_name:
             source = training_speech.get_source(source_name, validate=False)
-            options += f' --exclude * --include {source[key]}'
-
-        sync_cmd = f'aws s3 sync {s3} {local}{options}'
-        print(sync_cmd)
-        subprocess.call(sync_cmd.strip().split(' '))
+            include = [source[key]]
+        _sync_storages(
+            storage.open_storage(remote.rstrip('/') + '/' + prefix),
+            storage.open_storage(os.path.abspath(local)),
+            jobs, dry_run, include=include,
+        )
 
 
 @cli.command()
 @click.option('-s', '--source_name', default=None)
 @click.option('-r', '--releases', is_flag=True, default=False, help='releases only')
-def upload(source_name, releases):
-    for s3, local, key in MAPPINGS:
-        local = os.path.abspath(local)
-        options = ' --exclude .gitkeep'
+@click.option('--remote', default=DEFAULT_REMOTE, help='s3://bucket/prefix/ or a local mirror directory')
+@click.option('-j', '--jobs', type=int, default=storage.DEFAULT_JOBS, help='number of parallel transfers')
+@click.option('--dry-run', is_flag=True, default=False)
+def upload(source_name, releases, remote, jobs, dry_run):
+    for prefix, local, key in MAPPINGS:
         if (source_name and key in {'releases'}) or (releases and key != 'releases'):
             continue
-        if key == 'releases':
-            options += ' --acl public-read'
-        else:
-            options += ' --exclude *.zip'
+        exclude = ['.gitkeep']
+        if key != 'releases':
+            exclude.append('*.zip')
+        include = None
         if source_name:
             source = training_speech.get_source(source_name)
-            options += f' --exclude * --include {source[key]}'
-
-        sync_cmd = f'aws s3 sync {local} {s3}{options}'
-        print(sync_cmd)
-        subprocess.call(sync_cmd.strip().split(' '))
+            include = [source[key]]
+        _sync_storages(
+            storage.open_storage(os.path.abspath(local)),
+            storage.open_storage(remote.rstrip('/') + '/' + prefix),
+            jobs, dry_run, include=include, exclude=exclude, public=key == 'releases',
+        )
 
 
 @cli.command()
 @click.option('-f', '--full', is_flag=True, default=False, help='display additionnal info')
 def stats(full):
+    corpus = catalog.Catalog()
     sources = training_speech.sources()
     sources_data = []
     total_dur = timedelta(seconds=0)
@@ -460,7 +485,7 @@ def stats(full):
     per_language_dur = defaultdict(timedelta)
     per_language_available = defaultdict(timedelta)
     for name, metadata in sources.items():
-        info = training_speech.source_info(name)
+        info = corpus.source_info(name)
         path_to_mp3 = os.path.join(CURRENT_DIR, 'data/mp3', metadata['audio'])
         if full and os.path.isfile(path_to_mp3):
             mp3_duration = timedelta(seconds=ffmpeg.audio_duration(path_to_mp3))
@@ -483,6 +508,8 @@ def stats(full):
             per_language_available[metadata['language']] += mp3_duration
             total_available += mp3_duration
 
+    corpus.close()
+
     sources_data.append([])
     sources_data.append([
         'TOTAL',
@@ -512,103 +539,224 @@ def stats(full):
 
 
 @cli.command()
-@click.option('-r', '--audio-rate', default=16000)
+@click.argument('sql')
+@click.option('--sync/--no-sync', default=True, help='reload modified alignments first')
+def query(sql, sync):
+    """
+    Run SQL against the catalog of fragments, ie.
+
+    \b
+    $ python manage.py query "SELECT source, COUNT(*) FROM fragments WHERE warn GROUP BY source"
+    $ python manage.py query "SELECT speaker, SUM(duration) / 3600 AS hours FROM fragments WHERE approved GROUP BY speaker"
+
+    \b
+    tables:
+      sources(name, mtime_ns, size, speaker, language)
+      fragments(source, idx, begin, end, duration, approved, disabled, warn, text, speaker, language, extra)
+    """
+    with catalog.Catalog(sync=sync) as corpus:
+        try:
+            rows = corpus.query(sql)
+        except sqlite3.Error as e:
+            raise click.UsageError(str(e))
+    if rows:
+        print(tabulate([tuple(row) for row in rows], headers=rows[0].keys(), tablefmt='pipe'))
+    print(f'{len(rows)} row(s)')
+
+
+@cli.command(name='search')
+@click.argument('query')
+@click.option('-k', '--kind', type=click.Choice(search.KINDS), default=None, help='only fragments or transcript lines')
+@click.option('-s', '--source', 'source_name', default=None)
+@click.option('-n', '--limit', type=int, default=None)
+def search_(query, kind, source_name, limit):
+    """
+    Find normalized phrase QUERY (ending with * to match a prefix) in transcripts and alignment fragments.
+    """
+    with search.SearchIndex() as index:
+        hits = index.search(query, kind=kind, source=source_name, limit=limit)
+    print(tabulate(
+        [
+            [hit.source, hit.kind, hit.idx + 1,
+             utils.format_timedelta(timedelta(seconds=hit.begin)) if hit.begin is not None else '',
+             utils.format_timedelta(timedelta(seconds=hit.end)) if hit.end is not None else '',
+             hit.text]
+            for hit in hits
+        ],
+        headers=['Source', 'Kind', '#', 'Begin', 'End', 'Text'],
+        tablefmt='pipe',
+    ))
+    print(f'{len(hits)} hit(s)')
+
+
+@cli.command()
+@click.option('-r', '--audio-rate', 'audio_rates', type=int, multiple=True, default=[16000],
+              help='can be repeated to build a release per rate from a single decode of each source')
 @click.option('-l', '--language', type=click.Choice(['fr_FR']), default=None)
-def release(audio_rate, language):
+@click.option('-c', '--codec', type=click.Choice(archive.CODECS), default='deflate', help='audio fragments encoding')
+@click.option('-j', '--jobs', type=int, default=os.cpu_count(), help='number of encoding workers')
+@click.option('-f', '--format', 'format_', type=click.Choice(['zip', 'shards']), default='zip',
+              help='single zip archive or a directory of size-bounded shards with an offset index')
+@click.option('--shard-size', type=int, default=1024, help='shard size in MB')
+@click.option('--previous', default=None,
+              help='sharded release to reuse unchanged fragments from (default: latest one of the same language)')
+@click.option('--full', is_flag=True, default=False, help='do not reuse fragments from the previous release')
+@click.option('--delta', is_flag=True, default=False,
+              help='also write new or modified fragments (and the list of removed ones) to a <release>_delta.zip archive')
+@click.option('--features', 'with_features', is_flag=True, default=False,
+              help='precompute log-mel and MFCC features next to the shards')
+@click.option('--fragment-store/--no-fragment-store', default=False,
+              help='keep cut fragments in packed files so that later releases do not need decoded sources '
+                   '(a second copy of the corpus, see compact-fragments)')
+def release(audio_rates, language, codec, jobs, format_, shard_size, previous, full, delta, with_features, fragment_store):
+    if with_features and format_ != 'shards':
+        raise click.UsageError('--features requires --format shards')
+    store = fragments.FragmentStore() if fragment_store else None
+    corpus = catalog.Catalog()
+
     per_language_sources = defaultdict(list)
     per_language_speakers = defaultdict(set)
     for name, metadata in training_speech.sources().items():
-        info = training_speech.source_info(name)
+        info = corpus.source_info(name)
         if info['status'] in {'DONE', 'WIP'}:
             per_language_sources[metadata['language']].append((name, metadata, info))
             per_language_speakers[metadata['language']].add(metadata['speaker'])
 
     today_str = datetime.now().isoformat()[:10]
     releases_data = []
+    path_to_releases = os.path.join(CURRENT_DIR, 'data/releases')
 
     for source_language, sources in per_language_sources.items():
         if language and source_language != language:
             continue
 
-        release_name = f'{today_str}_{source_language}'
-        path_to_release = os.path.join(CURRENT_DIR, 'data/releases', f'{release_name}.zip')
-        print(f'start building {release_name}')
-        # generate fragments
-        p_label = f'convert mp3 files to mono 16bits {audio_rate}Hz wav'
-        with click.progressbar(length=len(sources), show_eta=True, label=p_label) as bar:
-            with ThreadPoolExecutor() as executor:
-                def _process_source(source_data: Tuple[str, dict, dict]):
-                    source_name, metadata, _ = source_data
-                    try:
-                        path_to_alignment = os.path.join(CURRENT_DIR, f'data/alignments/{source_name}.json')
-                        path_to_mp3 = os.path.join(CURRENT_DIR, 'data/mp3', metadata['audio'])
-                        # generate wav if do not exists yet
-                        with open(path_to_mp3, 'rb') as f:
-                            file_hash = utils.hash_file(f)
-                        path_to_wav = os.path.join(utils.CACHE_DIR, f'{file_hash}.wav')
-                        if not os.path.exists(path_to_wav):
-                            ffmpeg.convert(from_=path_to_mp3, to=path_to_wav, rate=audio_rate, channels=1)
-
-                        with open(path_to_alignment) as file_:
-                            source_fragments = [
-                                dict(name=f'{source_name}_{i + 1:04d}', source_file=path_to_wav, **f)
-                                for i, f in enumerate(json.load(file_))
-                                if f.get('approved')
-                            ]
-                        bar.update(1)
-                        return source_fragments
-                    except Exception as e:
-                        print(f'cannot process source {source_name}. {e}')
-                        raise e
-
-                fragments = []
-                for source_fragments in executor.map(_process_source, sources):
-                    # skip empty speeches and longer than 15s
-                    fragments += [f for f in source_fragments if 0.1 <= f['end'] - f['begin'] <= 15]
-
-        # generate fragments
-        p_label = f'cut audio fragments'
-        with click.progressbar(length=len(fragments), show_eta=True, label=p_label) as bar:
-            with ThreadPoolExecutor() as executor:
-                def _cut(f: dict):
+        for audio_rate in audio_rates:
+            # NB: 16kHz releases keep their historical name
+            rate_suffix = '' if audio_rate == 16000 else f'_{audio_rate // 1000}k'
+            release_name = f'{today_str}_{source_language}{rate_suffix}'
+            release_file = f'{release_name}.zip' if format_ == 'zip' else release_name
+            path_to_release = os.path.join(path_to_releases, release_file)
+
+            path_to_previous = None
+            if format_ == 'shards' and not full and os.path.isdir(path_to_releases):
+                if previous:
+                    path_to_previous = os.path.join(path_to_releases, previous)
+                else:
+                    candidates = sorted(
+                        name for name in os.listdir(path_to_releases)
+                        if name.endswith(f'_{source_language}{rate_suffix}') and os.path.isfile(os.path.join(path_to_releases, name, 'manifest.json'))
+                    )
+                    path_to_previous = os.path.join(path_to_releases, candidates[-1]) if candidates else None
+            print(f'start building {release_name}' + (f' from {os.path.basename(path_to_previous)}' if path_to_previous else ''))
+
+            # NB: unchanged fragments are identified from the mp3 digest => decode lazily when reusing a previous release
+            until = 'hash' if path_to_previous else 'decode'
+            p_label = f'prepare mp3 files' if path_to_previous else f'convert mp3 files to mono 16bits {audio_rate}Hz wav'
+            with click.progressbar(length=len(sources), show_eta=True, label=p_label) as bar:
+                with ThreadPoolExecutor() as executor:
+                    def _process_source(source_data: Tuple[str, dict, dict]):
+                        source_name, metadata, _ = source_data
+                        try:
+                            prepared = pipeline.Pipeline(source_name, audio_rate=audio_rate, extra_rates=audio_rates)
+                            prepared.run(until=until)
+                            bar.update(1)
+                            return prepared
+                        except Exception as e:
+                            print(f'cannot process source {source_name}. {e}')
+                            raise e
+
+                    with memory.stage('release.prepare'):
+                        prepared_sources = list(executor.map(_process_source, sources))
+
+            def _iter_fragments():
+                for prepared in prepared_sources:
+                    pcm = None
                     try:
-                        p = cut_fragment_audio(f, f['source_file'], salt=f['name'])
-                        bar.update(1)
-                        return p
-                    except Exception as e:
-                        print(f'cannot extract fragment {fragment["name"]}. {e}')
-
-                audio_fragments_pathes = executor.map(_cut, fragments)
-
-        p_label = f'generate {release_name}.zip file'
-        with click.progressbar(length=len(fragments) + 1, show_eta=True, label=p_label) as bar:
-            with zipfile.ZipFile(path_to_release, 'w') as zip_file:
-                # create CSV
-                string_buffer = io.StringIO()
-                writer = csv.DictWriter(string_buffer, delimiter=',', fieldnames=['path', 'duration', 'text'])
-                writer.writeheader()
-
-                for fragment, tmp_audio in zip(fragments, audio_fragments_pathes):
-                    archive_audio_path = f'{fragment["name"]}.wav'
-                    zip_file.write(tmp_audio, arcname=archive_audio_path, compress_type=zipfile.ZIP_DEFLATED)
-                    writer.writerow(dict(
-                        path=archive_audio_path,
-                        duration=round(fragment['end'] - fragment['begin'], 3),
-                        text=fragment['text']
-                    ))
-                    bar.update(1)
-                    os.unlink(tmp_audio)
-
-                zip_file.writestr('data.csv', string_buffer.getvalue())
-            bar.update(1)
-
-        releases_data.append([
-            f'[{release_name}](https://s3.eu-west-3.amazonaws.com/audiocorp/releases/{release_name}.zip)',
-            len(fragments),
-            len(per_language_speakers[source_language]),
-            utils.format_timedelta(timedelta(seconds=round(sum(round(f['end'] - f['begin'], 3) for f in fragments)))),
-            source_language,
-        ])
+                        for row in corpus.fragments(source=prepared.source_name, approved=True):
+                            i, f = row['idx'], catalog.row_fragment(row)
+                            bar.update(1)
+                            # skip empty speeches and longer than 15s
+                            if not 0.1 <= f['end'] - f['begin'] <= 15:
+                                continue
+
+                            def _open_pcm():
+                                nonlocal pcm
+                                if pcm is None:
+                                    pcm = wav.PCM(prepared.run(until='decode').path_to_wav)
+                                return pcm
+
+                            def _load(fragment=f):
+                                if store is None:
+                                    return archive.fragment_wav(_open_pcm(), fragment)
+                                return fragments.cut_fragment_audio(store, prepared.file_hash, fragment, audio_rate, _open_pcm)
+
+                            key = shards.content_key(prepared.file_hash, f, audio_rate, codec)
+                            yield dict(name=f'{prepared.source_name}_{i + 1:04d}', **f), key, _load
+                    finally:
+                        if pcm is not None:
+                            pcm.close()
+
+            fragments_count = 0
+            fragments_duration = 0.
+            bucket_index = buckets.BucketIndexWriter(rate=audio_rate)
+            p_label = f'generate {release_file}'
+            approved_count = sum(info['approved_count'] for _, _, info in sources)
+            with click.progressbar(length=approved_count, show_eta=True, label=p_label) as bar:
+                if format_ == 'zip':
+                    packer = archive.ZipPacker(path_to_release, codec=codec, workers=jobs)
+                else:
+                    packer = shards.ShardPacker(
+                        path_to_release,
+                        codec=codec,
+                        workers=jobs,
+                        shard_size=shard_size * 2 ** 20,
+                        previous=path_to_previous,
+                        delta=os.path.join(path_to_releases, f'{release_name}_delta.zip') if delta else None,
+                        features_params={} if with_features else None,
+                    )
+                with packer, memory.stage('release.pack'):
+                    # NB: CSV is spooled to disk once large enough and appended after audio fragments
+                    with tempfile.SpooledTemporaryFile(max_size=2 ** 20, mode='w+', newline='') as csv_file:
+                        writer = csv.DictWriter(csv_file, delimiter=',', fieldnames=['path', 'duration', 'text'])
+                        writer.writeheader()
+
+                        for fragment, key, load in _iter_fragments():
+                            duration = round(fragment['end'] - fragment['begin'], 3)
+                            if format_ == 'zip':
+                                path = packer.add(fragment['name'], load())
+                            else:
+                                path = packer.reuse(fragment['name'], key) or \
+                                    packer.add(fragment['name'], load(), text=fragment['text'], key=key)
+                            writer.writerow(dict(
+                                path=path,
+                                duration=duration,
+                                text=fragment['text']
+                            ))
+                            bucket_index.add(
+                                int(round(fragment['end'] * audio_rate)) - int(round(fragment['begin'] * audio_rate)),
+                                fragment['text'],
+                            )
+                            fragments_count += 1
+                            fragments_duration += duration
+
+                        csv_file.seek(0)
+                        packer.writefile('data.csv', csv_file)
+                    packer.writefile('buckets.idx', io.BytesIO(bucket_index.to_bytes()))
+
+            if format_ == 'shards' and path_to_previous:
+                print(f'{packer.reused_count}/{fragments_count} fragments reused from {os.path.basename(path_to_previous)}')
+
+            releases_data.append([
+                f'[{release_name}](https://s3.eu-west-3.amazonaws.com/audiocorp/releases/{release_file})',
+                fragments_count,
+                len(per_language_speakers[source_language]),
+                utils.format_timedelta(timedelta(seconds=round(fragments_duration))),
+                source_language,
+            ])
+
+    if store is not None:
+        store.close()
+    corpus.close()
 
     print('\n' + tabulate(
         releases_data,
@@ -617,51 +765,52 @@ def release(audio_rate, language):
     ))
 
 
+@cli.command()
+@click.option('-r', '--audio-rate', 'audio_rates', type=int, multiple=True, default=[16000],
+              help='rates of the fragments to keep')
+def compact_fragments(audio_rates):
+    live_keys = set()
+    for name, metadata in training_speech.sources().items():
+        prepared = pipeline.Pipeline(name)
+        if not os.path.isfile(prepared.path_to_alignment) or not os.path.isfile(prepared.path_to_mp3):
+            continue
+        prepared.run(until='hash')
+        with open(prepared.path_to_alignment) as f:
+            for fragment in json.load(f):
+                if fragment.get('approved'):
+                    live_keys |= {
+                        fragments.fragment_key(prepared.file_hash, fragment['begin'], fragment['end'], rate)
+                        for rate in audio_rates
+                    }
+
+    with fragments.FragmentStore() as store:
+        before = store.stats()
+        reclaimed = store.compact(keep=live_keys.__contains__)
+        after = store.stats()
+    print(f'{before["fragments"]} => {after["fragments"]} fragments, {reclaimed / 2 ** 20:.1f}MB reclaimed')
+
+
+@cli.command()
+@click.argument('release_name')
+@click.option('--dtype', type=click.Choice(['int16', 'float32']), default='int16')
+@click.option('-w', '--workers', type=int, default=1, help='number of reader processes')
+@click.option('-n', '--limit', type=int, default=None, help='max number of samples read per worker')
+def benchmark_release(release_name, dtype, workers, limit):
+    path_to_release = os.path.join(CURRENT_DIR, 'data/releases', release_name)
+    samples_per_sec = dataset.benchmark_release(path_to_release, dtype=dtype, num_workers=workers, limit=limit)
+    print(f'{release_name}: {samples_per_sec:.1f} samples/sec ({workers} worker(s), {dtype})')
+
+
 @cli.command()
 @click.argument('source_name')
 @click.argument('from_id', type=int)
 @click.argument('to_id', type=int)
 @click.option('-ar', '--audio-rate', default=16000)
 def make_test(source_name, from_id, to_id, audio_rate):
-    source = training_speech.get_source(source_name)
-    path_to_alignment = os.path.join(CURRENT_DIR, f'data/alignments/{source_name}.json')
-    path_to_transcript = os.path.join(CURRENT_DIR, f'data/transcripts/{source_name}.txt')
-    path_to_mp3 = os.path.join(CURRENT_DIR, 'data/mp3', source['audio'])
-
-    # generate wav if do not exists yet
-    with open(path_to_mp3, 'rb') as f:
-        file_hash = utils.hash_file(f)
-    path_to_wav = os.path.join(utils.CACHE_DIR, f'{file_hash}.wav')
-    if not os.path.exists(path_to_wav):
-        ffmpeg.convert(
-            from_=path_to_mp3,
-            to=os.path.join(utils.CACHE_DIR, f'{file_hash}.wav'),
-            rate=audio_rate,
-            channels=1
-        )
-
-    # retrieve transcript
-    with open(path_to_transcript) as f:
-        transcript = [l.strip() for l in f.readlines()]
-    transcript = [l for l in transcript if l]  # rm empty lines
-
-    if os.path.isfile(path_to_alignment):
-        with open(path_to_alignment) as f:
-            existing_alignment = json.load(f)
-    else:
-        existing_alignment = []
-
-    # detect silences
-    silences = vad.list_silences(path_to_wav=path_to_wav, frame_duration=20)
-
-    alignment = utils.build_alignment(
-        transcript=transcript,
-        path_to_audio=path_to_wav,
-        existing_alignment=existing_alignment,
-        silences=silences,
-        generate_labels=True,
-    )
-    remaining = alignment[from_id - 1:to_id]
+    training_speech.get_source(source_name)
+    prepared = pipeline.Pipeline(source_name, audio_rate=audio_rate).run()
+    path_to_wav = prepared.path_to_wav
+    remaining = prepared.alignment[from_id - 1:to_id]
 
     with tempfile.NamedTemporaryFile(suffix='.wav') as file_:
         ffmpeg.cut(path_to_wav, file_.name, from_=remaining[0]['begin'], to=remaining[-1]['end'])
@@ -674,7 +823,7 @@ def make_test(source_name, from_id, to_id, audio_rate):
         transcript=[f['text'] for f in remaining],
         path_to_audio=path_to_sub_audio,
         existing_alignment=[],
-        silences=vad.list_silences(path_to_wav=path_to_sub_audio, frame_duration=20),
+        silences=silence.list_silences(path_to_sub_audio),
         generate_labels=True,
     )
 
@@ -702,45 +851,12 @@ BUILD_ALIGNMENT_TEST_TEMPLATE = """
 
 @cli.command()
 @click.argument('source_name')
-def source_stats(source_name):
-    source = training_speech.get_source(source_name)
-    path_to_alignment = os.path.join(CURRENT_DIR, f'data/alignments/{source_name}.json')
-    path_to_transcript = os.path.join(CURRENT_DIR, f'data/transcripts/{source_name}.txt')
-    path_to_mp3 = os.path.join(CURRENT_DIR, 'data/mp3', source['audio'])
-
-    # generate wav if do not exists yet
-    with open(path_to_mp3, 'rb') as f:
-        file_hash = utils.hash_file(f)
-    path_to_wav = os.path.join(utils.CACHE_DIR, f'{file_hash}.wav')
-    if not os.path.exists(path_to_wav):
-        ffmpeg.convert(
-            from_=path_to_mp3,
-            to=os.path.join(utils.CACHE_DIR, f'{file_hash}.wav'),
-            rate=16000,
-            channels=1
-        )
-
-    # retrieve transcript
-    with open(path_to_transcript) as f:
-        transcript = [l.strip() for l in f.readlines()]
-    transcript = [l for l in transcript if l]  # rm empty lines
-
-    if os.path.isfile(path_to_alignment):
-        with open(path_to_alignment) as f:
-            existing_alignment = json.load(f)
-    else:
-        existing_alignment = []
-
-    # detect silences
-    silences = vad.list_silences(path_to_wav=path_to_wav, frame_duration=utils.DEFAULT_VAD_FRAME_DURATION)
-
-    alignment = utils.build_alignment(
-        transcript=transcript,
-        path_to_audio=path_to_wav,
-        existing_alignment=existing_alignment,
-        silences=silences,
-        generate_labels=True,
-    )
+@click.option('-ar', '--audio-rate', default=16000)
+def source_stats(source_name, audio_rate):
+    training_speech.get_source(source_name)
+    prepared = pipeline.Pipeline(source_name, audio_rate=audio_rate).run()
+    silences = prepared.silences
+    alignment = prepared.alignment
 
     transitions_durations = []
     fragments_durations = []
@@ -785,4 +901,8 @@ def source_stats(source_name):
 
 
 if __name__ == '__main__':
-    cli()
+    try:
+        cli()
+    except exceptions.MemoryLimitExceeded as e:
+        click.secho(str(e), fg='red', err=True)
+        exit(memory.EXIT_CODE)
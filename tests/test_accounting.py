@@ -0,0 +1,56 @@
+import pytest
+from training_speech import accounting, runner
+
+
+@pytest.fixture
+def tool_runner():
+    r = runner.Runner(max_jobs=2)
+    yield r
+    r.close()
+
+
+def test_record(tool_runner):
+    accounting.reset()
+    with accounting.recording() as recorder:
+        tool_runner.run(['cat'], input=b'foo')
+        tool_runner.run(['sh', '-c', 'exit 3'], check=False)
+
+    assert recorder.by_tool() == {'cat': 1, 'sh': 1}
+    cat, sh = recorder.records
+    assert cat.args == ['cat']
+    assert cat.caller.startswith('test_accounting.py:') and cat.caller.endswith(' test_record')
+    assert cat.returncode == 0
+    assert cat.bytes_in == 3 and cat.bytes_out == 3
+    assert cat.duration > 0
+    assert sh.returncode == 3
+
+    rows = {row[0]: row for row in accounting.histogram()}
+    assert rows['cat'][1] == 1
+    assert rows['cat'][5:7] == [3, 3]
+    assert 'test_record' in rows['sh'][7]
+
+
+def test_track():
+    with accounting.recording() as recorder:
+        with pytest.raises(ValueError):
+            with accounting.track(['aeneas', 'fra'], bytes_in=12):
+                raise ValueError()
+    record, = recorder.records
+    assert record.tool == 'aeneas'
+    assert record.returncode == 1
+    assert record.bytes_in == 12
+
+
+def test_spawn_budget(tool_runner):
+    with accounting.spawn_budget(2, tool='true') as recorder:
+        tool_runner.run(['true'])
+        tool_runner.run(['false'], check=False)
+        tool_runner.run(['true'])
+    assert recorder.count() == 3
+
+    with pytest.raises(AssertionError) as e:
+        with accounting.spawn_budget(1):
+            tool_runner.run(['true'])
+            tool_runner.run(['true'])
+    assert '2 processes spawned, budget is 1' in str(e.value)
+    assert 'test_spawn_budget' in str(e.value)
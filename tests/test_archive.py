@@ -0,0 +1,97 @@
+import io
+import os
+import struct
+import zipfile
+import zlib
+
+import pytest
+from training_speech import archive, wav
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+@pytest.mark.parametrize('codec, expected_compress_type', [
+    ('store', zipfile.ZIP_STORED),
+    ('deflate', zipfile.ZIP_DEFLATED),
+])
+def test_zip_packer(codec, expected_compress_type, tmpdir):
+    with open(os.path.join(CURRENT_DIR, './assets/test.wav'), 'rb') as f:
+        data = f.read()
+    path_to_zip = str(tmpdir.join('release.zip'))
+    with archive.ZipPacker(path_to_zip, codec=codec, workers=2) as packer:
+        arcnames = [packer.add(f'foo_{i:04d}', data[:len(data) - i]) for i in range(10)]
+        packer.writestr('data.csv', 'path,duration,text\n')
+
+    assert arcnames == [f'foo_{i:04d}.wav' for i in range(10)]
+    with zipfile.ZipFile(path_to_zip) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == arcnames + ['data.csv']
+        assert zip_file.getinfo('foo_0000.wav').compress_type == expected_compress_type
+        for i, arcname in enumerate(arcnames):
+            assert zip_file.read(arcname) == data[:len(data) - i]
+
+
+@pytest.mark.parametrize('codec', ['store', 'deflate'])
+def test_write_precompressed(codec, tmpdir):
+    path_to_zip = str(tmpdir.join('release.zip'))
+    with zipfile.ZipFile(path_to_zip, 'w') as zip_file:
+        archive.write_precompressed(zip_file, 'foo.wav', *archive.encode(b'foo' * 100, codec))
+        zip_file.writestr('bar.txt', 'bar')
+        archive.write_precompressed(zip_file, 'baz.wav', *archive.encode(b'', codec))
+        with zip_file.open('qux.txt', 'w'), pytest.raises(ValueError):
+            archive.write_precompressed(zip_file, 'qux.wav', *archive.encode(b'qux', codec))
+    with pytest.raises(ValueError):
+        archive.write_precompressed(zip_file, 'qux.wav', *archive.encode(b'qux', codec))
+
+    with zipfile.ZipFile(path_to_zip) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == ['foo.wav', 'bar.txt', 'baz.wav', 'qux.txt']
+        assert zip_file.read('foo.wav') == b'foo' * 100
+        assert zip_file.read('bar.txt') == b'bar'
+        assert zip_file.read('baz.wav') == b''
+        info = zip_file.getinfo('foo.wav')
+        assert (info.file_size, info.CRC) == (300, zlib.crc32(b'foo' * 100))
+
+
+def test_set_flac_total_samples():
+    streaminfo = struct.pack('>HHHBHBQ16s', 4096, 4096, 0, 0, 0, 0, (16000 << 44) | (15 << 36), bytes(16))
+    data = b'fLaC' + b'\x80\x00\x00\x22' + streaminfo + b'frames'
+    patched = archive.set_flac_total_samples(data, 77824)
+    value, = struct.unpack_from('>Q', patched, 18)
+    assert value & 0xFFFFFFFFF == 77824
+    assert value >> 44 == 16000
+    assert len(patched) == len(data) and patched.endswith(b'frames')
+
+
+def test_fragment_wav(tmpdir):
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        data = archive.fragment_wav(pcm, dict(begin=0.5, end=1.5))
+        assert wav.parse_header(data) == (pcm.rate, 1, 2, 44, pcm.rate * 2)
+        assert data[44:] == pcm.slice(0.5, 1.5)
+
+
+def test_zip_packer_abort(tmpdir):
+    path_to_zip = str(tmpdir.join('release.zip'))
+    with archive.ZipPacker(path_to_zip) as packer:
+        packer.writestr('data.csv', 'path,duration,text\n')
+
+    with pytest.raises(ValueError):
+        with archive.ZipPacker(path_to_zip, workers=2) as packer:
+            packer.add('foo_0000', b'foo')
+            raise ValueError('cannot cut fragment')
+
+    # existing release is left as is, partial one is dropped
+    assert os.listdir(str(tmpdir)) == ['release.zip']
+    with zipfile.ZipFile(path_to_zip) as zip_file:
+        assert zip_file.namelist() == ['data.csv']
+
+
+def test_zip_packer_writefile(tmpdir):
+    path_to_zip = str(tmpdir.join('release.zip'))
+    content = 'path,duration,text\n' + 'foo.wav,1.0,bar\n' * 1000
+    with archive.ZipPacker(path_to_zip) as packer:
+        packer.writefile('data.csv', io.StringIO(content), chunk_size=100)
+
+    with zipfile.ZipFile(path_to_zip) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.read('data.csv').decode() == content
@@ -0,0 +1,63 @@
+import io
+import os
+
+from training_speech import archive, buckets, dataset, shards, wav
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+def test_bucket_index():
+    writer = buckets.BucketIndexWriter(rate=16000, bucket_width=0.5)
+    durations = [1.2, 0.3, 1.4, 0.1, 3.]
+    for i, duration in enumerate(durations):
+        assert writer.add(int(duration * 16000), 'a' * (i + 1)) == i
+
+    index = buckets.BucketIndex(writer.to_bytes())
+    assert len(index) == 3
+    assert index.bucket_width == 0.5
+    assert index.bucket(0) == (0., 0, 2, int(0.4 * 16000), 6)
+    assert index.bucket(1) == (1., 2, 2, int(2.6 * 16000), 4)
+    assert index.bucket(2) == (3., 4, 1, 3 * 16000, 5)
+    assert index.fragments(0)['id'].tolist() == [3, 1]
+    assert index.fragments(1)['id'].tolist() == [0, 2]
+    assert index.fragments(2)['tokens'].tolist() == [5]
+
+
+def test_dataset_bucket_index(tmpdir, mocker):
+    path_to_release = str(tmpdir.join('release.zip'))
+    writer = buckets.BucketIndexWriter(rate=16000, bucket_width=1.)
+    rows = ['path,duration,text']
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm, archive.ZipPacker(path_to_release) as packer:
+        for i, duration in enumerate([1.5, 0.5, 1.2]):
+            path = packer.add(f'foo_{i}', archive.fragment_wav(pcm, dict(begin=0, end=duration)))
+            rows.append(f'{path},{duration},text {i}')
+            writer.add(int(duration * 16000), f'text {i}')
+        packer.writestr('data.csv', '\n'.join(rows) + '\n')
+        packer.writefile('buckets.idx', io.BytesIO(writer.to_bytes()))
+
+    with dataset.Dataset(path_to_release) as ds:
+        assert ds.bucket_index is not None
+        assert ds.buckets(bucket_width=1.) == [[1], [2, 0]]
+        # another bucket width => computed from durations
+        assert ds.buckets(bucket_width=2.) == [[0, 1, 2]]
+
+
+def test_dataset_bucket_index_workers(tmpdir):
+    path_to_release = str(tmpdir.join('release'))
+    writer = buckets.BucketIndexWriter(rate=16000)
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        fragments = [archive.fragment_wav(pcm, dict(begin=0, end=duration)) for duration in [1.5, 0.5, 1.2, 0.7]]
+    with shards.ShardPacker(path_to_release, workers=2, shard_size=len(fragments[0])) as packer:
+        for i, fragment in enumerate(fragments):
+            packer.add(f'foo_{i}', fragment, text=f'text {i}')
+            writer.add((len(fragment) - 44) // 2, f'text {i}')
+        packer.writefile('buckets.idx', io.BytesIO(writer.to_bytes()))
+
+    with dataset.Dataset(path_to_release) as ds:
+        assert ds.bucket_index is not None
+        assert ds.buckets() == [[1, 3], [2, 0]]
+    # NB: each worker gets 2 of the 4 shards => ids of the release-wide index would be out of range
+    for worker_id in range(2):
+        with dataset.Dataset(path_to_release, worker_id=worker_id, num_workers=2) as ds:
+            assert ds.bucket_index is None
+            assert sorted(i for bucket in ds.buckets() for i in bucket) == [0, 1]
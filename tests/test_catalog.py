@@ -0,0 +1,70 @@
+import json
+import os
+from datetime import timedelta
+
+import pytest
+from training_speech import catalog
+
+
+@pytest.fixture
+def corpus(tmpdir):
+    path_to_alignments = tmpdir.mkdir('alignments')
+    path_to_alignments.join('foo.json').write(json.dumps([
+        dict(begin=0, end=2.5, text='foo', approved=True),
+        dict(begin=2.5, end=6.5, text='bar', approved=True, warn=True),
+        dict(begin=6.5, end=7, text='baz', disabled=False, begin_forced=True),
+    ]))
+    sources = dict(
+        foo=dict(speaker='Alice', language='fr_FR'),
+        bar=dict(speaker='Bob', language='fr_FR'),
+    )
+    c = catalog.Catalog(str(tmpdir.join('catalog.sqlite')), path_to_alignments=str(path_to_alignments), sync=False)
+    assert c.sync(sources) == ['foo', 'bar']
+    yield c, sources, path_to_alignments
+    c.close()
+
+
+def test_fragments(corpus):
+    c, sources, path_to_alignments = corpus
+    with open(path_to_alignments.join('foo.json')) as f:
+        assert [catalog.row_fragment(row) for row in c.fragments(source='foo')] == json.load(f)
+
+    assert [row['text'] for row in c.fragments(approved=True, min_duration=2, max_duration=5)] == ['foo', 'bar']
+    assert [row['text'] for row in c.fragments(approved=False)] == ['baz']
+    assert c.fragments(speaker='Bob') == []
+    rows = c.query('SELECT speaker, SUM(duration) AS duration FROM fragments WHERE approved GROUP BY speaker')
+    assert [tuple(row) for row in rows] == [('Alice', 6.5)]
+    assert c.query('SELECT source FROM fragments WHERE warn')[0]['source'] == 'foo'
+
+
+def test_source_info(corpus):
+    c, sources, path_to_alignments = corpus
+    assert c.source_info('foo') == dict(
+        status='WIP',
+        progress=6.5 / 7,
+        approved_duration=timedelta(seconds=6.5),
+        approved_count=2,
+    )
+    assert c.source_info('bar')['status'] == 'PENDING'
+
+
+def test_sync(corpus):
+    c, sources, path_to_alignments = corpus
+    assert c.sync(sources) == []
+
+    path_to_alignments.join('bar.json').write(json.dumps([dict(begin=0, end=1, text='bar', approved=True)]))
+    assert c.sync(sources) == ['bar']
+    assert c.source_info('bar')['status'] == 'DONE'
+
+    # speaker changed => fragments are updated
+    sources['bar']['speaker'] = 'Carol'
+    assert c.sync(sources) == ['bar']
+    assert c.fragments(source='bar')[0]['speaker'] == 'Carol'
+
+    del sources['foo']
+    assert c.sync(sources) == []
+    assert c.fragments(source='foo') == []
+
+    os.unlink(str(path_to_alignments.join('bar.json')))
+    assert c.sync(sources) == ['bar']
+    assert c.fragments() == []
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+from training_speech import archive, dataset, shards, wav
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+@pytest.fixture(params=['zip', 'shards'])
+def release(request, tmpdir):
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        fragments = [archive.fragment_wav(pcm, dict(begin=0, end=0.5 + i / 10)) for i in range(10)]
+        expected = [np.frombuffer(f, dtype='<i2', offset=44) for f in fragments]
+
+    if request.param == 'zip':
+        path_to_release = str(tmpdir.join('release.zip'))
+        packer = archive.ZipPacker(path_to_release, codec='deflate', workers=2)
+    else:
+        path_to_release = str(tmpdir.join('release'))
+        packer = shards.ShardPacker(path_to_release, codec='store', workers=2, shard_size=len(fragments[0]) * 3)
+    with packer:
+        rows = ['path,duration,text']
+        for i, f in enumerate(fragments):
+            path = packer.add(f'foo_{i:04d}', f) if request.param == 'zip' else packer.add(f'foo_{i:04d}', f, text=f'text {i}')
+            rows.append(f'{path},{0.5 + i / 10},text {i}')
+        if request.param == 'zip':
+            packer.writestr('data.csv', '\n'.join(rows) + '\n')
+    return path_to_release, expected
+
+
+def test_dataset(release):
+    path_to_release, expected = release
+    with dataset.Dataset(path_to_release) as ds:
+        assert len(ds) == 10
+        samples, text = ds[3]
+        assert samples.dtype == np.int16
+        assert np.array_equal(samples, expected[3])
+        assert text == 'text 3'
+        np.testing.assert_allclose(ds.durations, [0.5 + i / 10 for i in range(10)], atol=1e-3)
+
+    with dataset.Dataset(path_to_release, dtype='float32') as ds:
+        samples, _ = ds[0]
+        assert samples.dtype == np.float32
+        np.testing.assert_allclose(samples, expected[0] / 32768)
+
+
+def test_dataset_workers(release):
+    path_to_release, _ = release
+    texts = []
+    for worker_id in range(2):
+        with dataset.Dataset(path_to_release, worker_id=worker_id, num_workers=2) as ds:
+            texts += [ds[i][1] for i in range(len(ds))]
+    assert sorted(texts) == sorted(f'text {i}' for i in range(10))
+
+
+def test_batch_indices(release):
+    path_to_release, _ = release
+    with dataset.Dataset(path_to_release) as ds:
+        assert ds.batch_indices(batch_size=3, bucket_width=0.5) == [[0, 1, 2], [3, 4], [5, 6, 7], [8, 9]]
+        assert ds.batch_indices(batch_size=10, max_duration=2) == [[0, 1, 2], [3, 4], [5], [6], [7], [8], [9]]
+        batches = ds.batch_indices(batch_size=3, shuffle=True, seed=1)
+        assert sorted(i for batch in batches for i in batch) == list(range(10))
+        batch = next(ds.batches(batch_size=3, bucket_width=0.5))
+        assert [text for _, text in batch] == ['text 0', 'text 1', 'text 2']
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+from training_speech import archive, features, shards, wav, dataset
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+def test_mel_filterbank():
+    filterbank = features.mel_filterbank(16000, 512, 40)
+    assert filterbank.shape == (40, 257)
+    assert filterbank.min() >= 0 and filterbank.max() <= 1
+    # every filter has a triangular response
+    assert all(f.max() > 0.5 for f in filterbank)
+
+
+def test_dct_matrix():
+    matrix = features.dct_matrix(40, 40)
+    np.testing.assert_allclose(matrix @ matrix.T, np.eye(40), atol=1e-5)
+
+
+def test_log_mel():
+    rate = 16000
+    t = np.arange(rate) / rate
+    samples = (0.5 * np.sin(2 * np.pi * 1000 * t)).astype(np.float32)
+    spectrogram = features.log_mel(samples, rate, dict(preemphasis=0))
+    assert spectrogram.shape == (98, 80)
+    # 1kHz => energy in the filter centered close to 1kHz
+    centers = features.mel_to_hz(np.linspace(features.hz_to_mel(0), features.hz_to_mel(rate / 2), 82))[1:-1]
+    assert abs(centers[spectrogram.mean(axis=0).argmax()] - 1000) < 100
+
+
+def test_shard_packer_features(tmpdir):
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        fragments = [archive.fragment_wav(pcm, dict(begin=i, end=i + 1 + i / 10)) for i in range(4)]
+
+    path_to_release = str(tmpdir.join('release'))
+    with shards.ShardPacker(path_to_release, codec='deflate', workers=2, shard_size=len(fragments[0]),
+                            features_params=dict(n_mels=40)) as packer:
+        for i, f in enumerate(fragments):
+            packer.add(f'foo_{i:04d}', f, text=f'text {i}', key=str(i))
+
+    assert shards.read_manifest(path_to_release)['features']['n_mels'] == 40
+    with dataset.Dataset(path_to_release) as ds:
+        for i, f in enumerate(fragments):
+            log_mel, mfcc = features.extract(f, dict(n_mels=40))
+            assert ds.features(i).shape == (1 + (16000 * (1 + i / 10) - 400) // 160, 40)
+            np.testing.assert_array_equal(ds.features(i), log_mel)
+            np.testing.assert_array_equal(ds.features(i, 'mfcc'), mfcc)
+
+    # features of reused fragments are copied
+    path_to_next = str(tmpdir.join('next'))
+    with shards.ShardPacker(path_to_next, codec='deflate', workers=2, previous=path_to_release,
+                            features_params=dict(n_mels=40)) as packer:
+        for i in range(4):
+            assert packer.reuse(f'foo_{i:04d}', str(i))
+    with dataset.Dataset(path_to_next) as ds:
+        np.testing.assert_array_equal(ds.features(3), features.extract(fragments[3], dict(n_mels=40))[0])
@@ -11,7 +11,7 @@ CURRENT_DIR = os.path.dirname(__file__)
     (dict(from_='foo.mp3', to='foo.wav', rate=16000, channels=1), 'ffmpeg -y -i foo.mp3 -ar 16000 -ac 1 -loglevel quiet foo.wav'),
 ])
 def test_convert(kwargs, expected_call, mocker):
-    call_mock = mocker.patch('subprocess.call', return_value=0)
+    call_mock = mocker.patch('training_speech.runner.run')
     ffmpeg.convert(**kwargs)
     assert call_mock.call_count == 1
     call_args, call_kwargs = call_mock.call_args
@@ -33,7 +33,7 @@ def test_convert(kwargs, expected_call, mocker):
     ),
 ])
 def test_cut(kwargs, expected_call, mocker):
-    call_mock = mocker.patch('subprocess.call', return_value=0)
+    call_mock = mocker.patch('training_speech.runner.run')
     ffmpeg.cut(**kwargs)
     assert call_mock.call_count == 1
     call_args, call_kwargs = call_mock.call_args
@@ -47,12 +47,49 @@ def test_cut(kwargs, expected_call, mocker):
     ('silence2.wav', -50, 0.05, [(0.462, 0.896), (0.974, 2.0)]),
     ('silence3.wav', -45, 0.07, [(0.0, 0.454), (1.21, 1.467)]),
 ])
-def test_list_silences(input_file, noise_level, min_duration, expected_silences):
+def test_detect_silences(input_file, noise_level, min_duration, expected_silences):
     path_to_wav = os.path.join(CURRENT_DIR, f'./assets/{input_file}')
-    silences = ffmpeg.list_silences(path_to_wav, noise_level=noise_level, min_duration=min_duration, force=True)
+    silences = ffmpeg.detect_silences(path_to_wav, noise_level=noise_level, min_duration=min_duration)
     assert expected_silences == silences
 
 
+def test_detect_silences_mp3(tmpdir, mocker):
+    mocker.patch('training_speech.utils.CACHE_DIR', str(tmpdir))
+    convert_mock = mocker.patch('training_speech.ffmpeg.convert')
+    run_mock = mocker.patch('training_speech.runner.run', return_value=mocker.Mock(stderr=b''))
+    tmpdir.join('abc.wav').write(b'', mode='wb')
+
+    assert ffmpeg.detect_silences('missing.mp3', audio_hash='abc') == []
+    assert convert_mock.call_count == 0
+    assert run_mock.call_args[0][0][2] == str(tmpdir.join('abc.wav'))
+
+
 def test_audio_duration():
     path_to_wav = os.path.join(CURRENT_DIR, './assets/test.wav')
     assert ffmpeg.audio_duration(path_to_wav) == 4.864
+
+
+def test_decode(tmpdir, mocker):
+    mocker.patch('training_speech.utils.CACHE_DIR', str(tmpdir))
+
+    def _run(args, **kwargs):
+        for arg in args:
+            if arg.endswith('.tmp.wav'):
+                open(arg, 'w').close()
+    run_mock = mocker.patch('training_speech.runner.run', side_effect=_run)
+
+    paths = ffmpeg.decode('foo.mp3', 'abc', rates=[8000, 16000])
+    assert paths == {
+        (8000, 1): str(tmpdir.join('abc_8000_1.wav')),
+        (16000, 1): str(tmpdir.join('abc_16000_1.wav')),
+    }
+    assert all(os.path.isfile(p) for p in paths.values())
+    assert ' '.join(run_mock.call_args[0][0]) == (
+        f'ffmpeg -y -i foo.mp3 -loglevel quiet '
+        f'-ar 8000 -ac 1 {tmpdir}/abc_8000_1.wav.tmp.wav -ar 16000 -ac 1 {tmpdir}/abc_16000_1.wav.tmp.wav'
+    )
+
+    # only missing outputs are decoded
+    ffmpeg.decode('foo.mp3', 'abc', rates=[16000, 48000])
+    assert run_mock.call_count == 2
+    assert ' '.join(run_mock.call_args[0][0]).count('-ar') == 1
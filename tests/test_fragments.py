@@ -0,0 +1,50 @@
+import os
+
+from training_speech import fragments, wav
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+def test_fragment_store(tmpdir):
+    path = str(tmpdir.join('fragments'))
+    keys = [fragments.fragment_key('abc', i, i + 1, 16000) for i in range(5)]
+    with fragments.FragmentStore(path, pack_size=25) as store:
+        for i, key in enumerate(keys):
+            store.put(key, bytes([i]) * 10, rate=16000)
+        # overwritten => previous data is dead
+        store.put(keys[0], b'x' * 10, rate=16000)
+        assert store.stats() == dict(fragments=5, packs=3, size=60, dead_size=10)
+
+    # index is reloaded, a partially written record is ignored
+    with open(os.path.join(path, 'index.bin'), 'ab') as f:
+        f.write(b'garbage')
+    with fragments.FragmentStore(path, pack_size=25) as store:
+        assert len(store) == 5
+        data, location = store.get(keys[3])
+        assert data == bytes([3]) * 10
+        assert location.rate == 16000
+        assert store.get(b'missing') is None
+
+        assert store.compact(keep=lambda key: key != keys[4]) == 20
+        assert store.stats() == dict(fragments=4, packs=2, size=40, dead_size=0)
+        assert store.get(keys[0])[0] == b'x' * 10
+        assert store.get(keys[4]) is None
+
+    with fragments.FragmentStore(path, pack_size=25) as store:
+        assert sorted(store.keys()) == sorted(keys[:4])
+        assert store.get(keys[2])[0] == bytes([2]) * 10
+
+
+def test_cut_fragment_audio(tmpdir):
+    opened = []
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm, \
+            fragments.FragmentStore(str(tmpdir)) as store:
+        def open_pcm():
+            opened.append(1)
+            return pcm
+
+        fragment = dict(begin=0.5, end=1.5)
+        data = fragments.cut_fragment_audio(store, 'abc', fragment, 16000, open_pcm)
+        assert data == wav.header(pcm.rate, 1, 2, pcm.rate * 2) + pcm.slice(0.5, 1.5)
+        assert fragments.cut_fragment_audio(store, 'abc', fragment, 16000, open_pcm) == data
+        assert len(opened) == 1
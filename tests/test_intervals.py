@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+from training_speech import intervals
+
+
+def test_intervals(tmpdir):
+    path = str(tmpdir.join('silences.intervals'))
+    intervals.write_intervals(path, [(0., 1.5), (2.25, 3.)])
+    assert intervals.is_intervals(path)
+    array = intervals.read_intervals(path)
+    assert array.shape == (2, 2)
+    assert isinstance(array, np.memmap)
+    assert intervals.load_intervals(path) == [(0., 1.5), (2.25, 3.)]
+
+    intervals.write_intervals(path, [])
+    assert intervals.load_intervals(path) == []
+
+
+def test_fragments(tmpdir):
+    path = str(tmpdir.join('alignment.fragments'))
+    fragments = [
+        dict(begin=0, end=6.32, text='Ce n’est pas moi du moins'),
+        dict(begin=6.32, end=9.32, text=''),
+        dict(begin=9.32, end=10., text='répondit Mercédès.'),
+    ]
+    intervals.write_fragments(path, fragments)
+    assert not intervals.is_intervals(path)
+    loaded = intervals.Fragments(path)
+    assert len(loaded) == 3
+    assert loaded.text(2) == 'répondit Mercédès.'
+    assert intervals.read_fragments(path) == fragments
+
+    intervals.write_fragments(path, [])
+    assert intervals.read_fragments(path) == []
+
+
+def test_json_conversion(tmpdir):
+    path_to_json = str(tmpdir.join('alignment.json'))
+    path = str(tmpdir.join('alignment.fragments'))
+    fragments = [dict(begin=0., end=1., text='foo'), dict(begin=1., end=2., text='bar')]
+    with open(path_to_json, 'w') as f:
+        json.dump(fragments, f)
+    intervals.from_json(path_to_json, path)
+    assert intervals.read_fragments(path) == fragments
+
+    intervals.to_json(path, str(tmpdir.join('back.json')))
+    with open(str(tmpdir.join('back.json'))) as f:
+        assert json.load(f) == fragments
+
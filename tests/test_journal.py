@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+from training_speech import journal
+
+
+@pytest.fixture
+def paths(tmpdir):
+    path_to_alignment = str(tmpdir.join('foo.json'))
+    path_to_transcript = str(tmpdir.join('foo.txt'))
+    return path_to_alignment, path_to_transcript
+
+
+ALIGNMENT = [
+    dict(begin=0., end=1., text='foo'),
+    dict(begin=1., end=2., text='bar', warn=True),
+    dict(begin=2., end=3., text='baz'),
+]
+
+
+@pytest.mark.parametrize('record, expected', [
+    (dict(op='approve', index=0), [dict(begin=0., end=1., text='foo', approved=True)]),
+    (dict(op='approve', index=0, auto=True), [dict(begin=0., end=1., text='foo', approved=True, approved_auto=True)]),
+    (dict(op='disable', index=0), [dict(begin=0., end=1., text='foo', disabled=True)]),
+    (dict(op='move', index=0, begin=0.1, end=0.9), [dict(begin=0.1, end=0.9, text='foo')]),
+    (dict(op='splice', start=0, end=0, fragments=[
+        dict(begin=0., end=0.5, text='f'),
+        dict(begin=0.5, end=1., text='oo'),
+    ]), [dict(begin=0., end=0.5, text='f'), dict(begin=0.5, end=1., text='oo')]),
+])
+def test_apply(record, expected):
+    alignment = journal.apply([dict(begin=0., end=1., text='foo')], record)
+    assert expected == alignment
+
+
+def test_recover(paths):
+    path_to_alignment, path_to_transcript = paths
+    with journal.Journal(path_to_alignment, path_to_transcript, fsync_every=2) as edit_log:
+        edit_log.checkpoint(ALIGNMENT)
+        edit_log.append('approve', index=0)
+        edit_log.append('move', index=1, begin=1.1, end=2.)
+        edit_log.append('splice', start=2, end=2, fragments=[
+            dict(begin=2., end=2.5, text='b'),
+            dict(begin=2.5, end=3., text='az'),
+        ])
+    # canonical alignment is left untouched until recovery
+    with open(path_to_alignment) as f:
+        assert json.load(f)[0] == dict(begin=0., end=1., text='foo')
+
+    assert journal.recover(path_to_alignment, path_to_transcript) == 3
+    assert not os.path.exists(journal.journal_path(path_to_alignment))
+    with open(path_to_alignment) as f:
+        assert json.load(f) == [
+            dict(begin=0., end=1., text='foo', approved=True),
+            dict(begin=1.1, end=2., text='bar'),
+            dict(begin=2., end=2.5, text='b'),
+            dict(begin=2.5, end=3., text='az'),
+        ]
+    with open(path_to_transcript) as f:
+        assert f.read() == 'foo\nbar\nb\naz\n'
+
+
+def test_recover_outdated(paths):
+    path_to_alignment, path_to_transcript = paths
+    with journal.Journal(path_to_alignment, path_to_transcript) as edit_log:
+        edit_log.checkpoint(ALIGNMENT)
+        edit_log.append('approve', index=0)
+    journal.save_alignment(ALIGNMENT[:1], path_to_alignment, path_to_transcript)
+
+    assert journal.recover(path_to_alignment, path_to_transcript) == 0
+    with open(path_to_alignment) as f:
+        assert json.load(f) == [dict(begin=0., end=1., text='foo')]
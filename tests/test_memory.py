@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+from training_speech import memory
+from training_speech.exceptions import MemoryLimitExceeded
+
+
+@pytest.fixture
+def tracking():
+    memory.reset()
+    memory.enable(trace=True)
+    yield
+    memory.disable()
+    memory.reset()
+
+
+def test_parse_size():
+    assert memory.parse_size('1024') == 1024
+    assert memory.parse_size('800M') == 800 * 2 ** 20
+    assert memory.parse_size('7.5G') == int(7.5 * 2 ** 30)
+    assert memory.parse_size('2kb') == 2048
+    with pytest.raises(ValueError):
+        memory.parse_size('lots')
+
+
+def test_rss():
+    before = memory.rss()
+    data = bytearray(64 * 2 ** 20)
+    data[::4096] = b'x' * len(data[::4096])  # touch pages
+    assert memory.rss() - before > 32 * 2 ** 20
+
+
+def test_disabled():
+    memory.reset()
+    with memory.stage('nothing'):
+        pass
+    assert memory.summary() == []
+
+
+@memory.tracked()
+def allocate(size):
+    return [bytes(1024) for _ in range(size // 1024)]
+
+
+def test_stages(tracking):
+    with memory.stage('outer'):
+        data = allocate(16 * 2 ** 20)
+        with memory.stage('inner'):
+            pass
+    rows = {row[0]: row for row in memory.summary()}
+    assert set(rows) == {'outer', 'inner', 'test_memory.allocate'}
+    assert rows['test_memory.allocate'][1] == 1
+    assert rows['test_memory.allocate'][4] >= 16
+    assert rows['outer'][4] >= 16
+    assert 'test_memory.py' in rows['outer'][5]
+    assert len(data) == 16 * 1024
+
+
+def test_max_memory():
+    memory.reset()
+    memory.enable(trace=False, max_memory=memory.rss() + 32 * 2 ** 20)
+    try:
+        with pytest.raises(MemoryLimitExceeded) as e:
+            with memory.stage('greedy'):
+                data = bytearray(64 * 2 ** 20)
+                data[::4096] = b'x' * len(data[::4096])
+                time.sleep(2)
+        assert e.value.stages == ['greedy']
+        assert 'during greedy' in str(e.value)
+    finally:
+        memory.disable()
+        memory.reset()
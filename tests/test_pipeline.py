@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import pytest
+from training_speech import pipeline, silence
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+@pytest.fixture
+def data_dir(tmpdir, mocker):
+    os.makedirs(str(tmpdir.join('data/mp3')))
+    shutil.copy(os.path.join(CURRENT_DIR, './assets/speech.mp3'), str(tmpdir.join('data/mp3/speech.mp3')))
+    mocker.patch('training_speech.pipeline.DATA_DIR', str(tmpdir.join('data')))
+    mocker.patch('training_speech.pipeline.STAMPS_DIR', str(tmpdir.join('stages')))
+    mocker.patch('training_speech.utils.CACHE_DIR', str(tmpdir))
+    mocker.patch('training_speech.pipeline.get_source', return_value=dict(audio='speech.mp3', language='fr_FR'))
+    return tmpdir
+
+
+def fake_ffmpeg(args, **kwargs):
+    for arg in args:
+        if arg.endswith('.tmp.wav'):
+            shutil.copy(os.path.join(CURRENT_DIR, './assets/speech.wav'), arg)
+
+
+def test_pipeline(data_dir, mocker):
+    run_mock = mocker.patch('training_speech.runner.run', side_effect=fake_ffmpeg)
+    detect = mocker.Mock(return_value=[(0., 0.5)])
+    mocker.patch.dict(silence.BACKENDS, fake=silence.Backend('fake', detect, {}))
+
+    prepared = pipeline.Pipeline('foo', silence_backend='fake').run(until='silences')
+    assert os.path.isfile(prepared.path_to_wav)
+    assert prepared.path_to_wav.endswith('_16000_1.wav')
+    assert prepared.silences == [(0., 0.5)]
+
+    # unchanged inputs => every stage is skipped, silences are read back from their cache
+    prepared = pipeline.Pipeline('foo', silence_backend='fake').run(until='silences')
+    assert prepared.silences == [(0., 0.5)]
+    assert run_mock.call_count == 1
+    assert detect.call_count == 1
+
+    # new audio rate => decode again, stamps of other rates are kept
+    pipeline.Pipeline('foo', audio_rate=8000, silence_backend='fake').run(until='silences')
+    assert run_mock.call_count == 2
+    assert run_mock.call_args[0][0][-5:-1] == ['-ar', '8000', '-ac', '1']
+    assert sorted(os.listdir(str(data_dir.join('stages')))) == [
+        'foo_decode_16000.json', 'foo_decode_8000.json', 'foo_hash.json',
+        'foo_silences_16000_fake.json', 'foo_silences_8000_fake.json',
+    ]
+    pipeline.Pipeline('foo', silence_backend='fake').run(until='silences')
+    assert run_mock.call_count == 2
+
+    # wav has been removed => decode again
+    os.unlink(prepared.path_to_wav)
+    pipeline.Pipeline('foo', audio_rate=8000).run(until='decode')
+    assert run_mock.call_count == 2
+    pipeline.Pipeline('foo', audio_rate=16000).run(until='decode')
+    assert run_mock.call_count == 3
+
+def test_pipeline_extra_rates(data_dir, mocker):
+    run_mock = mocker.patch('training_speech.runner.run', side_effect=fake_ffmpeg)
+
+    prepared = pipeline.Pipeline('foo', extra_rates=[8000, 16000, 48000]).run(until='decode')
+    assert run_mock.call_count == 1
+    assert ' '.join(run_mock.call_args[0][0]).count('-ar') == 3
+
+    # other rates were decoded at the same time
+    assert pipeline.Pipeline('foo', audio_rate=48000).run(until='decode').path_to_wav.endswith('_48000_1.wav')
+    assert pipeline.Pipeline('foo', audio_rate=8000).run(until='decode').path_to_wav != prepared.path_to_wav
+    assert run_mock.call_count == 1
+
+
+def test_clear_cache(data_dir):
+    kept = ['catalog.sqlite', 'digests.json', 'tts/abc.wav', 'fragments/pack_000.bin']
+    removed = ['abc_16000_1.wav', 'silences_vad_abc_0123.intervals', 'abc_def.fragments', 'abc_def.json',
+               'alignment_abc.json', 'abc.txt', 'labels.txt']
+    for name in kept + removed + ['stages/foo_hash.json']:
+        data_dir.join(name).write(b'', mode='wb', ensure=True)
+
+    assert pipeline.clear_cache() == len(removed)
+    assert all(data_dir.join(name).check() for name in kept)
+    assert not any(data_dir.join(name).check() for name in removed)
+    assert not data_dir.join('stages').check()
@@ -0,0 +1,46 @@
+import io
+import os
+
+from training_speech import player, wav
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+def test_player(mocker):
+    outputs = []
+
+    def play_stream(**kwargs):
+        process = mocker.Mock()
+        process.poll.return_value = None
+        process.stdin = io.BytesIO()
+        process.stdin.close = lambda: None
+        outputs.append((kwargs, process))
+        return process
+
+    mocker.patch('training_speech.sox.play_stream', side_effect=play_stream)
+    path_to_wav = os.path.join(CURRENT_DIR, './assets/test.wav')
+    with player.Player(path_to_wav, lookahead=10) as audio_player:
+        data = audio_player.read(1., 1.5)
+        assert len(data) == 16000
+        audio_player.play(data)
+        audio_player.wait()
+        audio_player.play(data, speed=1.3)
+        audio_player.wait()
+        audio_player.play(data)
+        audio_player.wait()
+
+        # a single process per speed
+        assert [kwargs['speed'] for kwargs, _ in outputs] == [None, 1.3]
+        assert outputs[0][0]['rate'] == 16000
+        # fragments are followed by 0.2s of silence
+        silence = bytes(int(0.2 * 16000) * 2)
+        assert outputs[0][1].stdin.getvalue() == data + silence + data + silence
+        assert outputs[1][1].stdin.getvalue() == data + silence
+
+
+def test_pcm_slice():
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        assert (pcm.rate, pcm.channels, pcm.sampwidth) == (16000, 1, 2)
+        assert pcm.duration == 4.864
+        assert len(pcm.slice(0, 1)) == 32000
+        assert len(pcm.slice(4, 10)) == 0.864 * 32000
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+from training_speech import profiling
+
+
+@pytest.fixture
+def enabled():
+    profiling.reset()
+    profiling.enable()
+    yield
+    profiling.disable()
+    profiling.reset()
+
+
+@profiling.profiled()
+def work(n):
+    with profiling.span('inner', n=n):
+        return sum(range(n))
+
+
+def test_disabled():
+    profiling.reset()
+    assert work(10) == 45
+    assert profiling.events() == []
+
+
+def test_spans(enabled):
+    with profiling.span('outer'):
+        work(10)
+        work(1000)
+    events = profiling.events()
+    assert [e['name'] for e in events] == ['inner', 'test_profiling.work', 'inner', 'test_profiling.work', 'outer']
+    assert events[0]['args'] == {'n': 10}
+    outer = events[-1]
+    assert outer['dur'] >= sum(e['dur'] for e in events if e['name'] == 'test_profiling.work')
+    assert outer['self'] <= outer['dur']
+
+    rows = {row[0]: row for row in profiling.summary()}
+    assert rows['inner'][1] == 2
+    assert rows['test_profiling.work'][1] == 2
+    assert rows['outer'][1] == 1
+
+
+def test_export_chrome_trace(enabled, tmpdir):
+    work(10)
+    path = str(tmpdir.join('trace.json'))
+    profiling.export_chrome_trace(path)
+    with open(path) as f:
+        trace = json.load(f)
+    assert [e['name'] for e in trace['traceEvents']] == ['inner', 'test_profiling.work']
+    assert all(e['ph'] == 'X' and 'self' not in e for e in trace['traceEvents'])
@@ -0,0 +1,87 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError
+
+import pytest
+from training_speech import runner
+from training_speech.exceptions import ToolError
+
+
+@pytest.fixture
+def tool_runner():
+    r = runner.Runner(max_jobs=2)
+    yield r
+    r.close()
+
+
+def test_run(tool_runner):
+    result = tool_runner.run(['cat'], input=b'foo')
+    assert result.returncode == 0
+    assert result.stdout == b'foo'
+
+
+def test_run_error(tool_runner):
+    with pytest.raises(ToolError) as e:
+        tool_runner.run(['sh', '-c', 'echo boom >&2; exit 3'])
+    assert e.value.returncode == 3
+    assert 'boom' in str(e.value)
+    assert tool_runner.run(['sh', '-c', 'exit 3'], check=False).returncode == 3
+
+
+def test_run_timeout(tool_runner):
+    with pytest.raises(ToolError) as e:
+        tool_runner.run(['sleep', '5'], timeout=0.1)
+    assert e.value.timeout == 0.1
+
+
+def test_cancel(tool_runner):
+    future = tool_runner.submit(['sleep', '5'])
+    time.sleep(0.1)
+    assert len(tool_runner._jobs) == 1
+    future.cancel()
+    with pytest.raises(CancelledError):
+        future.result()
+    time.sleep(0.1)
+    assert len(tool_runner._jobs) == 0
+
+
+def test_max_jobs(tool_runner):
+    running = []
+    lock = threading.Lock()
+
+    def _run(i):
+        tool_runner.run(['sleep', '0.1'])
+        with lock:
+            running.append(len(tool_runner._jobs))
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(_run, range(6)))
+    # 6 jobs, 2 at a time
+    assert time.time() - start >= 0.3
+    assert max(running) <= 2
+
+
+def test_runner_created_in_thread():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        r = executor.submit(runner.Runner, 1).result()
+        try:
+            assert executor.submit(r.run, ['true']).result().returncode == 0
+        finally:
+            r.close()
+
+
+def _run_true(_):
+    return runner.run(['true']).returncode
+
+
+def test_runner_forked(mocker):
+    mocker.patch('training_speech.runner._runner', None)
+    assert runner.run(['true']).returncode == 0
+    inherited = runner.get_runner()
+    # NB: workers inherit the parent runner, whose loop thread does not exist in them
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as executor:
+        assert executor.submit(_run_true, None).result(timeout=10) == 0
+    assert runner.get_runner() is inherited
+    inherited.close()
@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+from training_speech import catalog, search
+
+
+@pytest.fixture
+def index(tmpdir):
+    path_to_alignments = tmpdir.mkdir('alignments')
+    path_to_transcripts = tmpdir.mkdir('transcripts')
+    path_to_alignments.join('foo.json').write(json.dumps([
+        dict(begin=0, end=3.5, text='Chapitre un, Marseille. L’arrivée.', approved=True),
+        dict(begin=3.5, end=6, text='Le trois-mâts le Pharaon arrivait de Smyrne.', approved=True),
+    ]))
+    path_to_transcripts.join('foo.txt').write('Chapitre un, Marseille. L’arrivée.\n\nLe trois-mâts le Pharaon arrivait de Smyrne.\n')
+    sources = dict(foo=dict(speaker='Alice', language='fr_FR'))
+    corpus = catalog.Catalog(str(tmpdir.join('catalog.sqlite')), path_to_alignments=str(path_to_alignments), sync=False)
+    index_ = search.SearchIndex(corpus, path_to_transcripts=str(path_to_transcripts), sync=False)
+    assert index_.sync(sources) == ['foo']
+    yield index_, sources, path_to_alignments, path_to_transcripts
+    index_.close()
+    corpus.close()
+
+
+def test_tokenize():
+    assert search.tokenize('« Chapitre un, Marseille. L’arrivée. »') == ['chapitre', 'un', 'marseille', "l'", 'arrivée']
+
+
+def test_search(index):
+    index_, *_ = index
+    hits = index_.search('Marseille, l’arrivée')
+    assert [(hit.kind, hit.idx, hit.begin, hit.end, hit.position) for hit in hits] == [
+        ('fragment', 0, 0, 3.5, 2),
+        ('line', 0, None, None, 2),
+    ]
+    assert [hit.idx for hit in index_.search('pharaon', kind='line')] == [2]
+    assert [hit.idx for hit in index_.search('arriv*', kind='fragment')] == [0, 1]
+    assert [hit.idx for hit in index_.search('le pharaon arriv*', kind='fragment')] == [1]
+    assert index_.search('pharaon le') == []
+    assert index_.search('marseille', source='bar') == []
+    assert len(index_.search('le', limit=1)) == 1
+    assert index_.search('  ') == []
+
+
+def test_sync(index):
+    index_, sources, path_to_alignments, path_to_transcripts = index
+    assert index_.sync(sources) == []
+
+    path_to_alignments.join('foo.json').write(json.dumps([dict(begin=0, end=1, text='Edmond Dantès')]))
+    assert index_.sync(sources) == ['foo']
+    assert [hit.kind for hit in index_.search('edmond')] == ['fragment']
+    # transcript was not re-indexed
+    assert [hit.kind for hit in index_.search('smyrne')] == ['line']
+
+    os.unlink(str(path_to_transcripts.join('foo.txt')))
+    assert index_.sync(sources) == ['foo']
+    assert index_.search('smyrne') == []
+
+    assert index_.sync({}) == []
+    assert index_.search('edmond') == []
+    assert index_.connection.execute('SELECT COUNT(*) FROM postings').fetchone()[0] == 0
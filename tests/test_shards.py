@@ -0,0 +1,139 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from training_speech import shards, wav
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+
+def test_shard_packer(tmpdir):
+    path_to_release = str(tmpdir.join('release'))
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        data = bytes(pcm.slice(0, 1))
+        fragment = wav.header(pcm.rate, 1, 2, len(data)) + data
+
+    with shards.ShardPacker(path_to_release, codec='deflate', workers=2, shard_size=3 * len(fragment)) as packer:
+        arcnames = [packer.add(f'foo_{i:04d}', fragment, text=f'bonjour {i}') for i in range(10)]
+        packer.writefile('data.csv', io.StringIO('path,duration,text\n'))
+
+    assert arcnames == [f'foo_{i:04d}.wav' for i in range(10)]
+    with open(os.path.join(path_to_release, 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert manifest['codec'] == 'deflate'
+    assert [s['count'] for s in manifest['shards']] == [4, 4, 2]
+    assert os.path.isfile(os.path.join(path_to_release, 'data.csv'))
+
+    paths = shards.list_shards(path_to_release)
+    assert len(paths) == 3
+    with shards.ShardReader(paths[1]) as reader:
+        assert len(reader) == 4
+        entry = reader[2]
+        assert entry.name == 'foo_0006.wav'
+        assert entry.text == 'bonjour 6'
+        assert abs(entry.duration - 1) < 1e-3
+        assert reader.payload(2) == fragment
+        assert reader.find('foo_0005.wav') == 1
+        assert [e.name for e in reader] == ['foo_0004.wav', 'foo_0005.wav', 'foo_0006.wav', 'foo_0007.wav']
+
+
+def test_shard_packer_incremental(tmpdir, mocker):
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        data = bytes(pcm.slice(0, 1))
+        fragment = wav.header(pcm.rate, 1, 2, len(data)) + data
+    fragments = [dict(begin=i, end=i + 1, text=f'bonjour {i}') for i in range(5)]
+
+    path_to_previous = str(tmpdir.join('previous'))
+    with shards.ShardPacker(path_to_previous, workers=2) as packer:
+        for i, f in enumerate(fragments):
+            packer.add(f'foo_{i:04d}', fragment, text=f['text'], key=shards.content_key('abc', f, 16000, 'store'))
+
+    # fragment 2 text is fixed, fragment 4 is removed
+    fragments[2]['text'] = 'bonsoir 2'
+    encode_spy = mocker.spy(shards.archive, 'encode')
+    path_to_delta = str(tmpdir.join('delta.zip'))
+    path_to_release = str(tmpdir.join('release'))
+    with shards.ShardPacker(path_to_release, workers=2, previous=path_to_previous, delta=path_to_delta) as packer:
+        for i, f in enumerate(fragments[:4]):
+            key = shards.content_key('abc', f, 16000, 'store')
+            packer.reuse(f'foo_{i:04d}', key) or packer.add(f'foo_{i:04d}', fragment, text=f['text'], key=key)
+    assert packer.reused_count == 3
+    assert encode_spy.call_count == 1
+
+    with shards.ShardReader(shards.list_shards(path_to_release)[0]) as reader:
+        assert [e.text for e in reader] == ['bonjour 0', 'bonjour 1', 'bonsoir 2', 'bonjour 3']
+        assert all(reader.payload(i) == fragment for i in range(4))
+
+    with zipfile.ZipFile(path_to_delta) as zip_file:
+        assert zip_file.namelist() == ['foo_0002.wav', 'data.csv', 'removed.txt']
+        assert zip_file.read('foo_0002.wav') == fragment
+        assert zip_file.read('removed.txt') == b'foo_0004.wav\n'
+
+    # release can be rebuilt from itself
+    with shards.ShardPacker(path_to_release, workers=2, previous=path_to_release) as packer:
+        for i, f in enumerate(fragments[:4]):
+            assert packer.reuse(f'foo_{i:04d}', shards.content_key('abc', f, 16000, 'store'))
+    with shards.ShardReader(shards.list_shards(path_to_release)[0]) as reader:
+        assert reader.payload(2) == fragment
+
+
+def _release_files(path_to_release: str) -> dict:
+    files = {}
+    for path in shards.list_shards(path_to_release):
+        with shards.ShardReader(path) as reader:
+            files.update((entry.name, reader.payload(i)) for i, entry in enumerate(reader))
+    return files
+
+
+def test_shard_packer_delta_shifted(tmpdir):
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        a, b, x = [wav.header(pcm.rate, 1, 2, 2 * pcm.rate) + bytes(pcm.slice(i, i + 1)) for i in range(3)]
+    keys = dict(a='key a', b='key b', x='key x')
+
+    path_to_previous = str(tmpdir.join('previous'))
+    with shards.ShardPacker(path_to_previous, codec='deflate', workers=2) as packer:
+        for i, (name, fragment) in enumerate([('a', a), ('b', b)]):
+            packer.add(f'src_{i + 1:04d}', fragment, text=name, key=keys[name])
+
+    # x inserted first => a and b are shifted
+    path_to_delta = str(tmpdir.join('delta.zip'))
+    path_to_release = str(tmpdir.join('release'))
+    with shards.ShardPacker(path_to_release, codec='deflate', workers=2, previous=path_to_previous,
+                            delta=path_to_delta) as packer:
+        for i, (name, fragment) in enumerate([('x', x), ('a', a), ('b', b)]):
+            packer.reuse(f'src_{i + 1:04d}', keys[name]) or packer.add(f'src_{i + 1:04d}', fragment, text=name,
+                                                                       key=keys[name])
+    assert packer.reused_count == 2
+
+    files = _release_files(path_to_previous)
+    with zipfile.ZipFile(path_to_delta) as zip_file:
+        assert zip_file.testzip() is None
+        for name in zip_file.namelist():
+            if name not in ('data.csv', 'removed.txt'):
+                files[name] = zip_file.read(name)
+        for name in zip_file.read('removed.txt').decode().split():
+            del files[name]
+    assert files == _release_files(path_to_release) == {'src_0001.wav': x, 'src_0002.wav': a, 'src_0003.wav': b}
+
+
+def test_shard_packer_abort(tmpdir):
+    with wav.PCM(os.path.join(CURRENT_DIR, './assets/test.wav')) as pcm:
+        data = bytes(pcm.slice(0, 1))
+        fragment = wav.header(pcm.rate, 1, 2, len(data)) + data
+    path_to_release = str(tmpdir.join('release'))
+    with shards.ShardPacker(path_to_release, workers=2) as packer:
+        packer.add('foo_0000', fragment, text='bonjour')
+
+    path_to_delta = str(tmpdir.join('delta.zip'))
+    with pytest.raises(ValueError):
+        with shards.ShardPacker(path_to_release, workers=2, previous=path_to_release, delta=path_to_delta) as packer:
+            packer.add('foo_0001', fragment, text='bonsoir')
+            raise ValueError('cannot cut fragment')
+
+    # previous release is left as is, partial one is dropped
+    assert sorted(os.listdir(str(tmpdir))) == ['release']
+    with shards.ShardReader(shards.list_shards(path_to_release)[0]) as reader:
+        assert [e.text for e in reader] == ['bonjour']
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from training_speech import silence
+
+
+@pytest.fixture
+def fake_backend(tmpdir, mocker):
+    mocker.patch('training_speech.utils.CACHE_DIR', str(tmpdir))
+    detect = mocker.Mock(side_effect=lambda path, audio_hash, threshold: [(0., threshold), (1.00001, 2.)])
+    mocker.patch.dict(silence.BACKENDS, fake=silence.Backend('fake', detect, dict(threshold=0.5)))
+    path = tmpdir.join('audio.wav')
+    path.write(b'foo', mode='wb')
+    return str(path), detect
+
+
+def test_list_silences(fake_backend):
+    path, detect = fake_backend
+    assert silence.list_silences(path, 'fake') == [(0., 0.5), (1., 2.)]
+    assert silence.list_silences(path, 'fake', threshold=0.5) == [(0., 0.5), (1., 2.)]
+    assert detect.call_count == 1
+    # digest is handed over to the backend, not part of its params
+    assert detect.call_args[1]['audio_hash']
+
+    # other params or forced => detected again
+    assert silence.list_silences(path, 'fake', threshold=0.7) == [(0., 0.7), (1., 2.)]
+    assert detect.call_count == 2
+    silence.list_silences(path, 'fake', force=True)
+    assert detect.call_count == 3
+
+
+def test_list_silences_invalid(fake_backend):
+    path, _ = fake_backend
+    with pytest.raises(ValueError):
+        silence.list_silences(path, 'foo')
+    with pytest.raises(TypeError):
+        silence.list_silences(path, 'fake', mode=3)
+
+
+def test_list_silences_many(fake_backend, tmpdir, mocker):
+    path, detect = fake_backend
+    mocker.patch('training_speech.silence.ProcessPoolExecutor', ThreadPoolExecutor)
+    results = {
+        path_: (silences, error)
+        for path_, silences, error in silence.list_silences_many([path, str(tmpdir.join('missing.wav'))], 'fake', jobs=2)
+    }
+    assert results[path] == ([(0., 0.5), (1., 2.)], None)
+    assert isinstance(results[str(tmpdir.join('missing.wav'))][1], FileNotFoundError)
+
+
+@pytest.mark.parametrize('left, right, expected', [
+    ([], [(0., 1.)], []),
+    ([(0., 1.), (2., 3.)], [(0.5, 2.5)], [(0.5, 1.), (2., 2.5)]),
+    ([(0., 1.)], [(0.98, 2.)], []),  # too short
+    ([(0., 1.), (1.5, 2.)], [(0.2, 0.4), (0.6, 0.8), (3., 4.)], [(0.2, 0.4), (0.6, 0.8)]),
+])
+def test_intersect(left, right, expected):
+    assert silence.intersect(left, right) == expected
+    assert silence.intersect(right, left) == expected
+
+
+def test_combined(tmpdir, mocker):
+    mocker.patch('training_speech.utils.CACHE_DIR', str(tmpdir))
+    mocker.patch.dict(silence.BACKENDS, {
+        'vad': silence.BACKENDS['vad']._replace(detect=mocker.Mock(return_value=[(0., 1.), (2., 3.)])),
+        'ffmpeg': silence.BACKENDS['ffmpeg']._replace(detect=mocker.Mock(return_value=[(0.5, 2.5)])),
+    })
+    path = tmpdir.join('audio.wav')
+    path.write(b'foo', mode='wb')
+
+    assert silence.list_silences(str(path), 'combined') == [(0.5, 1.), (2., 2.5)]
+    # vad and ffmpeg results are cached as well
+    silence.list_silences(str(path), 'vad')
+    assert silence.BACKENDS['vad'].detect.call_count == 1
@@ -6,13 +6,12 @@ from training_speech import sox
 
 
 @pytest.mark.parametrize('kwargs, expected_call', [
-    (dict(path_to_file='/path/to/foo.mp3'), 'play -q /path/to/foo.mp3'),
-    (dict(path_to_file='/path/to/foo.mp3', speed=1.2), 'play -q /path/to/foo.mp3 tempo 1.2'),
+    (dict(rate=16000), 'play -q --buffer 2048 -t raw -r 16000 -e signed -b 16 -c 1 -'),
+    (dict(rate=8000, speed=1.3), 'play -q --buffer 2048 -t raw -r 8000 -e signed -b 16 -c 1 - tempo 1.3'),
 ])
-def test_convert(kwargs, expected_call, mocker):
-    wait_mock = mocker.patch('subprocess.Popen.wait')
-    with sox.play(**kwargs) as player:
-        assert isinstance(player, subprocess.Popen)
-        assert wait_mock.call_count == 0
-        assert ' '.join(player.args) == expected_call
-    wait_mock.assert_called_once()
+def test_play_stream(kwargs, expected_call, mocker):
+    popen_mock = mocker.patch('subprocess.Popen')
+    sox.play_stream(**kwargs)
+    call_args, call_kwargs = popen_mock.call_args
+    assert ' '.join(call_args[0]) == expected_call
+    assert call_kwargs['stdin'] == subprocess.PIPE
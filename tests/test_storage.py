@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+import pytest
+from training_speech import storage
+
+
+@pytest.fixture
+def storages(tmpdir):
+    digests = storage.DigestCache(str(tmpdir.join('digests.json')))
+    src = storage.LocalStorage(str(tmpdir.mkdir('src')), digests=digests)
+    dst = storage.LocalStorage(str(tmpdir.mkdir('dst')), digests=digests)
+    tmpdir.join('src', 'a.mp3').write(b'a' * 100, mode='wb')
+    tmpdir.join('src', 'b.epub').write(b'b' * 10, mode='wb')
+    tmpdir.join('src', '.gitkeep').write(b'', mode='wb')
+    tmpdir.mkdir('src', 'release').join('00000.shard').write(b'c', mode='wb')
+    return src, dst
+
+
+def test_etag(tmpdir):
+    path = str(tmpdir.join('file'))
+    with open(path, 'wb') as f:
+        f.write(b'0123456789')
+    assert storage.etag(path) == hashlib.md5(b'0123456789').hexdigest()
+    parts = [hashlib.md5(b'0123').digest(), hashlib.md5(b'4567').digest(), hashlib.md5(b'89').digest()]
+    assert storage.etag(path, part_size=4) == hashlib.md5(b''.join(parts)).hexdigest() + '-3'
+
+
+def test_open_storage():
+    s3 = storage.open_storage('s3://audiocorp/mp3/')
+    assert (s3.bucket, s3.prefix, s3.url) == ('audiocorp', 'mp3/', 's3://audiocorp/mp3/')
+    assert storage.open_storage('file:///tmp/mirror/').root == '/tmp/mirror'
+
+
+def test_matches():
+    assert storage.matches('release/00000.shard')
+    assert storage.matches('release/00000.shard', include=['*.shard'])
+    assert not storage.matches('a.zip', exclude=['*.zip'])
+    assert not storage.matches('a.mp3', include=['b.mp3'])
+
+
+def test_sync(storages):
+    src, dst = storages
+    result = storage.sync(src, dst, exclude=['.gitkeep'], dry_run=True)
+    assert result.transferred == ['a.mp3', 'b.epub', 'release/00000.shard']
+    assert not os.path.exists(dst.path('a.mp3'))
+
+    result = storage.sync(src, dst, exclude=['.gitkeep'], jobs=2)
+    assert result == storage.SyncResult(['a.mp3', 'b.epub', 'release/00000.shard'], 0, 111)
+    with open(dst.path('release/00000.shard'), 'rb') as f:
+        assert f.read() == b'c'
+    assert not os.path.exists(dst.path('.gitkeep'))
+
+    # same content => skipped
+    assert storage.sync(src, dst, exclude=['.gitkeep']) == storage.SyncResult([], 3, 0)
+
+    # same size, other content => transferred
+    with open(src.path('b.epub'), 'wb') as f:
+        f.write(b'B' * 10)
+    assert storage.sync(src, dst, include=['*.epub']).transferred == ['b.epub']
+    with open(dst.path('b.epub'), 'rb') as f:
+        assert f.read() == b'B' * 10
+
+
+def test_digest_cache(tmpdir, mocker):
+    path = str(tmpdir.join('file'))
+    with open(path, 'wb') as f:
+        f.write(b'foo')
+    cache = storage.DigestCache(str(tmpdir.join('digests.json')))
+    assert cache.get(path) == hashlib.md5(b'foo').hexdigest()
+    cache.save()
+
+    etag = mocker.patch('training_speech.storage.etag')
+    assert storage.DigestCache(str(tmpdir.join('digests.json'))).get(path) == hashlib.md5(b'foo').hexdigest()
+    assert etag.call_count == 0
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from training_speech import tts, wav
+
+
+@pytest.fixture
+def cache_dir(tmpdir, mocker):
+    mocker.patch('training_speech.utils.CACHE_DIR', str(tmpdir))
+    return tmpdir.join('tts')
+
+
+def test_cached_path(cache_dir):
+    path = tts.cached_path('fr', 'Chapitre premier.', ['espeak'])
+    assert path.startswith(str(cache_dir))
+    assert tts.cached_path('fr', ' Chapitre\n premier. ', ['espeak']) == path
+    assert tts.cached_path('en', 'Chapitre premier.', ['espeak']) != path
+    assert tts.cached_path('fr', 'Chapitre premier.', ['espeak-ng']) != path
+
+
+def test_split_wav(tmpdir):
+    path_to_wav = str(tmpdir.join('batch.wav'))
+    samples = bytes(range(200))
+    with open(path_to_wav, 'wb') as f:
+        f.write(wav.header(100, 1, 2, len(samples)))
+        f.write(samples)
+
+    paths = [str(tmpdir.join('a.wav')), str(tmpdir.join('b.wav'))]
+    tts.split_wav(path_to_wav, [(0., 0.25), (0.25, 1.)], paths)
+    with wav.PCM(paths[0]) as pcm:
+        assert pcm.rate == 100
+        assert bytes(pcm.data) == samples[:50]
+    with wav.PCM(paths[1]) as pcm:
+        assert bytes(pcm.data) == samples[50:]
+
+
+def test_prune(cache_dir):
+    cache_dir.ensure(dir=True)
+    for i, name in enumerate(['old.wav', 'recent.wav', 'latest.wav']):
+        cache_dir.join(name).write(b'0' * 10, mode='wb')
+        os.utime(str(cache_dir.join(name)), (i, i))
+    assert tts.prune(max_size=30) == 0
+    assert tts.prune(max_size=15) == 2
+    assert os.listdir(str(cache_dir)) == ['latest.wav']
+
+
+def test_maybe_prune(mocker):
+    prune_mock = mocker.patch('training_speech.tts.prune')
+    mocker.patch('training_speech.tts._pruned_at', None)
+    mocker.patch.dict(tts.STATS, misses=5)
+    tts.maybe_prune()
+    assert prune_mock.call_count == 1
+
+    tts.STATS['misses'] += tts.PRUNE_INTERVAL - 1
+    tts.maybe_prune()
+    assert prune_mock.call_count == 1
+    tts.STATS['misses'] += 1
+    tts.maybe_prune()
+    assert prune_mock.call_count == 2
+
+
+def test_synthesize_single(cache_dir, mocker):
+    def synthesize(text, voice_code, output_file_path, return_audio_data):
+        with open(output_file_path, 'wb') as f:
+            f.write(text.encode())
+        return True, None
+
+    wrapper = tts.CachedTTSWrapper()
+    synthesize_mock = mocker.patch.object(wrapper, '_synthesize_single_subprocess_helper', side_effect=synthesize)
+    mocker.patch.object(wrapper, '_read_audio_data', side_effect=lambda path: (True, path))
+
+    succeeded, path = wrapper._synthesize_single_python_helper('Chapitre premier.', 'fr')
+    assert succeeded
+    assert wrapper._synthesize_single_python_helper(' Chapitre  premier.', 'fr') == (True, path)
+    assert synthesize_mock.call_count == 1
+    with open(path) as f:
+        assert f.read() == 'Chapitre premier.'
+
+    wrapper._synthesize_single_python_helper('Chapitre deux.', 'fr')
+    assert synthesize_mock.call_count == 2
+    assert wrapper._synthesize_single_python_helper('', 'fr')[0]
+    assert synthesize_mock.call_count == 2
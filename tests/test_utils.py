@@ -1,4 +1,5 @@
 import os
+import shutil
 from datetime import timedelta
 
 import pytest
@@ -384,7 +385,7 @@ def test_build_alignment(filename, vad_mode, vad_frame_duration, transcript, exi
         transcript=transcript,
         path_to_audio=path_to_audio,
         existing_alignment=existing_alignment,
-        silences=vad.list_silences(path_to_audio, mode=vad_mode, frame_duration=vad_frame_duration, force=True),
+        silences=vad.detect_silences(path_to_audio, mode=vad_mode, frame_duration=vad_frame_duration),
         generate_labels=True
     )
     assert generated == expected
@@ -446,3 +447,41 @@ def test_format_timedelta(td, expected):
 ])
 def test_cleanup_transcript(text, expected):
     assert expected == utils.cleanup_transcript(text)
+
+
+def test_cached_build_alignment(tmpdir, mocker):
+    mocker.patch('training_speech.utils.CACHE_DIR', str(tmpdir))
+    build_mock = mocker.patch('training_speech.utils.build_alignment', return_value=[
+        dict(begin=0., end=1.5, text='foo'),
+    ])
+    path_to_wav = os.path.join(CURRENT_DIR, './assets/test.wav')
+    kwargs = dict(transcript=['foo'], path_to_audio=path_to_wav, silences=[(1.5, 2.)])
+    expected = [dict(begin=0., end=1.5, text='foo')]
+
+    assert utils.cached_build_alignment(existing_alignment=[], **kwargs) == expected
+    # non approved alignment is not taken into account
+    assert utils.cached_build_alignment(existing_alignment=[dict(begin=0., end=1., text='foo')], **kwargs) == expected
+    assert build_mock.call_count == 1
+
+    utils.cached_build_alignment(existing_alignment=[dict(begin=0., end=1., text='foo', approved=True)], **kwargs)
+    utils.cached_build_alignment(existing_alignment=[], language='en_US', **kwargs)
+    utils.cached_build_alignment(existing_alignment=[], force=True, **kwargs)
+    assert build_mock.call_count == 4
+
+    # labels are written from the cached alignment
+    assert utils.cached_build_alignment(existing_alignment=[], generate_labels=True, **kwargs) == expected
+    assert build_mock.call_count == 4
+    assert tmpdir.join('labels.txt').read() == '1.5\t2.0\tsilence#001\n0.0\t1.5\tf#001:foo\n'
+
+    # audio of the same size at the same path but another content => built again
+    path_to_copy = str(tmpdir.join('audio.wav'))
+    shutil.copy(path_to_wav, path_to_copy)
+    utils.cached_build_alignment(existing_alignment=[], **dict(kwargs, path_to_audio=path_to_copy))
+    assert build_mock.call_count == 4
+    with open(path_to_copy, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    utils.cached_build_alignment(existing_alignment=[], **dict(kwargs, path_to_audio=path_to_copy))
+    assert build_mock.call_count == 5
@@ -10,7 +10,7 @@ CURRENT_DIR = os.path.dirname(__file__)
     ('test.wav', 3, 30, [(0.0, 0.18), (1.11, 1.44), (2.145, 2.58), (3.12, 4.864)]),
     ('silence.wav', 3, 20, [(0.0, 1.108)]),
 ])
-def test_list_silences(input_file, mode, frame_duration, expected_silences):
+def test_detect_silences(input_file, mode, frame_duration, expected_silences):
     path_to_wav = os.path.join(CURRENT_DIR, f'./assets/{input_file}')
-    silences = vad.list_silences(path_to_wav, mode=mode, frame_duration=frame_duration, force=True)
+    silences = vad.detect_silences(path_to_wav, mode=mode, frame_duration=frame_duration)
     assert expected_silences == silences
@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import time
+from collections import namedtuple, defaultdict, Counter
+from contextlib import contextmanager
+from typing import List
+
+from training_speech import profiling
+
+HISTOGRAM_HEADERS = ['Tool', 'Count', 'Total (s)', 'Mean (ms)', 'Max (ms)', 'Bytes in', 'Bytes out', 'Top caller']
+
+ProcessRecord = namedtuple('ProcessRecord', ['tool', 'args', 'caller', 'duration', 'returncode', 'bytes_in', 'bytes_out'])
+
+# NB: frames of these modules only forward calls => the caller is the first frame outside of them
+_WRAPPERS = {'runner.py', 'accounting.py', 'ffmpeg.py', 'sox.py', 'contextlib.py', 'profiling.py'}
+
+_lock = threading.Lock()
+_recorders = []
+# tool => [count, duration, bytes in, bytes out, max duration, Counter of callers]
+_totals = defaultdict(lambda: [0, 0., 0, 0, 0., Counter()])
+
+
+def caller(skip: int = 1) -> str:
+    frame = sys._getframe(skip)
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in _WRAPPERS:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    return f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}'
+
+
+def tool_name(args: List[str]) -> str:
+    return os.path.basename(args[0]) if args else '?'
+
+
+def record(args: List[str], caller_: str, begin: float, duration: float = None, returncode: int = None,
+           bytes_in: int = 0, bytes_out: int = 0, pid: int = None) -> ProcessRecord:
+    """
+    Account an external process (or an in-process tool such as aeneas) that started at `begin` (perf_counter).
+    Long-lived processes are spawned without a known `duration`.
+    """
+    entry = ProcessRecord(tool_name(args), list(args), caller_, duration, returncode, bytes_in, bytes_out)
+    with _lock:
+        totals = _totals[entry.tool]
+        totals[0] += 1
+        totals[1] += duration or 0.
+        totals[2] += bytes_in
+        totals[3] += bytes_out
+        totals[4] = max(totals[4], duration or 0.)
+        totals[5][caller_] += 1
+        for recorder in _recorders:
+            recorder.records.append(entry)
+    if profiling.ENABLED and duration is not None:
+        # NB: one track per process as they run concurrently
+        profiling.add_event(entry.tool, begin, duration, tid=pid, command=' '.join(entry.args), caller=caller_)
+    return entry
+
+
+@contextmanager
+def track(args: List[str], bytes_in: int = 0):
+    """
+    Account an in-process tool run (ie. aeneas) the same way as external processes.
+    """
+    caller_ = caller()
+    begin = time.perf_counter()
+    returncode = 1
+    try:
+        yield
+        returncode = 0
+    finally:
+        record(args, caller_, begin, time.perf_counter() - begin, returncode, bytes_in=bytes_in)
+
+
+class Recorder:
+    def __init__(self):
+        self.records = []
+
+    def count(self, tool: str = None) -> int:
+        return sum(1 for r in self.records if tool is None or r.tool == tool)
+
+    def by_tool(self) -> Counter:
+        return Counter(r.tool for r in self.records)
+
+
+@contextmanager
+def recording():
+    """
+    Collect the records of processes started within the block (from any thread).
+    """
+    recorder = Recorder()
+    with _lock:
+        _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        with _lock:
+            _recorders.remove(recorder)
+
+
+@contextmanager
+def spawn_budget(max_count: int, tool: str = None):
+    """
+    Fail when the block starts more than `max_count` processes (of `tool` if provided), ie. in tests:
+
+        with accounting.spawn_budget(1, tool='sox'):
+            utils.smart_cut(...)
+    """
+    with recording() as recorder:
+        yield recorder
+    count = recorder.count(tool)
+    if count > max_count:
+        callers = Counter(r.caller for r in recorder.records if tool is None or r.tool == tool)
+        details = ''.join(f'\n  {n:5d} x {caller_}' for caller_, n in callers.most_common(5))
+        raise AssertionError(f'{count} {tool or "processes"} spawned, budget is {max_count}{details}')
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+def histogram() -> List[list]:
+    """
+    Return [tool, count, total (s), mean (ms), max (ms), bytes in, bytes out, top caller] per tool, most spawned first.
+    """
+    with _lock:
+        totals = {tool: list(values) for tool, values in _totals.items()}
+    rows = []
+    for tool, (count, duration, bytes_in, bytes_out, max_duration, callers) in totals.items():
+        top_caller, top_count = callers.most_common(1)[0]
+        rows.append([
+            tool, count, round(duration, 3), round(duration / count * 1e3, 2), round(max_duration * 1e3, 2),
+            bytes_in, bytes_out, f'{top_caller} ({top_count})',
+        ])
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
@@ -0,0 +1,2 @@
+# NB: aeneas loads custom TTS wrappers from a file path (see `utils.TTS_RCONF`) then imports `CustomTTSWrapper` from it
+from training_speech.tts import CachedTTSWrapper as CustomTTSWrapper  # noqa: F401
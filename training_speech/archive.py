@@ -0,0 +1,162 @@
+import os
+import struct
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+from training_speech import ffmpeg, wav, profiling
+
+CODECS = ('store', 'deflate', 'flac')
+EXTENSIONS = dict(store='.wav', deflate='.wav', flac='.flac')
+
+
+def set_flac_total_samples(data: bytes, nframes: int) -> bytes:
+    # flac streamed to a pipe cannot rewrite STREAMINFO once encoded => total samples is left unknown (0)
+    assert data[:4] == b'fLaC'
+    value, = struct.unpack_from('>Q', data, 18)
+    value = (value & ~0xFFFFFFFFF) | nframes
+    return data[:18] + struct.pack('>Q', value) + data[26:]
+
+
+@profiling.profiled()
+def fragment_wav(pcm: wav.PCM, fragment: dict) -> bytes:
+    """
+    Return a standalone wav file with the samples of `fragment`, read from the memory-mapped source.
+    """
+    samples = pcm.slice(fragment['begin'], fragment['end'])
+    return wav.header(pcm.rate, pcm.channels, pcm.sampwidth, len(samples)) + samples
+
+
+def encode(data: bytes, codec: str) -> Tuple[int, int, int, bytes]:
+    """
+    Return (compress_type, crc, file_size, payload) of a wav file encoded with `codec`.
+    """
+    if codec == 'flac':
+        rate, channels, sampwidth, _, data_size = wav.parse_header(data)
+        data = set_flac_total_samples(ffmpeg.encode_flac(data), data_size // (channels * sampwidth))
+
+    crc = zlib.crc32(data) & 0xFFFFFFFF
+    if codec == 'deflate':
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        return zipfile.ZIP_DEFLATED, crc, len(data), compressor.compress(data) + compressor.flush()
+    return zipfile.ZIP_STORED, crc, len(data), data
+
+
+def precompressed(payload: bytes, codec: str) -> Tuple[int, int, int, bytes]:
+    """
+    Return (compress_type, crc, file_size, payload) of a `payload` already encoded with `codec`, as `encode` does.
+    """
+    if codec == 'deflate':
+        data = zlib.decompress(payload, -15)
+        return zipfile.ZIP_DEFLATED, zlib.crc32(data) & 0xFFFFFFFF, len(data), payload
+    return zipfile.ZIP_STORED, zlib.crc32(payload) & 0xFFFFFFFF, len(payload), payload
+
+
+def write_precompressed(zip_file: zipfile.ZipFile, arcname: str, compress_type: int, crc: int, file_size: int, payload: bytes):
+    """
+    Append a member whose `payload` was compressed elsewhere (see `encode`), so that workers compress in parallel.
+    NB: `ZipFile` has no public API for that (`open(zinfo, 'w')` compresses what it is given) => this mirrors
+    `ZipFile.writestr` through private attributes (`_lock`, `_seekable`, `_writing`, `start_dir`, ...) which are the same
+    from python 3.6 to 3.13, see `tests/test_archive.py` reading members back with `zipfile`.
+    """
+    if not zip_file.fp:
+        raise ValueError('Attempt to write to ZIP archive that was already closed')
+    if zip_file._writing:
+        raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+    zinfo = zipfile.ZipInfo(filename=arcname, date_time=time.localtime(time.time())[:6])
+    zinfo.external_attr = 0o600 << 16
+    zinfo.compress_type = compress_type
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    zinfo.compress_size = len(payload)
+    with zip_file._lock:
+        if zip_file._seekable:
+            zip_file.fp.seek(zip_file.start_dir)
+        zinfo.header_offset = zip_file.fp.tell()
+        zip_file._writecheck(zinfo)
+        zip_file._didModify = True
+        zip_file.fp.write(zinfo.FileHeader())
+        zip_file.fp.write(payload)
+        zip_file.start_dir = zip_file.fp.tell()
+        zip_file.filelist.append(zinfo)
+        zip_file.NameToInfo[zinfo.filename] = zinfo
+
+
+class ZipPacker:
+    """
+    Write fragments into a zip archive, members being encoded by a pool of workers and appended in order.
+    The archive only replaces `path_to_zip` once closed: a failed release leaves the existing one untouched.
+    """
+
+    def __init__(self, path_to_zip: str, codec: str = 'deflate', workers: int = None):
+        assert codec in CODECS, f'{codec} not in {CODECS}'
+        self.path = path_to_zip
+        self.codec = codec
+        self.workers = workers or os.cpu_count()
+        self._tmp_path = f'{path_to_zip}.tmp'
+        self.zip_file = zipfile.ZipFile(self._tmp_path, 'w', allowZip64=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @profiling.profiled()
+    def add(self, name: str, data: bytes) -> str:
+        arcname = f'{name}{EXTENSIONS[self.codec]}'
+        self._pending.append((arcname, self._executor.submit(encode, data, self.codec)))
+        # keep a bounded number of encoded members in memory
+        while len(self._pending) > 2 * self.workers:
+            self._write_next()
+        return arcname
+
+    def _write_next(self):
+        arcname, future = self._pending.popleft()
+        write_precompressed(self.zip_file, arcname, *future.result())
+
+    def writestr(self, arcname: str, data):
+        self.flush()
+        self.zip_file.writestr(arcname, data, compress_type=zipfile.ZIP_DEFLATED)
+
+    def writefile(self, arcname: str, file_, chunk_size: int = 2 ** 20):
+        self.flush()
+        zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        # NB: size is unknown upfront => always reserve zip64 fields
+        with self.zip_file.open(zinfo, 'w', force_zip64=True) as dest:
+            while True:
+                chunk = file_.read(chunk_size)
+                if not chunk:
+                    break
+                dest.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+    def flush(self):
+        while self._pending:
+            self._write_next()
+
+    @profiling.profiled()
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+        self.zip_file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """
+        Drop the archive being written, leaving the existing one (if any) untouched.
+        """
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        self.zip_file.close()
+        os.unlink(self._tmp_path)
@@ -0,0 +1,100 @@
+import struct
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+# layout: header, then one fixed-size record per bucket, then fragments (id, frames, tokens) grouped by bucket
+BUCKETS_MAGIC = b'TSBK'
+BUCKETS_VERSION = 1
+BUCKETS_HEADER = struct.Struct('<4sHxxfII')  # magic, version, bucket width, buckets count, fragments count
+BUCKET_RECORD = struct.Struct('<fIIQQ')  # min duration, first fragment, fragments count, total frames, total tokens
+# NB: default of `Dataset.buckets` too => index written at release time is used as is
+DEFAULT_BUCKET_WIDTH = 1.
+FRAGMENT_DTYPE = np.dtype([('id', '<u4'), ('frames', '<u4'), ('tokens', '<u4')])
+
+Bucket = namedtuple('Bucket', ['min_duration', 'first', 'count', 'total_frames', 'total_tokens'])
+
+
+def count_tokens(text: str) -> int:
+    # NB: models are trained on characters
+    return len(text)
+
+
+class BucketIndexWriter:
+    """
+    Collect (frames, tokens) of release fragments, in release order, then write them grouped by duration bucket.
+    """
+
+    def __init__(self, rate: int, bucket_width: float = DEFAULT_BUCKET_WIDTH):
+        self.rate = rate
+        self.bucket_width = bucket_width
+        self._frames = array('I')
+        self._tokens = array('I')
+
+    def __len__(self):
+        return len(self._frames)
+
+    def add(self, frames: int, text: str) -> int:
+        self._frames.append(frames)
+        self._tokens.append(count_tokens(text))
+        return len(self._frames) - 1
+
+    def to_bytes(self) -> bytes:
+        fragments = np.zeros(len(self._frames), dtype=FRAGMENT_DTYPE)
+        fragments['id'] = np.arange(len(self._frames))
+        fragments['frames'] = np.frombuffer(self._frames, dtype=np.uint32)
+        fragments['tokens'] = np.frombuffer(self._tokens, dtype=np.uint32)
+        buckets = (fragments['frames'] / (self.rate * self.bucket_width)).astype(np.int64)
+        # NB: stable sort => fragments of a bucket are sorted by duration then release order
+        fragments = fragments[np.lexsort((fragments['frames'], buckets))]
+        buckets = np.sort(buckets)
+
+        records = []
+        for bucket in np.unique(buckets):
+            first, last = np.searchsorted(buckets, bucket, 'left'), np.searchsorted(buckets, bucket, 'right')
+            records.append(BUCKET_RECORD.pack(
+                bucket * self.bucket_width,
+                first,
+                last - first,
+                int(fragments['frames'][first:last].sum()),
+                int(fragments['tokens'][first:last].sum()),
+            ))
+        header = BUCKETS_HEADER.pack(BUCKETS_MAGIC, BUCKETS_VERSION, self.bucket_width, len(records), len(fragments))
+        return header + b''.join(records) + fragments.tobytes()
+
+
+class BucketIndex:
+    """
+    Read a bucket index: bucket i and its fragments are found in O(1) without scanning the release.
+    """
+
+    def __init__(self, buffer):
+        magic, version, self.bucket_width, self.count, fragments_count = BUCKETS_HEADER.unpack_from(buffer, 0)
+        assert magic == BUCKETS_MAGIC, 'not a bucket index'
+        assert version == BUCKETS_VERSION, f'unsupported bucket index version {version}'
+        self._buffer = buffer
+        self._fragments = np.frombuffer(
+            buffer, dtype=FRAGMENT_DTYPE, count=fragments_count,
+            offset=BUCKETS_HEADER.size + self.count * BUCKET_RECORD.size,
+        )
+
+    @classmethod
+    def read(cls, path_to_index: str) -> 'BucketIndex':
+        with open(path_to_index, 'rb') as f:
+            return cls(f.read())
+
+    def __len__(self):
+        return self.count
+
+    def bucket(self, i: int) -> Bucket:
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return Bucket(*BUCKET_RECORD.unpack_from(self._buffer, BUCKETS_HEADER.size + i * BUCKET_RECORD.size))
+
+    def fragments(self, i: int) -> np.ndarray:
+        """
+        Return (id, frames, tokens) of the fragments of bucket i, sorted by duration.
+        """
+        bucket = self.bucket(i)
+        return self._fragments[bucket.first:bucket.first + bucket.count]
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+from datetime import timedelta
+from typing import List
+
+from training_speech import utils
+from training_speech.source import read_sources
+
+CURRENT_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '../data'))
+# NB: bump whenever the schema changes => catalog is rebuilt from alignments
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    mtime_ns INTEGER,
+    size INTEGER,
+    speaker TEXT,
+    language TEXT
+);
+CREATE TABLE IF NOT EXISTS fragments (
+    source TEXT NOT NULL REFERENCES sources(name) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    -- NB: untyped so that values are returned as they are in alignments (ie. 0 vs 0.0)
+    "begin",
+    "end",
+    duration REAL NOT NULL,
+    -- NB: NULL when the flag is missing from the alignment fragment
+    approved INTEGER,
+    disabled INTEGER,
+    warn INTEGER,
+    text TEXT NOT NULL,
+    speaker TEXT,
+    language TEXT,
+    extra TEXT,
+    PRIMARY KEY (source, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fragments_duration ON fragments (approved, duration);
+CREATE INDEX IF NOT EXISTS fragments_speaker ON fragments (speaker, approved);
+CREATE INDEX IF NOT EXISTS fragments_language ON fragments (language, approved);
+"""
+COLUMNS = ('begin', 'end', 'approved', 'disabled', 'warn', 'text')
+
+
+def fragment_row(source: str, idx: int, fragment: dict, speaker: str, language: str) -> tuple:
+    extra = {key: value for key, value in fragment.items() if key not in COLUMNS}
+    return (
+        source, idx, fragment['begin'], fragment['end'], fragment['end'] - fragment['begin'],
+        fragment.get('approved'), fragment.get('disabled'), fragment.get('warn'),
+        fragment['text'], speaker, language, json.dumps(extra) if extra else None,
+    )
+
+
+def row_fragment(row: sqlite3.Row) -> dict:
+    """
+    Rebuild an alignment fragment (ie. as stored in data/alignments/) from a `fragments` row.
+    """
+    fragment = dict(begin=row['begin'], end=row['end'], text=row['text'])
+    for flag in ('approved', 'disabled', 'warn'):
+        if row[flag] is not None:
+            fragment[flag] = bool(row[flag])
+    if row['extra']:
+        fragment.update(json.loads(row['extra']))
+    return fragment
+
+
+class Catalog:
+    """
+    SQLite index of the fragments of every source, synced from alignment files (only the modified ones are reloaded).
+
+        with Catalog() as catalog:
+            catalog.query('SELECT speaker, SUM(duration) / 3600 FROM fragments WHERE approved GROUP BY speaker')
+    """
+
+    def __init__(self, path: str = None, path_to_alignments: str = None, sync: bool = True):
+        self.path = path or os.path.join(utils.CACHE_DIR, 'catalog.sqlite')
+        self.path_to_alignments = path_to_alignments or os.path.join(DATA_DIR, 'alignments')
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        version, = self.connection.execute('PRAGMA user_version').fetchone()
+        if version != SCHEMA_VERSION:
+            with self.connection:
+                self.connection.execute('DROP TABLE IF EXISTS fragments')
+                self.connection.execute('DROP TABLE IF EXISTS sources')
+                self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.connection.executescript(SCHEMA)
+        if sync:
+            self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def sync(self, sources: dict = None) -> List[str]:
+        """
+        Reload alignments modified since last sync, return the names of the reloaded sources.
+        """
+        sources = read_sources() if sources is None else sources
+        known = {
+            row['name']: (row['mtime_ns'], row['size'], row['speaker'], row['language'])
+            for row in self.connection.execute('SELECT * FROM sources')
+        }
+        reloaded = []
+        with self.connection:
+            for name in set(known) - set(sources):
+                self.connection.execute('DELETE FROM sources WHERE name = ?', (name,))
+            for name, metadata in sources.items():
+                path_to_alignment = os.path.join(self.path_to_alignments, f'{name}.json')
+                try:
+                    stat = os.stat(path_to_alignment)
+                    state = (stat.st_mtime_ns, stat.st_size, metadata.get('speaker'), metadata.get('language'))
+                except FileNotFoundError:
+                    state = (None, None, metadata.get('speaker'), metadata.get('language'))
+                if known.get(name) == state:
+                    continue
+                self._load(name, path_to_alignment if state[0] is not None else None, state)
+                reloaded.append(name)
+        return reloaded
+
+    def _load(self, name: str, path_to_alignment: str, state: tuple):
+        mtime_ns, size, speaker, language = state
+        self.connection.execute('DELETE FROM fragments WHERE source = ?', (name,))
+        self.connection.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)', (name, mtime_ns, size, speaker, language))
+        if path_to_alignment is None:
+            return
+        with open(path_to_alignment) as f:
+            alignment = json.load(f)
+        self.connection.executemany(
+            'INSERT INTO fragments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (fragment_row(name, i, fragment, speaker, language) for i, fragment in enumerate(alignment)),
+        )
+
+    def query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        return self.connection.execute(sql, params).fetchall()
+
+    def fragments(self, source: str = None, approved: bool = None, min_duration: float = None,
+                  max_duration: float = None, speaker: str = None, language: str = None) -> List[sqlite3.Row]:
+        """
+        Return matching `fragments` rows, in alignment order. See `row_fragment` to get alignment fragments back.
+        """
+        conditions, params = [], []
+        for column, operator, value in (
+            ('source', '=', source),
+            ('IFNULL(approved, 0)', '=', approved),
+            ('duration', '>=', min_duration),
+            ('duration', '<=', max_duration),
+            ('speaker', '=', speaker),
+            ('language', '=', language),
+        ):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self.query(f'SELECT * FROM fragments {where} ORDER BY source, idx', params)
+
+    def source_info(self, name: str) -> dict:
+        """
+        Same as `training_speech.source_info` without reading the alignment.
+        """
+        row = self.connection.execute("""
+            SELECT TOTAL(duration) AS todo_dur,
+                   TOTAL(CASE WHEN approved THEN duration END) AS approved_dur,
+                   TOTAL(CASE WHEN disabled THEN duration END) AS disabled_dur,
+                   SUM(approved) AS approved_count
+            FROM fragments WHERE source = ?
+        """, (name,)).fetchone()
+        source = self.connection.execute('SELECT mtime_ns FROM sources WHERE name = ?', (name,)).fetchone()
+        if source is None or source['mtime_ns'] is None:
+            return dict(status='PENDING', progress=0., approved_duration=timedelta(seconds=0.), approved_count=0)
+        remaining_dur = round(row['todo_dur'] - row['approved_dur'] - row['disabled_dur'], 3)
+        return dict(
+            status='WIP' if remaining_dur > 0 else 'DONE',
+            progress=(row['approved_dur'] + row['disabled_dur']) / row['todo_dur'] if remaining_dur > 0 else 1.,
+            approved_duration=timedelta(seconds=row['approved_dur']),
+            approved_count=row['approved_count'] or 0,
+        )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,217 @@
+import csv
+import io
+import mmap
+import os
+import random
+import struct
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from training_speech import ffmpeg, shards, wav, features, buckets
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s22sHH')  # signature, ..., file name length, extra field length
+
+
+class Dataset:
+    """
+    Random access to the (samples, text) pairs of a release, either a zip archive or a directory of shards.
+    Payloads are read from memory-mapped files, only deflated and flac fragments need to be decoded.
+
+    With `num_workers` > 1, each worker only sees its share of the release (whole shards when possible).
+    """
+
+    def __init__(self, path_to_release: str, dtype: str = 'int16', worker_id: int = 0, num_workers: int = 1):
+        assert dtype in {'int16', 'float32'}, f'unsupported dtype {dtype}'
+        assert 0 <= worker_id < num_workers
+        self.path = path_to_release
+        self.dtype = dtype
+        self._readers = []
+        self.features_params = None
+        self._feature_readers = {}
+        self.bucket_index = None
+        self._mmap = None
+        self._file = None
+        # one (reader, position or (compress_type, offset, length)) per fragment
+        self._items = []
+        self.durations = []
+        self.texts = []
+
+        # NB: bucket index refers to the whole release, not to the share of a worker
+        whole_release = num_workers == 1
+        if os.path.isdir(path_to_release):
+            path_to_shards = shards.list_shards(path_to_release)
+            self.features_params = shards.read_manifest(path_to_release).get('features')
+            if whole_release and os.path.isfile(os.path.join(path_to_release, 'buckets.idx')):
+                self.bucket_index = buckets.BucketIndex.read(os.path.join(path_to_release, 'buckets.idx'))
+            if len(path_to_shards) >= num_workers:
+                path_to_shards, worker_id, num_workers = path_to_shards[worker_id::num_workers], 0, 1
+            self._load_shards(path_to_shards)
+        else:
+            self._load_zip(path_to_release, whole_release)
+
+        if num_workers > 1:
+            self._items = self._items[worker_id::num_workers]
+            self.durations = self.durations[worker_id::num_workers]
+            self.texts = self.texts[worker_id::num_workers]
+        self.durations = np.array(self.durations, dtype=np.float32)
+
+    def _load_shards(self, path_to_shards: List[str]):
+        for path_to_shard in path_to_shards:
+            reader = shards.ShardReader(path_to_shard)
+            self._readers.append(reader)
+            if self.features_params is not None:
+                self._feature_readers[path_to_shard] = features.FeatureReader(path_to_shard, self.features_params)
+            for i in range(len(reader)):
+                _, _, duration, _, text = reader.record(i)
+                self._items.append((reader, i))
+                self.durations.append(duration)
+                self.texts.append(text)
+
+    def _load_zip(self, path_to_zip: str, load_index: bool = True):
+        with zipfile.ZipFile(path_to_zip) as zip_file:
+            infos = zip_file.NameToInfo
+            with zip_file.open('data.csv') as f:
+                rows = list(csv.DictReader(io.TextIOWrapper(f, encoding='utf-8')))
+            if load_index and 'buckets.idx' in infos:
+                self.bucket_index = buckets.BucketIndex(zip_file.read('buckets.idx'))
+        self._file = open(path_to_zip, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        for row in rows:
+            info = infos[row['path']]
+            signature, _, name_length, extra_length = ZIP_LOCAL_HEADER.unpack_from(self._mmap, info.header_offset)
+            assert signature == b'PK\x03\x04', f'bad local header for {info.filename}'
+            offset = info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+            self._items.append((None, (info.compress_type, offset, info.compress_size)))
+            self.durations.append(float(row['duration']))
+            self.texts.append(row['text'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._items)
+
+    def payload(self, i: int):
+        """
+        Return the i-th fragment as a wav or flac file.
+        """
+        reader, location = self._items[i]
+        if reader is not None:
+            if reader.codec == 'deflate':
+                return reader.payload(location)
+            return reader[location].data
+        compress_type, offset, length = location
+        data = memoryview(self._mmap)[offset:offset + length]
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -15)
+        assert compress_type == zipfile.ZIP_STORED, f'unsupported compression {compress_type}'
+        return data
+
+    def __getitem__(self, i: int) -> Tuple[np.ndarray, str]:
+        data = self.payload(i)
+        if bytes(data[:4]) == b'fLaC':
+            data = ffmpeg.decode_flac(bytes(data))
+        rate, channels, sampwidth, offset, data_size = wav.parse_header(data)
+        assert sampwidth == 2, f'unsupported sample width {sampwidth}'
+        samples = np.frombuffer(data, dtype='<i2', count=data_size // 2, offset=offset)
+        if self.dtype == 'float32':
+            samples = samples.astype(np.float32) / 32768
+        return samples, self.texts[i]
+
+    def features(self, i: int, kind: str = 'logmel') -> np.ndarray:
+        """
+        Return the (frames, dims) float16 features precomputed at release time (see `features_params`).
+        """
+        assert self.features_params is not None, f'{self.path} has no precomputed features'
+        reader, location = self._items[i]
+        return self._feature_readers[reader.path].get(location, kind)
+
+    def batches(self, batch_size: int = 32, max_duration: float = None, bucket_width: float = buckets.DEFAULT_BUCKET_WIDTH,
+                shuffle: bool = False, seed: int = None) -> Iterator[List[Tuple[np.ndarray, str]]]:
+        """
+        Yield batches of fragments of similar duration (ie. within `bucket_width` seconds), so that padding is minimal.
+        Batches hold up to `batch_size` fragments and, if provided, up to `max_duration` seconds of audio.
+        """
+        for indices in self.batch_indices(batch_size, max_duration, bucket_width, shuffle, seed):
+            yield [self[i] for i in indices]
+
+    def batch_indices(self, batch_size: int = 32, max_duration: float = None, bucket_width: float = buckets.DEFAULT_BUCKET_WIDTH,
+                      shuffle: bool = False, seed: int = None) -> List[List[int]]:
+        rng = random.Random(seed)
+        batches = []
+        for indices in self.buckets(bucket_width):
+            if shuffle:
+                rng.shuffle(indices)
+            batch, batch_duration = [], 0.
+            for i in indices:
+                if batch and (len(batch) >= batch_size or
+                              (max_duration is not None and batch_duration + self.durations[i] > max_duration)):
+                    batches.append(batch)
+                    batch, batch_duration = [], 0.
+                batch.append(i)
+                batch_duration += self.durations[i]
+            if batch:
+                batches.append(batch)
+        if shuffle:
+            rng.shuffle(batches)
+        return batches
+
+    def buckets(self, bucket_width: float = buckets.DEFAULT_BUCKET_WIDTH) -> List[List[int]]:
+        """
+        Return fragment indices grouped by duration bucket, read from the release bucket index when available.
+        """
+        if self.bucket_index is not None and abs(self.bucket_index.bucket_width - bucket_width) < 1e-6:
+            return [self.bucket_index.fragments(i)['id'].tolist() for i in range(len(self.bucket_index))]
+
+        groups = {}
+        for i, duration in enumerate(self.durations):
+            groups.setdefault(int(duration // bucket_width), []).append(i)
+        return [groups[bucket] for bucket in sorted(groups)]
+
+    def close(self):
+        for reader in self._readers:
+            reader.close()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # some fragments are still referenced => mapping will be released with them
+                pass
+            self._file.close()
+
+
+def benchmark(dataset: Dataset, limit: int = None) -> float:
+    """
+    Return the number of samples read per second.
+    """
+    count = min(len(dataset), limit or len(dataset))
+    start = time.perf_counter()
+    for i in range(count):
+        dataset[i]
+    return count / (time.perf_counter() - start)
+
+
+def _benchmark_worker(path_to_release: str, dtype: str, worker_id: int, num_workers: int, limit: int = None) -> float:
+    with Dataset(path_to_release, dtype=dtype, worker_id=worker_id, num_workers=num_workers) as dataset:
+        return benchmark(dataset, limit=limit)
+
+
+def benchmark_release(path_to_release: str, dtype: str = 'int16', num_workers: int = 1, limit: int = None) -> float:
+    """
+    Return the number of samples read per second by `num_workers` processes sharing the release.
+    """
+    if num_workers == 1:
+        return _benchmark_worker(path_to_release, dtype, 0, 1, limit)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return sum(executor.map(
+            _benchmark_worker,
+            *zip(*[(path_to_release, dtype, worker_id, num_workers, limit) for worker_id in range(num_workers)])
+        ))
@@ -28,3 +28,31 @@ class SplitException(Exception):
 
 class ToggleFastModeException(Exception):
     pass
+
+
+class ToolError(Exception):
+    def __init__(self, args: List[str], returncode: int = None, stderr: bytes = b'', timeout: float = None):
+        self.args_ = list(args)
+        self.returncode = returncode
+        self.stderr = stderr.decode(errors='replace') if isinstance(stderr, bytes) else (stderr or '')
+        self.timeout = timeout
+        super().__init__(str(self))
+
+    def __str__(self):
+        command = ' '.join(self.args_)
+        if self.timeout is not None:
+            return f'`{command}` timed out after {self.timeout}s'
+        details = self.stderr.strip().splitlines()[-5:]
+        return f'`{command}` exited with {self.returncode}' + ''.join(f'\n  {line}' for line in details)
+
+
+class MemoryLimitExceeded(Exception):
+    def __init__(self, limit: int, rss: int, stages: List[str]):
+        self.limit = limit
+        self.rss = rss
+        self.stages = list(stages)
+        super().__init__(str(self))
+
+    def __str__(self):
+        where = ' > '.join(self.stages) or 'no tracked stage'
+        return f'memory usage reached {self.rss / 2 ** 20:.0f}MB (limit is {self.limit / 2 ** 20:.0f}MB) during {where}'
@@ -0,0 +1,138 @@
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+from training_speech import wav
+
+KINDS = ('logmel', 'mfcc')
+DEFAULT_PARAMS = dict(
+    n_fft=512,
+    win_length=400,  # 25ms @ 16kHz
+    hop_length=160,  # 10ms @ 16kHz
+    n_mels=80,
+    n_mfcc=13,
+    fmin=0.,
+    fmax=None,
+    preemphasis=0.97,
+)
+
+
+def hz_to_mel(f):
+    return 2595 * np.log10(1 + np.asarray(f) / 700)
+
+
+def mel_to_hz(m):
+    return 700 * (10 ** (np.asarray(m) / 2595) - 1)
+
+
+@lru_cache(maxsize=8)
+def mel_filterbank(rate: int, n_fft: int, n_mels: int, fmin: float = 0., fmax: float = None) -> np.ndarray:
+    fmax = fmax or rate / 2
+    points = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+    bins = np.linspace(0, rate / 2, n_fft // 2 + 1)
+    lower, center, upper = points[:-2, None], points[1:-1, None], points[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0, np.minimum(rising, falling)).astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def dct_matrix(n_mfcc: int, n_mels: int) -> np.ndarray:
+    # orthonormal DCT-II
+    k, n = np.arange(n_mfcc)[:, None], np.arange(n_mels)[None, :]
+    matrix = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2 / n_mels)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def frames(samples: np.ndarray, win_length: int, hop_length: int) -> np.ndarray:
+    if len(samples) < win_length:
+        samples = np.pad(samples, (0, win_length - len(samples)), mode='constant')
+    count = 1 + (len(samples) - win_length) // hop_length
+    stride, = samples.strides
+    return np.lib.stride_tricks.as_strided(samples, shape=(count, win_length), strides=(stride * hop_length, stride))
+
+
+def log_mel(samples: np.ndarray, rate: int, params: dict = None) -> np.ndarray:
+    """
+    Return a (frames, n_mels) log-mel spectrogram of float32 `samples`.
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    if params['preemphasis']:
+        samples = np.append(samples[:1], samples[1:] - params['preemphasis'] * samples[:-1])
+    windows = frames(samples, params['win_length'], params['hop_length']) * np.hamming(params['win_length']).astype(np.float32)
+    power = np.abs(np.fft.rfft(windows, n=params['n_fft'])) ** 2
+    filterbank = mel_filterbank(rate, params['n_fft'], params['n_mels'], params['fmin'], params['fmax'])
+    return np.log(np.maximum(power @ filterbank.T, 1e-10)).astype(np.float32)
+
+
+def mfcc(log_mel_: np.ndarray, n_mfcc: int = DEFAULT_PARAMS['n_mfcc']) -> np.ndarray:
+    return log_mel_ @ dct_matrix(n_mfcc, log_mel_.shape[1]).T
+
+
+def extract(data: bytes, params: dict = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return float16 (log-mel, mfcc) of a 16 bits wav file.
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    rate, channels, sampwidth, offset, data_size = wav.parse_header(data)
+    assert channels == 1 and sampwidth == 2, 'only mono 16 bits wav are supported'
+    samples = np.frombuffer(data, dtype='<i2', count=data_size // 2, offset=offset).astype(np.float32) / 32768
+    features = log_mel(samples, rate, params)
+    return features.astype(np.float16), mfcc(features, params['n_mfcc']).astype(np.float16)
+
+
+def feature_paths(path_to_shard: str) -> dict:
+    paths = {kind: f'{path_to_shard}.{kind}.f16' for kind in KINDS}
+    paths['frames'] = f'{path_to_shard}.frames.npy'
+    return paths
+
+
+class FeatureWriter:
+    """
+    Append features of consecutive fragments of a shard to raw float16 files,
+    fragment boundaries being saved (as frame offsets) on close.
+    """
+
+    def __init__(self, path_to_shard: str):
+        self.paths = feature_paths(path_to_shard)
+        self._files = {kind: open(self.paths[kind], 'wb') for kind in KINDS}
+        self._offsets = [0]
+
+    def append(self, log_mel_: np.ndarray, mfcc_: np.ndarray):
+        assert len(log_mel_) == len(mfcc_)
+        self._files['logmel'].write(np.ascontiguousarray(log_mel_, dtype=np.float16).tobytes())
+        self._files['mfcc'].write(np.ascontiguousarray(mfcc_, dtype=np.float16).tobytes())
+        self._offsets.append(self._offsets[-1] + len(log_mel_))
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        np.save(self.paths['frames'], np.array(self._offsets, dtype=np.int64))
+
+
+class FeatureReader:
+    """
+    Memory-mapped access to the features of the fragments of a shard.
+    """
+
+    def __init__(self, path_to_shard: str, params: dict):
+        paths = feature_paths(path_to_shard)
+        self.offsets = np.load(paths['frames'])
+        dims = dict(logmel=params['n_mels'], mfcc=params['n_mfcc'])
+        self._arrays = {
+            kind: np.memmap(paths[kind], dtype=np.float16, mode='r', shape=(int(self.offsets[-1]), dims[kind]))
+            if self.offsets[-1] else np.zeros((0, dims[kind]), dtype=np.float16)
+            for kind in KINDS
+        }
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, i: int, kind: str = 'logmel') -> np.ndarray:
+        return self._arrays[kind][self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.get(i, 'logmel'), self.get(i, 'mfcc')
+
@@ -1,12 +1,11 @@
-import json
 import os
 import re
-import subprocess
 from typing import List, Tuple, Iterator
 
-from training_speech import sox, utils
+from training_speech import sox, utils, runner, profiling, memory
 
 
+@profiling.profiled()
 def convert(from_: str, to: str, rate: int=None, channels: int=None, loglevel='quiet'):
     options = ' '
     if rate is not None:
@@ -15,10 +14,40 @@ def convert(from_: str, to: str, rate: int=None, channels: int=None, loglevel='q
         options += f'-ac {channels} '
     if loglevel:
         options += f'-loglevel {loglevel} '
-    retcode = subprocess.call(f'ffmpeg -y -i {from_}{options}{to}'.split(' '))
-    assert retcode == 0
-
-
+    runner.run(f'ffmpeg -y -i {from_}{options}{to}'.split(' '))
+
+
+def decoded_path(file_hash: str, rate: int, channels: int = 1) -> str:
+    return os.path.join(utils.CACHE_DIR, f'{file_hash}_{rate}_{channels}.wav')
+
+
+@profiling.profiled()
+@memory.tracked()
+def decode(from_: str, file_hash: str, rates: List[int], channels: List[int] = (1,), force=False, loglevel='quiet') -> dict:
+    """
+    Decode `from_` once and write a wav per (rate, channels), cached from the source digest.
+    Return paths by (rate, channels).
+    """
+    paths = {
+        (rate, channels_): decoded_path(file_hash, rate, channels_)
+        for rate in rates
+        for channels_ in channels
+    }
+    missing = {key: path for key, path in paths.items() if force or not os.path.isfile(path)}
+    if missing:
+        # NB: a single ffmpeg graph => input is decoded once and resampled for every output
+        args = ['ffmpeg', '-y', '-i', from_]
+        if loglevel:
+            args += ['-loglevel', loglevel]
+        for (rate, channels_), path in missing.items():
+            args += ['-ar', str(rate), '-ac', str(channels_), f'{path}.tmp.wav']
+        runner.run(args)
+        for path in missing.values():
+            os.replace(f'{path}.tmp.wav', path)
+    return paths
+
+
+@profiling.profiled()
 def cut(input_path: str, output_path: str, from_: float=None, to: float=None, loglevel='quiet'):
     assert os.path.abspath(input_path) != os.path.abspath(output_path)
     if from_ is not None and to is not None:
@@ -32,44 +61,44 @@ def cut(input_path: str, output_path: str, from_: float=None, to: float=None, lo
         options += f'-to {to} '
     if loglevel:
         options += f'-loglevel {loglevel} '
-    subprocess.call(f'ffmpeg -y -i {input_path}{options}-c copy {output_path}'.split(' '))
+    runner.run(f'ffmpeg -y -i {input_path}{options}-c copy {output_path}'.split(' '))
 
 
 SILENCE_END_DUR_REG = re.compile(r'^.*?silence_end:\s*(-?\d+\.?\d*)\s*\|\s*silence_duration:\s*(-?\d+\.?\d*)$')
 SILENCE_START_REG = re.compile(r'^.*?silence_start:\s*(-?\d+\.?\d*)\s*$')
 
 
+@profiling.profiled()
 def audio_duration(input_path: str) -> float:
     assert os.path.isfile(input_path), f'no such file {input_path}'
     input_path = os.path.abspath(input_path)
 
-    duration = subprocess.check_output([
+    duration = runner.run([
         'ffprobe', '-i', input_path,
         '-show_entries', 'format=duration', '-v', 'quiet', '-of', 'csv=%s' % "p=0"
-    ])
+    ]).stdout
 
     return float(duration)
 
 
-def list_silences(input_path: str, noise_level: int=-50, min_duration: float=0.05, force=False, merge=True) -> List[Tuple[float, float]]:
-    with open(input_path, 'rb') as f:
-        audio_hash = utils.hash_file(f)
-
-
+@profiling.profiled()
+def detect_silences(input_path: str, noise_level: int=-50, min_duration: float=0.05, margin=0.06001, merge=True,
+                    audio_hash: str = None) -> List[Tuple[float, float]]:
+    """
+    Uncached, see `silence.list_silences`. mp3 files are converted once to a wav named after `audio_hash`.
+    """
     if utils.file_extension(input_path) == '.mp3':
+        if audio_hash is None:
+            with open(input_path, 'rb') as f:
+                audio_hash = utils.hash_file(f)
         path_to_wav = os.path.join(utils.CACHE_DIR, f'{audio_hash}.wav')
-        convert(input_path, path_to_wav)
+        if not os.path.isfile(path_to_wav):
+            convert(input_path, f'{path_to_wav}.tmp.wav')
+            os.replace(f'{path_to_wav}.tmp.wav', path_to_wav)
         input_path = path_to_wav
 
-    cached_path = os.path.join(utils.CACHE_DIR, f'silences_{audio_hash}_{noise_level}_{min_duration}.json')
-    if not force and os.path.isfile(cached_path):
-        with open(cached_path) as f:
-            return json.load(f)
-
-    p = subprocess.Popen(
+    process = runner.run(
         f'ffmpeg -i {input_path} -af silencedetect=noise={noise_level}dB:d={min_duration} -f null -'.split(' '),
-        stderr=subprocess.PIPE,
-        stdout=subprocess.PIPE,
     )
 
     def parse_lines(lines: List[bytes]) -> Iterator[Tuple[float, float]]:
@@ -92,13 +121,22 @@ def list_silences(input_path: str, noise_level: int=-50, min_duration: float=0.0
         if last_silence_start:
             yield round(last_silence_start, 3), round(audio_duration(input_path), 3)
 
-    original = list(parse_lines(p.stderr.readlines()))
+    original = list(parse_lines(process.stderr.splitlines()))
 
     result = [
         (round(s, 3), round(e, 3))
-        for s, e in (utils.merge_overlaps(original) if merge else original)
+        for s, e in (utils.merge_overlaps(original, margin=margin) if merge else original)
     ]
-    with open(cached_path, 'w') as f:
-        json.dump(result, f)
 
     return result
+
+
+@profiling.profiled()
+def encode_flac(wav: bytes, loglevel='quiet') -> bytes:
+    # NB: wav is read from stdin and flac written to stdout => no temporary files
+    return runner.run(f'ffmpeg -f wav -i - -loglevel {loglevel} -f flac -'.split(' '), input=wav).stdout
+
+
+@profiling.profiled()
+def decode_flac(flac: bytes, loglevel='quiet') -> bytes:
+    return runner.run(f'ffmpeg -f flac -i - -loglevel {loglevel} -f wav -'.split(' '), input=flac).stdout
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import struct
+import threading
+from collections import namedtuple
+from typing import Callable, Iterator
+
+from training_speech import utils, wav, profiling
+
+INDEX_RECORD = struct.Struct('<20sIQQIHH')  # key, pack, offset, length, rate, channels, sample width
+DEFAULT_PACK_SIZE = 2 ** 28
+
+Location = namedtuple('Location', ['pack', 'offset', 'length', 'rate', 'channels', 'sampwidth'])
+
+
+def fragment_key(file_hash: str, begin: float, end: float, rate: int) -> bytes:
+    return hashlib.sha1(f'{file_hash}:{begin:.3f}:{end:.3f}:{rate}'.encode()).digest()
+
+
+class FragmentStore:
+    """
+    Content-addressed store of fragments PCM, packed into append-only files instead of one wav per fragment.
+    The index is an append-only log of fixed-size records, last record of a key wins.
+    """
+
+    def __init__(self, path: str = None, pack_size: int = DEFAULT_PACK_SIZE):
+        self.path = path = path or os.path.join(utils.CACHE_DIR, 'fragments')
+        self.pack_size = pack_size
+        self._lock = threading.Lock()
+        self._index = {}
+        self._handles = {}
+        os.makedirs(path, exist_ok=True)
+        self._path_to_index = os.path.join(path, 'index.bin')
+        self._load_index()
+        self._pack = max((
+            int(name[len('pack_'):-len('.pcm')]) for name in os.listdir(path)
+            if name.startswith('pack_') and name.endswith('.pcm')
+        ), default=0)
+        self._index_file = open(self._path_to_index, 'ab')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._index
+
+    def _load_index(self):
+        if not os.path.isfile(self._path_to_index):
+            return
+        with open(self._path_to_index, 'rb') as f:
+            data = f.read()
+        # NB: a partially written record (ie. killed while appending) is dropped
+        valid_size = len(data) - len(data) % INDEX_RECORD.size
+        for key, *location in INDEX_RECORD.iter_unpack(data[:valid_size]):
+            self._index[key] = Location(*location)
+        if valid_size != len(data):
+            with open(self._path_to_index, 'r+b') as f:
+                f.truncate(valid_size)
+
+    def _pack_path(self, pack: int) -> str:
+        return os.path.join(self.path, f'pack_{pack:05d}.pcm')
+
+    def _handle(self, pack: int):
+        if pack not in self._handles:
+            self._handles[pack] = open(self._pack_path(pack), 'a+b')
+        return self._handles[pack]
+
+    def get(self, key: bytes):
+        """
+        Return (samples, location) or None if `key` is not stored.
+        """
+        location = self._index.get(key)
+        if location is None:
+            return None
+        with self._lock:
+            fd = self._handle(location.pack).fileno()
+        return os.pread(fd, location.length, location.offset), location
+
+    def put(self, key: bytes, data, rate: int, channels: int = 1, sampwidth: int = 2) -> Location:
+        with self._lock:
+            f = self._handle(self._pack)
+            f.seek(0, os.SEEK_END)
+            if f.tell() and f.tell() + len(data) > self.pack_size:
+                self._pack += 1
+                f = self._handle(self._pack)
+            offset = f.tell()
+            f.write(data)
+            f.flush()
+            location = Location(self._pack, offset, len(data), rate, channels, sampwidth)
+            # NB: data is written before being indexed => index never points to missing data
+            self._index_file.write(INDEX_RECORD.pack(key, *location))
+            self._index_file.flush()
+            self._index[key] = location
+            return location
+
+    def keys(self) -> Iterator[bytes]:
+        return iter(list(self._index))
+
+    def stats(self) -> dict:
+        packs = sorted({location.pack for location in self._index.values()})
+        total_size = sum(
+            os.path.getsize(self._pack_path(pack))
+            for pack in range(self._pack + 1)
+            if os.path.isfile(self._pack_path(pack))
+        )
+        live_size = sum(location.length for location in self._index.values())
+        return dict(fragments=len(self._index), packs=len(packs), size=total_size, dead_size=total_size - live_size)
+
+    def compact(self, keep: Callable[[bytes], bool] = None) -> int:
+        """
+        Rewrite live fragments (those `keep` accepts, if provided) into new packs, then remove old packs and index.
+        Return the number of bytes reclaimed.
+        """
+        size_before = self.stats()['size']
+        with self._lock:
+            self._index_file.close()
+            old_packs = set(range(self._pack + 1))
+            new_pack = self._pack + 1
+            new_index = {}
+            new_file = open(self._pack_path(new_pack), 'wb')
+            with open(f'{self._path_to_index}.tmp', 'wb') as index_file:
+                # NB: copy in pack order => sequential reads
+                for key, location in sorted(self._index.items(), key=lambda item: item[1][:2]):
+                    if keep is not None and not keep(key):
+                        continue
+                    if new_file.tell() and new_file.tell() + location.length > self.pack_size:
+                        new_file.close()
+                        new_pack += 1
+                        new_file = open(self._pack_path(new_pack), 'wb')
+                    data = os.pread(self._handle(location.pack).fileno(), location.length, location.offset)
+                    new_location = location._replace(pack=new_pack, offset=new_file.tell())
+                    new_file.write(data)
+                    index_file.write(INDEX_RECORD.pack(key, *new_location))
+                    new_index[key] = new_location
+            new_file.close()
+            os.replace(f'{self._path_to_index}.tmp', self._path_to_index)
+
+            for handle in self._handles.values():
+                handle.close()
+            self._handles = {}
+            for pack in old_packs:
+                if os.path.isfile(self._pack_path(pack)):
+                    os.unlink(self._pack_path(pack))
+            self._index = new_index
+            self._pack = new_pack
+            self._index_file = open(self._path_to_index, 'ab')
+        return size_before - self.stats()['size']
+
+    def close(self):
+        with self._lock:
+            self._index_file.close()
+            for handle in self._handles.values():
+                handle.close()
+            self._handles = {}
+
+
+@profiling.profiled()
+def cut_fragment_audio(store: FragmentStore, file_hash: str, fragment: dict, rate: int,
+                       open_pcm: Callable[[], wav.PCM]) -> bytes:
+    """
+    Return the wav file of `fragment`, read from the store or cut from the source (then stored).
+    `open_pcm` is only called on cache miss so that sources do not have to be decoded.
+    """
+    key = fragment_key(file_hash, fragment['begin'], fragment['end'], rate)
+    cached = store.get(key)
+    if cached is not None:
+        data, location = cached
+        return wav.header(location.rate, location.channels, location.sampwidth, len(data)) + data
+
+    pcm = open_pcm()
+    data = pcm.slice(fragment['begin'], fragment['end'])
+    store.put(key, data, pcm.rate, pcm.channels, pcm.sampwidth)
+    return wav.header(pcm.rate, pcm.channels, pcm.sampwidth, len(data)) + data
@@ -0,0 +1,129 @@
+import json
+import os
+import struct
+from typing import List, Tuple
+
+import numpy as np
+
+# layout: header, then (begin, end) float64 pairs, then (fragments only) text offsets and utf-8 text blob
+INTERVALS_MAGIC = b'TSIV'
+FRAGMENTS_MAGIC = b'TSFR'
+VERSION = 1
+HEADER = struct.Struct('<4sHxxQQ')  # magic, version, count, text size (0 for intervals)
+INTERVAL_DTYPE = np.dtype('<f8')
+OFFSET_DTYPE = np.dtype('<u8')
+
+
+def _write(path: str, magic: bytes, intervals: np.ndarray, texts: List[str] = None):
+    offsets, blob = None, b''
+    if texts is not None:
+        encoded = [text.encode() for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        blob = b''.join(encoded)
+    with open(f'{path}.tmp', 'wb') as f:
+        f.write(HEADER.pack(magic, VERSION, len(intervals), len(blob)))
+        f.write(np.ascontiguousarray(intervals, dtype=INTERVAL_DTYPE).tobytes())
+        if offsets is not None:
+            f.write(offsets.tobytes())
+            f.write(blob)
+    os.replace(f'{path}.tmp', path)
+
+
+def _read_header(path: str, magic: bytes) -> Tuple[int, int]:
+    with open(path, 'rb') as f:
+        magic_, version, count, text_size = HEADER.unpack(f.read(HEADER.size))
+    assert magic_ == magic, f'{path} is not a {magic.decode()} file'
+    assert version == VERSION, f'unsupported version {version} for {path}'
+    return count, text_size
+
+
+def _map(path: str, dtype: np.dtype, offset: int, shape: tuple) -> np.ndarray:
+    if not np.prod(shape):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+
+def write_intervals(path: str, intervals: List[Tuple[float, float]]):
+    _write(path, INTERVALS_MAGIC, np.array(intervals, dtype=INTERVAL_DTYPE).reshape(-1, 2))
+
+
+def read_intervals(path: str) -> np.ndarray:
+    """
+    Return a read-only, memory-mapped (n, 2) float64 array of (begin, end).
+    """
+    count, _ = _read_header(path, INTERVALS_MAGIC)
+    return _map(path, INTERVAL_DTYPE, HEADER.size, (count, 2))
+
+
+def load_intervals(path: str) -> List[Tuple[float, float]]:
+    return [tuple(interval) for interval in read_intervals(path).tolist()]
+
+
+def write_fragments(path: str, fragments: List[dict]):
+    """
+    Write (begin, end, text) of `fragments`, other keys are ignored.
+    """
+    _write(
+        path, FRAGMENTS_MAGIC,
+        np.array([(f['begin'], f['end']) for f in fragments], dtype=INTERVAL_DTYPE).reshape(-1, 2),
+        [f['text'] for f in fragments],
+    )
+
+
+class Fragments:
+    """
+    Memory-mapped fragments: `intervals` (n, 2) array and lazily decoded texts.
+    """
+
+    def __init__(self, path: str):
+        count, text_size = _read_header(path, FRAGMENTS_MAGIC)
+        self.intervals = _map(path, INTERVAL_DTYPE, HEADER.size, (count, 2))
+        offsets_offset = HEADER.size + count * 2 * INTERVAL_DTYPE.itemsize
+        self._offsets = _map(path, OFFSET_DTYPE, offsets_offset, (count + 1,)) if count else np.zeros(1, OFFSET_DTYPE)
+        self._blob = _map(path, np.uint8, offsets_offset + (count + 1) * OFFSET_DTYPE.itemsize, (text_size,))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def text(self, i: int) -> str:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes().decode()
+
+    def to_list(self) -> List[dict]:
+        return [
+            dict(begin=begin, end=end, text=self.text(i))
+            for i, (begin, end) in enumerate(self.intervals.tolist())
+        ]
+
+
+def read_fragments(path: str) -> List[dict]:
+    return Fragments(path).to_list()
+
+
+def is_intervals(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(INTERVALS_MAGIC)) == INTERVALS_MAGIC
+
+
+def to_json(path: str, path_to_json: str):
+    """
+    Convert a binary intervals or fragments file to the JSON format caches used to have.
+    """
+    data = [list(interval) for interval in load_intervals(path)] if is_intervals(path) else read_fragments(path)
+    with open(path_to_json, 'w') as f:
+        json.dump(data, f)
+
+
+def from_json(path_to_json: str, path: str, fragments: bool = None):
+    """
+    Convert a JSON list of (begin, end) or of fragments (guessed from the first item unless `fragments` is provided)
+    to the binary format.
+    """
+    with open(path_to_json) as f:
+        data = json.load(f)
+    if fragments is None:
+        fragments = bool(data) and isinstance(data[0], dict)
+    if fragments:
+        write_fragments(path, data)
+    else:
+        write_intervals(path, data)
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import time
+from copy import deepcopy
+from typing import List, Iterator
+
+from training_speech import utils
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_EXTENSION = '.journal'
+
+
+def journal_path(path_to_alignment: str) -> str:
+    filename, _ = os.path.splitext(path_to_alignment)
+    return f'{filename}{JOURNAL_EXTENSION}'
+
+
+def file_digest(path_to_file: str) -> str:
+    with open(path_to_file, 'rb') as f:
+        return utils.hash_file(f)
+
+
+def save_alignment(alignment: List[dict], path_to_alignment: str, path_to_transcript: str):
+    # write canonical files atomically so that a crash never leaves a truncated alignment behind
+    to_save = deepcopy(alignment)
+    for f in to_save:
+        f.pop('warn', None)
+    tmp_alignment = f'{path_to_alignment}.tmp'
+    with open(tmp_alignment, 'w') as dest:
+        json.dump(obj=to_save, fp=dest, sort_keys=True, indent=2)
+    os.replace(tmp_alignment, path_to_alignment)
+
+    tmp_transcript = f'{path_to_transcript}.tmp'
+    with open(tmp_transcript, 'w') as dest:
+        dest.writelines('\n'.join(f['text'] for f in alignment) + '\n')
+    os.replace(tmp_transcript, path_to_transcript)
+
+
+def read_records(path_to_journal: str) -> Iterator[dict]:
+    with open(path_to_journal) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # last record may have been partially written before a crash
+                logger.warning(f'ignore corrupted record in {path_to_journal}: {line[:50]}')
+                return
+
+
+def apply(alignment: List[dict], record: dict) -> List[dict]:
+    op = record['op']
+    if op == 'splice':
+        return alignment[:record['start']] + deepcopy(record['fragments']) + alignment[record['end'] + 1:]
+
+    fragment = alignment[record['index']]
+    if op == 'approve':
+        fragment['approved'] = True
+        if record.get('auto'):
+            fragment['approved_auto'] = True
+    elif op == 'disable':
+        fragment['disabled'] = True
+        fragment.pop('approved', None)
+    elif op == 'enable':
+        fragment['approved'] = True
+        fragment.pop('disabled', None)
+    elif op == 'reset':
+        fragment.pop('approved', None)
+        fragment.pop('disabled', None)
+    elif op == 'move':
+        fragment.update(begin=record['begin'], end=record['end'])
+    else:
+        raise NotImplementedError(op)
+    return alignment
+
+
+def replay(alignment: List[dict], records: Iterator[dict]) -> List[dict]:
+    for record in records:
+        alignment = apply(alignment, record)
+    return alignment
+
+
+def recover(path_to_alignment: str, path_to_transcript: str) -> int:
+    """
+    Replay pending journal records (if any) on top of the canonical alignment and compact them.
+    Return the number of replayed records.
+    """
+    path_to_journal = journal_path(path_to_alignment)
+    if not os.path.isfile(path_to_journal):
+        return 0
+
+    records = list(read_records(path_to_journal))
+    if not records or records[0].get('op') != 'base' or not os.path.isfile(path_to_alignment):
+        os.unlink(path_to_journal)
+        return 0
+
+    base, records = records[0], records[1:]
+    if base['digest'] != file_digest(path_to_alignment):
+        # canonical alignment has been rewritten after journal creation (ie. compacted or updated by hand)
+        logger.warning(f'{path_to_journal} does not match {path_to_alignment} => discarded')
+        os.unlink(path_to_journal)
+        return 0
+
+    if records:
+        with open(path_to_alignment) as f:
+            alignment = json.load(f)
+        save_alignment(replay(alignment, records), path_to_alignment, path_to_transcript)
+    os.unlink(path_to_journal)
+    return len(records)
+
+
+class Journal:
+    """
+    Append-only log of the edits made on an alignment during `check_alignment`.
+    Canonical alignment and transcript are only rewritten on `checkpoint`.
+    """
+
+    def __init__(self, path_to_alignment: str, path_to_transcript: str, fsync_every: int = 20, interval: float = 300):
+        self.path_to_alignment = path_to_alignment
+        self.path_to_transcript = path_to_transcript
+        self.path = journal_path(path_to_alignment)
+        self.fsync_every = fsync_every
+        self.interval = interval
+        self.last_checkpoint = None
+        self._file = None
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def checkpoint(self, alignment: List[dict]):
+        # NB: canonical files must be written BEFORE truncating the journal (see `recover`)
+        save_alignment(alignment, self.path_to_alignment, self.path_to_transcript)
+        self.close()
+        self._file = open(self.path, 'w')
+        self._pending = 0
+        self.append('base', digest=file_digest(self.path_to_alignment))
+        self.sync()
+        self.last_checkpoint = time.time()
+
+    def maybe_checkpoint(self, alignment: List[dict]):
+        if self.last_checkpoint is None or time.time() - self.last_checkpoint >= self.interval:
+            self.checkpoint(alignment)
+
+    def append(self, op: str, **kwargs):
+        assert self._file is not None, 'checkpoint() must be called first'
+        self._file.write(json.dumps(dict(op=op, **kwargs), separators=(',', ':'), ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,254 @@
+import functools
+import glob
+import os
+import re
+import resource
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Callable, List
+
+from training_speech.exceptions import MemoryLimitExceeded
+
+# NB: checked on every stage => keep it a plain module global
+ENABLED = False
+SAMPLE_INTERVAL = 0.1
+# seconds given to the main thread to unwind once the limit is exceeded, before exiting
+EXIT_GRACE = 10
+EXIT_CODE = 3
+TOP_SITES = 3
+SUMMARY_HEADERS = ['Stage', 'Calls', 'Peak RSS (MB)', 'RSS delta (MB)', 'Peak traced (MB)', 'Top allocations']
+SIZE_REG = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$', re.IGNORECASE)
+
+_lock = threading.Lock()
+_open_stages = []
+_results = OrderedDict()
+_sampler = None
+_max_memory = None
+_trace = False
+_exceeded = None
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def parse_size(value: str) -> int:
+    """
+    '800M', '7.5G', '1024' => bytes.
+    """
+    match = SIZE_REG.match(str(value))
+    if not match:
+        raise ValueError(f'invalid size {value}')
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** ' kmgt'.index(unit.lower() or ' '))
+
+
+def _process_rss(pid) -> int:
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * _page_size
+
+
+def rss(children: bool = True) -> int:
+    """
+    Return the resident memory of this process (and of its direct children: workers, ffmpeg, sox...) in bytes.
+    """
+    if not os.path.isfile('/proc/self/statm'):
+        # NB: peak rather than current outside of linux, kB on linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if os.uname().sysname == 'Darwin' else 1024)
+    total = _process_rss('self')
+    if children:
+        for path in glob.glob('/proc/self/task/*/children'):
+            with open(path) as f:
+                for pid in f.read().split():
+                    try:
+                        total += _process_rss(pid)
+                    except FileNotFoundError:
+                        pass  # exited meanwhile
+    return total
+
+
+class _Stage:
+    __slots__ = ('name', 'rss_before', 'peak_rss', 'peak_traced', 'snapshot')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rss_before = self.peak_rss = rss()
+        self.peak_traced = 0
+        self.snapshot = None
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _fold_traced_peak():
+    # NB: tracemalloc peak is process wide => credit it to every open stage before resetting it
+    _, peak = tracemalloc.get_traced_memory()
+    for stage_ in _open_stages:
+        stage_.peak_traced = max(stage_.peak_traced, peak)
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+class _StageContext:
+    def __init__(self, name: str):
+        self.name = name
+        self.stage = None
+
+    def __enter__(self):
+        self.stage = _Stage(self.name)
+        with _lock:
+            if _trace:
+                _fold_traced_peak()
+                self.stage.snapshot = tracemalloc.take_snapshot()
+            _open_stages.append(self.stage)
+        return self.stage
+
+    def __exit__(self, *args):
+        stage_ = self.stage
+        current_rss = rss()
+        sites = []
+        if _trace:
+            snapshot = tracemalloc.take_snapshot()
+            sites = [
+                (str(stat.traceback[0]), stat.size_diff)
+                for stat in snapshot.compare_to(stage_.snapshot, 'lineno')[:TOP_SITES]
+                if stat.size_diff > 0
+            ]
+            stage_.snapshot = None
+        with _lock:
+            if _trace:
+                _fold_traced_peak()
+            _open_stages.remove(stage_)
+            stage_.peak_rss = max(stage_.peak_rss, current_rss)
+            result = _results.setdefault(stage_.name, dict(calls=0, peak_rss=0, rss_delta=0, peak_traced=0, sites=[]))
+            result['calls'] += 1
+            result['rss_delta'] = max(result['rss_delta'], current_rss - stage_.rss_before)
+            result['peak_traced'] = max(result['peak_traced'], stage_.peak_traced)
+            if stage_.peak_rss >= result['peak_rss']:
+                result['peak_rss'] = stage_.peak_rss
+                result['sites'] = sites
+        return False
+
+
+def stage(name: str):
+    """
+    Track peak memory (sampled RSS and, if traced, python allocations) of the enclosed block as `name`.
+    Peaks are process wide: stages running concurrently in threads share them.
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    return _StageContext(name)
+
+
+def tracked(name: str = None):
+    """
+    Decorator version of `stage`, named after the function by default.
+    """
+    def decorator(func: Callable):
+        stage_name = name or f'{func.__module__.rsplit(".", 1)[-1]}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _StageContext(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _sample():
+    global _exceeded
+    while ENABLED:
+        current = rss()
+        with _lock:
+            for stage_ in _open_stages:
+                stage_.peak_rss = max(stage_.peak_rss, current)
+            names = [stage_.name for stage_ in _open_stages]
+        if _max_memory is not None and current > _max_memory:
+            if _exceeded is None:
+                _exceeded = MemoryLimitExceeded(_max_memory, current, names)
+                exceeded_at = time.time()
+                _interrupt()
+            elif time.time() - exceeded_at > EXIT_GRACE:
+                # NB: worker threads keep allocating while the main thread unwinds
+                sys.stderr.write(f'{_exceeded}\n')
+                os._exit(EXIT_CODE)
+        time.sleep(SAMPLE_INTERVAL)
+
+
+def _interrupt():
+    if signal.getsignal(signal.SIGUSR1) is _on_exceeded:
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGUSR1)
+    else:
+        import _thread
+        _thread.interrupt_main()
+
+
+def _on_exceeded(signum, frame):
+    raise _exceeded
+
+
+def enable(trace: bool = True, max_memory: int = None, frames: int = 1):
+    """
+    Start sampling RSS (and tracing python allocations if `trace`).
+    Past `max_memory` bytes, `MemoryLimitExceeded` is raised in the main thread instead of letting the system swap.
+    """
+    global ENABLED, _sampler, _max_memory, _trace, _exceeded
+    _max_memory = max_memory
+    _trace = trace
+    _exceeded = None
+    if trace and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    if max_memory is not None and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, _on_exceeded)
+    if not ENABLED:
+        ENABLED = True
+        _sampler = threading.Thread(target=_sample, name='memory-sampler', daemon=True)
+        _sampler.start()
+
+
+def disable():
+    global ENABLED, _sampler
+    ENABLED = False
+    if _sampler is not None:
+        _sampler.join()
+        _sampler = None
+    if _trace and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    if signal.getsignal(signal.SIGUSR1) is _on_exceeded:
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+
+def reset():
+    with _lock:
+        _results.clear()
+
+
+def summary() -> List[list]:
+    """
+    Return [stage, calls, peak RSS (MB), max RSS delta (MB), peak traced (MB), top allocating sites] per stage.
+    """
+    with _lock:
+        results = [(name, dict(result)) for name, result in _results.items()]
+    return [
+        [
+            name,
+            result['calls'],
+            round(result['peak_rss'] / 2 ** 20, 1),
+            round(result['rss_delta'] / 2 ** 20, 1),
+            round(result['peak_traced'] / 2 ** 20, 1) if _trace else None,
+            '\n'.join(f'{site} (+{size / 2 ** 20:.1f}MB)' for site, size in result['sites']),
+        ]
+        for name, result in results
+    ]
+
@@ -0,0 +1,187 @@
+import glob
+import json
+import os
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Iterator, Tuple
+
+from training_speech import utils, ffmpeg, silence, profiling, memory
+from training_speech.source import get_source
+
+CURRENT_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '../data'))
+STAMPS_DIR = os.path.join(utils.CACHE_DIR, 'stages')
+
+# stage => required stages
+STAGES = OrderedDict([
+    ('hash', ()),
+    ('decode', ('hash',)),
+    ('silences', ('decode',)),
+    ('alignment', ('decode', 'silences')),
+])
+# files computed by the stages in CACHE_DIR: decoded wavs, silences, sync maps, transcripts, labels and alignments
+CACHE_PATTERNS = ('*.wav', 'silences_*.intervals', '*.fragments', '*_*.json', '*.txt')
+
+
+class Pipeline:
+    """
+    Prepare a source: hash mp3 => decode to wav => detect silences (with `silence_backend`) => build alignment.
+    Each stage records its inputs and is skipped as long as they do not change.
+    Stages whose output is already cached elsewhere only record their inputs, then `load` their output from that cache.
+
+    `extra_rates` are decoded along with `audio_rate` (ie. for multi-rate releases) at the cost of a single decode.
+    """
+
+    def __init__(self, source_name: str, audio_rate: int = 16000, restart: bool = False,
+                 vad_mode: int = utils.DEFAULT_VAD_MODE, vad_frame_duration: int = utils.DEFAULT_VAD_FRAME_DURATION,
+                 extra_rates: List[int] = (), silence_backend: str = silence.DEFAULT_BACKEND):
+        self.source_name = source_name
+        self.source = get_source(source_name, validate=False)
+        self.audio_rate = audio_rate
+        self.extra_rates = [rate for rate in extra_rates if rate != audio_rate]
+        self.restart = restart
+        self.vad_mode = vad_mode
+        self.vad_frame_duration = vad_frame_duration
+        self.silence_backend = silence_backend
+        self.path_to_mp3 = os.path.join(DATA_DIR, 'mp3', self.source['audio'])
+        self.path_to_alignment = os.path.join(DATA_DIR, 'alignments', f'{source_name}.json')
+        self.path_to_transcript = os.path.join(DATA_DIR, 'transcripts', f'{source_name}.txt')
+        self.file_hash = None
+        self.path_to_wav = None
+        self.silences = None
+        self.transcript = None
+        self.existing_alignment = None
+        self.alignment = None
+        self._done = set()
+
+    def run(self, until: str = 'alignment') -> 'Pipeline':
+        for required in STAGES[until]:
+            self.run(until=required)
+        if until not in self._done:
+            getattr(self, f'_{until}')()
+            self._done.add(until)
+        return self
+
+    def _stage(self, name: str, inputs: dict, compute, is_valid=lambda output: True, load=None, variant: tuple = ()):
+        with profiling.span(f'pipeline.{name}', source=self.source_name), memory.stage(f'pipeline.{name}'):
+            return self._run_stage(name, inputs, compute, is_valid, load, variant)
+
+    def _run_stage(self, name: str, inputs: dict, compute, is_valid, load, variant: tuple):
+        # NB: one stamp per variant (ie. rate) => preparing several of them does not invalidate the others
+        stamp_name = '_'.join(str(part) for part in (self.source_name, name) + tuple(variant))
+        path_to_stamp = os.path.join(STAMPS_DIR, f'{stamp_name}.json')
+        if os.path.isfile(path_to_stamp):
+            with open(path_to_stamp) as f:
+                stamp = json.load(f)
+            if stamp['inputs'] == inputs:
+                if load is not None:
+                    return load()
+                if is_valid(stamp['output']):
+                    return stamp['output']
+
+        output = compute()
+        os.makedirs(STAMPS_DIR, exist_ok=True)
+        with open(f'{path_to_stamp}.tmp', 'w') as f:
+            json.dump(dict(inputs=inputs) if load is not None else dict(inputs=inputs, output=output), f)
+        os.replace(f'{path_to_stamp}.tmp', path_to_stamp)
+        return output
+
+    def _hash(self):
+        stat = os.stat(self.path_to_mp3)
+
+        def compute():
+            with open(self.path_to_mp3, 'rb') as f:
+                return utils.hash_file(f)
+
+        self.file_hash = self._stage('hash', dict(
+            path=self.path_to_mp3,
+            size=stat.st_size,
+            mtime=stat.st_mtime_ns,
+        ), compute)
+
+    def _decode(self):
+        def compute():
+            paths = ffmpeg.decode(self.path_to_mp3, self.file_hash, rates=[self.audio_rate] + self.extra_rates)
+            return paths[(self.audio_rate, 1)]
+
+        self.path_to_wav = self._stage('decode', dict(
+            file_hash=self.file_hash,
+            rate=self.audio_rate,
+            channels=1,
+        ), compute, is_valid=os.path.isfile, variant=(self.audio_rate,))
+
+    def _silences(self):
+        # NB: vad params are ignored by backends which do not accept them
+        params = {
+            key: value
+            for key, value in dict(mode=self.vad_mode, frame_duration=self.vad_frame_duration).items()
+            if key in silence.resolve_params(self.silence_backend)
+        }
+
+        def list_silences():
+            # NB: cached as binary intervals by `list_silences` => stamp only records inputs
+            return silence.list_silences(self.path_to_wav, self.silence_backend, **params)
+
+        self.silences = self._stage('silences', dict(
+            file_hash=self.file_hash,
+            rate=self.audio_rate,
+            backend=self.silence_backend,
+            **params,
+        ), list_silences, load=list_silences, variant=(self.audio_rate, self.silence_backend))
+
+    def _alignment(self):
+        with open(self.path_to_transcript) as f:
+            transcript = [l.strip() for l in f.readlines()]
+        self.transcript = [l for l in transcript if l]  # rm empty lines
+
+        if not self.restart and os.path.isfile(self.path_to_alignment):
+            with open(self.path_to_alignment) as f:
+                self.existing_alignment = json.load(f)
+        else:
+            self.existing_alignment = []
+
+        # NB: result is cached from its inputs by `cached_build_alignment`
+        self.alignment = utils.cached_build_alignment(
+            transcript=self.transcript,
+            path_to_audio=self.path_to_wav,
+            existing_alignment=self.existing_alignment,
+            silences=self.silences,
+            generate_labels=True,
+            language=self.source['language'],
+            # NB: decoded wav is identified by its source digest and rate => not hashed again
+            audio_hash=f'{self.file_hash}_{self.audio_rate}_1',
+        )
+
+
+def clear_cache() -> int:
+    """
+    Remove what stages computed along with their stamps, so that every source is prepared again.
+    Persistent stores sharing CACHE_DIR (catalog, fragments, synthesized texts, digests) are kept.
+    Return the number of removed files.
+    """
+    paths = {
+        path
+        for pattern in CACHE_PATTERNS
+        for path in glob.glob(os.path.join(utils.CACHE_DIR, pattern))
+        if os.path.isfile(path)
+    }
+    for path in paths:
+        os.unlink(path)
+    shutil.rmtree(STAMPS_DIR, ignore_errors=True)
+    return len(paths)
+
+
+def prepare(source_name: str, until: str = 'alignment', **kwargs) -> str:
+    Pipeline(source_name, **kwargs).run(until=until)
+    return source_name
+
+
+def prepare_many(source_names: List[str], jobs: int = None, until: str = 'alignment', **kwargs) -> Iterator[Tuple[str, Exception]]:
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(prepare, source_name, until=until, **kwargs): source_name
+            for source_name in source_names
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.exception()
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from training_speech import sox, wav
+
+
+class Player:
+    """
+    Long-lived audio output fed with raw PCM read from a memory-mapped wav file.
+    One `play` process is kept per speed, so that playing, stopping and replaying a fragment never spawns a process.
+    """
+
+    def __init__(self, path_to_wav: str, chunk_duration: float = 0.05, lookahead: float = 0.15, flush_duration: float = 0.2):
+        self.pcm = wav.PCM(path_to_wav)
+        self.chunk_duration = chunk_duration
+        self.lookahead = lookahead
+        self.flush_duration = flush_duration
+        self._outputs = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, begin: float, end: float) -> bytes:
+        return bytes(self.pcm.slice(begin, end))
+
+    def _output(self, speed: float = None):
+        process = self._outputs.get(speed)
+        if process is None or process.poll() is not None:
+            process = self._outputs[speed] = sox.play_stream(
+                rate=self.pcm.rate,
+                channels=self.pcm.channels,
+                bits=self.pcm.sampwidth * 8,
+                speed=speed,
+            )
+        return process
+
+    def play(self, data: bytes, speed: float = None):
+        self.stop()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._feed, args=(self._output(speed), data, speed, self._stop), daemon=True)
+        self._thread.start()
+
+    def _feed(self, process, data, speed: float, stop: threading.Event):
+        bytes_per_sec = self.pcm.rate * self.pcm.block_align
+        chunk_size = int(self.chunk_duration * self.pcm.rate) * self.pcm.block_align
+        # NB: trailing silence pushes last samples out of the effects (ie. tempo) buffers
+        silence = bytes(int(self.flush_duration * self.pcm.rate) * self.pcm.block_align)
+        data = memoryview(data)
+        started_at = time.monotonic()
+        written = 0.
+        for offset in range(0, len(data) + len(silence), chunk_size):
+            if stop.is_set():
+                return
+            chunk = data[offset:offset + chunk_size] if offset < len(data) else silence[:chunk_size]
+            try:
+                process.stdin.write(chunk)
+                process.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                return
+            written += len(chunk) / bytes_per_sec / (speed or 1.)
+            # stay close to real time so that `stop` does not have to wait for a full pipe to drain
+            ahead = written - (time.monotonic() - started_at)
+            if ahead > self.lookahead:
+                stop.wait(ahead - self.lookahead)
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def stop(self):
+        self._stop.set()
+        self.wait()
+
+    def close(self):
+        self.stop()
+        for process in self._outputs.values():
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            process.kill()
+            process.wait()
+        self._outputs.clear()
+        self.pcm.close()
@@ -0,0 +1,156 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List
+
+# NB: checked on every span => keep it a plain module global
+ENABLED = False
+
+_events = []
+_lock = threading.Lock()
+_local = threading.local()
+_start = time.perf_counter()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'begin', 'children')
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.begin = None
+        self.children = 0.
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        _local.stack.pop()
+        duration = end - self.begin
+        if _local.stack:
+            _local.stack[-1].children += duration
+        _append(self.name, self.begin, duration, duration - self.children, threading.get_ident(), self.args)
+        return False
+
+
+def _append(name: str, begin: float, duration: float, self_duration: float, tid: int, args: dict):
+    event = dict(
+        name=name,
+        ph='X',
+        ts=(begin - _start) * 1e6,
+        dur=duration * 1e6,
+        pid=os.getpid(),
+        tid=tid,
+        self=self_duration * 1e6,
+    )
+    if args:
+        event['args'] = args
+    with _lock:
+        _events.append(event)
+
+
+def span(name: str, **args):
+    """
+    Time the enclosed block as `name` when profiling is enabled, do nothing otherwise.
+
+        with profiling.span('cut', source=source_name):
+            ...
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def add_event(name: str, begin: float, duration: float, tid: int = None, **args):
+    """
+    Record a span timed elsewhere (ie. an external process), `begin` being a perf_counter value.
+    """
+    if ENABLED:
+        _append(name, begin, duration, duration, tid if tid is not None else threading.get_ident(), args)
+
+
+def profiled(name: str = None):
+    """
+    Decorator version of `span`, named after the function by default.
+    """
+    def decorator(func: Callable):
+        span_name = name or f'{func.__module__.rsplit(".", 1)[-1]}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Span(span_name, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        del _events[:]
+
+
+def events() -> List[dict]:
+    with _lock:
+        return list(_events)
+
+
+def export_chrome_trace(path: str):
+    """
+    Write recorded spans as a Chrome trace (open with chrome://tracing or https://ui.perfetto.dev).
+    """
+    trace_events = [
+        {key: value for key, value in event.items() if key != 'self'}
+        for event in events()
+    ]
+    with open(path, 'w') as f:
+        json.dump(dict(traceEvents=trace_events, displayTimeUnit='ms'), f)
+
+
+def summary() -> List[list]:
+    """
+    Return [name, calls, total (s), self (s), mean (ms), max (ms)] per span name, slowest first (self time).
+    """
+    per_name = OrderedDict()
+    for event in events():
+        stats = per_name.setdefault(event['name'], [0, 0., 0., 0.])
+        stats[0] += 1
+        stats[1] += event['dur']
+        stats[2] += event['self']
+        stats[3] = max(stats[3], event['dur'])
+    rows = [
+        [name, calls, round(total / 1e6, 3), round(self_ / 1e6, 3), round(total / calls / 1e3, 2), round(max_ / 1e3, 2)]
+        for name, (calls, total, self_, max_) in per_name.items()
+    ]
+    return sorted(rows, key=lambda row: row[3], reverse=True)
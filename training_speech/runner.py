@@ -0,0 +1,212 @@
+import asyncio
+import atexit
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from training_speech import accounting
+from training_speech.exceptions import ToolError
+
+DEFAULT_MAX_JOBS = os.cpu_count() or 1
+
+
+if sys.version_info < (3, 8):
+    class _ThreadedChildWatcher(asyncio.AbstractChildWatcher):
+        """
+        Backport of python 3.8 `asyncio.ThreadedChildWatcher`: a thread waits for each process, so that loops running
+        in any thread (the default watcher needs one attached from the main thread) can spawn subprocesses.
+        """
+
+        def add_child_handler(self, pid, callback, *args):
+            threading.Thread(target=self._wait, args=(pid, callback, args), name=f'waitpid-{pid}', daemon=True).start()
+
+        @staticmethod
+        def _wait(pid, callback, args):
+            try:
+                _, status = os.waitpid(pid, 0)
+            except ChildProcessError:
+                # NB: already reaped elsewhere => exit status is lost
+                returncode = 255
+            else:
+                returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            # NB: loops hand over a callback scheduling the exit thread-safely
+            callback(pid, returncode, *args)
+
+        def remove_child_handler(self, pid):
+            return False
+
+        def attach_loop(self, loop):
+            pass
+
+        def close(self):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+    _watcher_lock = threading.Lock()
+
+    def _install_child_watcher():
+        with _watcher_lock:
+            if not isinstance(asyncio.get_child_watcher(), _ThreadedChildWatcher):
+                asyncio.set_child_watcher(_ThreadedChildWatcher())
+
+
+class Runner:
+    """
+    Run external tools (ffmpeg, sox, ...) from an asyncio loop living in a background thread,
+    at most `max_jobs` at a time whatever the number of calling threads.
+
+    Failures (non-zero exit, timeout) raise a `ToolError`. Cancelling the future returned by `submit`
+    kills the underlying process.
+    """
+
+    def __init__(self, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.pid = os.getpid()
+        self._loop = asyncio.new_event_loop()
+        if sys.version_info < (3, 8):
+            # NB: default watcher only works for loops attached from the main thread, runner is created lazily from any
+            _install_child_watcher()
+        self._semaphore = None
+        self._processes = set()
+        self._futures = set()
+        self._jobs = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_loop, name='tool-runner', daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_jobs)
+        self._loop.run_forever()
+
+    async def _run(self, args: List[str], input: bytes, timeout: float, capture: bool, check: bool, caller: str):
+        async with self._semaphore:
+            begin = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE if capture else None,
+                stderr=subprocess.PIPE if capture else None,
+            )
+            self._jobs.add(process)
+            stdout, stderr = None, None
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout)
+            except asyncio.TimeoutError:
+                await self._kill(process)
+                raise ToolError(args, timeout=timeout)
+            except asyncio.CancelledError:
+                await self._kill(process)
+                raise
+            finally:
+                self._jobs.discard(process)
+                accounting.record(
+                    args, caller, begin, time.perf_counter() - begin, process.returncode,
+                    bytes_in=len(input or b''), bytes_out=len(stdout or b'') + len(stderr or b''), pid=process.pid,
+                )
+
+        if check and process.returncode != 0:
+            raise ToolError(args, returncode=process.returncode, stderr=stderr or b'')
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    @staticmethod
+    async def _kill(process):
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    def _kill_jobs(self):
+        for process in list(self._jobs):
+            if process.returncode is None:
+                process.kill()
+
+    def submit(self, args: List[str], input: bytes = None, timeout: float = None, capture: bool = True,
+               check: bool = True) -> Future:
+        # NB: caller is resolved from the calling thread, the loop thread has no idea who asked for the process
+        coroutine = self._run(list(args), input, timeout, capture, check, accounting.caller())
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future: Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def run(self, args: List[str], input: bytes = None, timeout: float = None, capture: bool = True,
+            check: bool = True) -> subprocess.CompletedProcess:
+        future = self.submit(args, input=input, timeout=timeout, capture=capture, check=check)
+        try:
+            return future.result()
+        except (KeyboardInterrupt, SystemExit):
+            future.cancel()
+            raise
+
+    def spawn(self, args: List[str], **kwargs) -> subprocess.Popen:
+        """
+        Start a long-lived process (ie. a player) outside of the jobs limit. It is killed on `close`.
+        """
+        process = subprocess.Popen(list(args), **kwargs)
+        # NB: long-lived => counted but not timed
+        accounting.record(args, accounting.caller(), time.perf_counter(), pid=process.pid)
+        with self._lock:
+            self._processes = {p for p in self._processes if p.poll() is None}
+            self._processes.add(process)
+        return process
+
+    def close(self):
+        if self.pid != os.getpid():
+            # NB: inherited by a forked process, which has no loop thread
+            return
+        with self._lock:
+            processes, self._processes = self._processes, set()
+            futures = list(self._futures)
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        for future in futures:
+            future.cancel()
+        if self._loop.is_running():
+            # NB: loop is stopped before cancelled jobs get a chance to kill their process
+            self._loop.call_soon_threadsafe(self._kill_jobs)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> Runner:
+    global _runner, _runner_lock
+    if _runner is not None and _runner.pid != os.getpid():
+        # NB: forked (ie. ProcessPoolExecutor worker) => inherited loop thread does not run here, and the lock may have
+        # been held by a thread of the parent at fork time
+        _runner, _runner_lock = None, threading.Lock()
+    with _runner_lock:
+        if _runner is None:
+            _runner = Runner(max_jobs=int(os.environ.get('TRAINING_SPEECH_MAX_JOBS', DEFAULT_MAX_JOBS)))
+            atexit.register(_runner.close)
+        return _runner
+
+
+def run(args: List[str], **kwargs) -> subprocess.CompletedProcess:
+    return get_runner().run(args, **kwargs)
+
+
+def submit(args: List[str], **kwargs) -> Future:
+    return get_runner().submit(args, **kwargs)
+
+
+def spawn(args: List[str], **kwargs) -> subprocess.Popen:
+    return get_runner().spawn(args, **kwargs)
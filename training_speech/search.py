@@ -0,0 +1,180 @@
+import os
+import re
+from collections import namedtuple
+from typing import List
+
+from training_speech import utils, catalog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_sources (
+    name TEXT PRIMARY KEY,
+    alignment_state TEXT,
+    transcript_state TEXT
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    kind TEXT NOT NULL,  -- 'fragment' (idx in alignment) or 'line' (idx in transcript)
+    idx INTEGER NOT NULL,
+    "begin",
+    "end",
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_source ON documents (source, kind);
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    document INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (token, document, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_document ON postings (document);
+"""
+KINDS = ('fragment', 'line')
+# NB: bump whenever tokens may change => every source is re-indexed
+INDEX_VERSION = 1
+QUOTES_REG = re.compile(r'["«»“”:]')
+
+Hit = namedtuple('Hit', ['source', 'kind', 'idx', 'begin', 'end', 'text', 'position'])
+
+
+def tokenize(text: str) -> List[str]:
+    # NB: same normalization as transcripts compared with aeneas outputs, elisions (ie. l'arrivée) being split
+    return QUOTES_REG.sub(' ', utils.cleanup_transcript(text)).replace("'", "' ").split()
+
+
+def _state(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f'{INDEX_VERSION}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+class SearchIndex:
+    """
+    Inverted index of normalized tokens of transcripts lines and alignment fragments, stored along with the catalog.
+    Sources are re-indexed when their alignment or transcript changes.
+
+        with SearchIndex() as index:
+            index.search('chapitre un')  # phrase
+            index.search('marseil*')  # prefix of the last token
+    """
+
+    def __init__(self, corpus: catalog.Catalog = None, path_to_transcripts: str = None, sync: bool = True):
+        self._owns_catalog = corpus is None
+        self.catalog = corpus or catalog.Catalog(sync=False)
+        self.path_to_transcripts = path_to_transcripts or os.path.join(catalog.DATA_DIR, 'transcripts')
+        self.connection = self.catalog.connection
+        self.connection.executescript(SCHEMA)
+        if sync:
+            self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def sync(self, sources: dict = None) -> List[str]:
+        """
+        Sync the catalog then re-index modified sources, return their names.
+        """
+        self.catalog.sync(sources)
+        indexed = {
+            row['name']: (row['alignment_state'], row['transcript_state'])
+            for row in self.connection.execute('SELECT * FROM search_sources')
+        }
+        current = {
+            row['name']: (f'{INDEX_VERSION}:{row["mtime_ns"]}:{row["size"]}' if row['mtime_ns'] is not None else None,
+                          _state(os.path.join(self.path_to_transcripts, f'{row["name"]}.txt')))
+            for row in self.connection.execute('SELECT * FROM sources')
+        }
+        reindexed = []
+        with self.connection:
+            for name in set(indexed) - set(current):
+                self._delete(name, KINDS)
+                self.connection.execute('DELETE FROM search_sources WHERE name = ?', (name,))
+            for name, (alignment_state, transcript_state) in current.items():
+                previous = indexed.get(name, (None, None))
+                kinds = [
+                    kind for kind, changed in zip(KINDS, (alignment_state != previous[0], transcript_state != previous[1]))
+                    if changed or name not in indexed
+                ]
+                if not kinds:
+                    continue
+                self._delete(name, kinds)
+                if 'fragment' in kinds:
+                    self._index(name, 'fragment', (
+                        (row['idx'], row['begin'], row['end'], row['text'])
+                        for row in self.catalog.fragments(source=name)
+                    ))
+                if 'line' in kinds and transcript_state is not None:
+                    with open(os.path.join(self.path_to_transcripts, f'{name}.txt')) as f:
+                        self._index(name, 'line', ((i, None, None, line.strip()) for i, line in enumerate(f)))
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO search_sources VALUES (?, ?, ?)', (name, alignment_state, transcript_state),
+                )
+                reindexed.append(name)
+        return reindexed
+
+    def _delete(self, name: str, kinds):
+        for kind in kinds:
+            self.connection.execute(
+                'DELETE FROM postings WHERE document IN (SELECT id FROM documents WHERE source = ? AND kind = ?)',
+                (name, kind),
+            )
+            self.connection.execute('DELETE FROM documents WHERE source = ? AND kind = ?', (name, kind))
+
+    def _index(self, name: str, kind: str, documents):
+        postings = []
+        for idx, begin, end, text in documents:
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            document = self.connection.execute(
+                'INSERT INTO documents (source, kind, idx, "begin", "end", text) VALUES (?, ?, ?, ?, ?, ?)',
+                (name, kind, idx, begin, end, text),
+            ).lastrowid
+            # NB: a token repeated at the same position cannot happen => no conflict on the primary key
+            postings.extend((token, document, position) for position, token in enumerate(tokens))
+        self.connection.executemany('INSERT INTO postings VALUES (?, ?, ?)', postings)
+
+    def search(self, query: str, kind: str = None, source: str = None, limit: int = None) -> List[Hit]:
+        """
+        Return documents containing the tokens of `query` in sequence. A trailing `*` makes the last token a prefix.
+        """
+        prefix = query.rstrip().endswith('*')
+        tokens = tokenize(query.rstrip().rstrip('*'))
+        if not tokens:
+            return []
+
+        joins, conditions, params = [], [], []
+        for i, token in enumerate(tokens):
+            if i:
+                joins.append(f'JOIN postings p{i} ON p{i}.document = p0.document AND p{i}.position = p0.position + {i}')
+            if prefix and i == len(tokens) - 1:
+                # NB: range rather than LIKE => primary key is used
+                conditions.append(f'p{i}.token >= ? AND p{i}.token < ?')
+                params += [token, token + '\U0010ffff']
+            else:
+                conditions.append(f'p{i}.token = ?')
+                params.append(token)
+        for column, value in (('kind', kind), ('source', source)):
+            if value is not None:
+                conditions.append(f'd.{column} = ?')
+                params.append(value)
+        sql = f"""
+            SELECT d.source, d.kind, d.idx, d."begin", d."end", d.text, MIN(p0.position) AS position
+            FROM postings p0 {' '.join(joins)}
+            JOIN documents d ON d.id = p0.document
+            WHERE {' AND '.join(conditions)}
+            GROUP BY d.id
+            ORDER BY d.source, d.kind, d.idx
+        """
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        return [Hit(*row) for row in self.connection.execute(sql, params)]
+
+    def close(self):
+        if self._owns_catalog:
+            self.catalog.close()
@@ -0,0 +1,407 @@
+import csv
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import struct
+import zipfile
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+
+from training_speech import archive, wav, ffmpeg, features, profiling
+
+# index layout: header, then one fixed-size record per fragment, then utf-8 names and texts
+INDEX_MAGIC = b'TSIX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sHHI')  # magic, version, codec, count
+INDEX_RECORD = struct.Struct('<QQfIHI')  # offset, length, duration, strings offset, name length, text length
+
+Entry = namedtuple('Entry', ['name', 'duration', 'text', 'data'])
+
+
+def content_key(file_hash: str, fragment: dict, rate: int, codec: str) -> str:
+    """
+    Identify an encoded fragment from everything its payload depends on.
+    """
+    return hashlib.sha1(json.dumps([
+        file_hash, fragment['begin'], fragment['end'], fragment['text'], rate, codec,
+    ]).encode()).hexdigest()
+
+
+def shard_paths(path_to_shard: str):
+    return f'{path_to_shard}.shard', f'{path_to_shard}.idx'
+
+
+def write_index(path_to_index: str, codec: str, records: list):
+    """
+    `records` is a list of (offset, length, duration, name, text).
+    """
+    strings = bytearray()
+    packed = []
+    for offset, length, duration, name, text in records:
+        name_bytes, text_bytes = name.encode(), text.encode()
+        packed.append(INDEX_RECORD.pack(offset, length, duration, len(strings), len(name_bytes), len(text_bytes)))
+        strings += name_bytes + text_bytes
+
+    with open(f'{path_to_index}.tmp', 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, archive.CODECS.index(codec), len(records)))
+        f.writelines(packed)
+        f.write(strings)
+    os.replace(f'{path_to_index}.tmp', path_to_index)
+
+
+class ShardReader:
+    """
+    Memory-mapped access to the fragments of a shard, by position or by name.
+    """
+
+    def __init__(self, path_to_shard: str):
+        self.path = path_to_shard
+        path_to_data, path_to_index = shard_paths(path_to_shard)
+        self._files = [open(path_to_data, 'rb'), open(path_to_index, 'rb')]
+        self._data, self._index = [
+            # NB: empty files cannot be mapped
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+            for f in self._files
+        ]
+        magic, version, codec, self.count = INDEX_HEADER.unpack_from(self._index, 0)
+        assert magic == INDEX_MAGIC, f'{path_to_index} is not a shard index'
+        assert version == INDEX_VERSION, f'unsupported shard index version {version}'
+        self.codec = archive.CODECS[codec]
+        self._strings_offset = INDEX_HEADER.size + self.count * INDEX_RECORD.size
+        self._names = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def record(self, i: int) -> tuple:
+        """
+        Return (offset, length, duration, name, text) of the i-th fragment.
+        """
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset, length, duration, strings, name_length, text_length = INDEX_RECORD.unpack_from(
+            self._index, INDEX_HEADER.size + i * INDEX_RECORD.size)
+        start = self._strings_offset + strings
+        name = bytes(self._index[start:start + name_length]).decode()
+        text = bytes(self._index[start + name_length:start + name_length + text_length]).decode()
+        return offset, length, duration, name, text
+
+    def __getitem__(self, i: int) -> Entry:
+        offset, length, duration, name, text = self.record(i)
+        return Entry(name, duration, text, memoryview(self._data)[offset:offset + length])
+
+    def payload(self, i: int) -> bytes:
+        """
+        Return the i-th fragment decompressed (ie. a wav or flac file).
+        """
+        data = self[i].data
+        if self.codec == 'deflate':
+            return zlib.decompress(data, -15)
+        return bytes(data)
+
+    def find(self, name: str) -> int:
+        if self._names is None:
+            self._names = {self.record(i)[3]: i for i in range(self.count)}
+        return self._names[name]
+
+    def close(self):
+        for m in (self._data, self._index):
+            if isinstance(m, mmap.mmap):
+                try:
+                    m.close()
+                except BufferError:
+                    # some fragments are still referenced => mapping will be released with them
+                    pass
+        for f in self._files:
+            f.close()
+
+
+def decode_payload(codec: str, payload: bytes) -> bytes:
+    """
+    Return the wav file of an encoded fragment.
+    """
+    if codec == 'deflate':
+        return zlib.decompress(payload, -15)
+    if codec == 'flac':
+        return ffmpeg.decode_flac(payload)
+    return payload
+
+
+def _extract_features(codec: str, payload: bytes, params: dict):
+    return features.extract(decode_payload(codec, payload), params)
+
+
+def read_manifest(path_to_release: str) -> dict:
+    with open(os.path.join(path_to_release, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def list_shards(path_to_release: str) -> list:
+    return [os.path.join(path_to_release, shard['name']) for shard in read_manifest(path_to_release)['shards']]
+
+
+class PreviousRelease:
+    """
+    Look up encoded fragments of a sharded release from their content key.
+    """
+
+    def __init__(self, path_to_release: str):
+        self.path = path_to_release
+        manifest = read_manifest(path_to_release)
+        self.codec = manifest['codec']
+        self.features = manifest.get('features')
+        self._locations = {}
+        self.names = set()
+        for shard in manifest['shards']:
+            for i, (key, name) in enumerate(zip(shard.get('keys', []), shard.get('names', []))):
+                self._locations[key] = shard['name'], i
+                self.names.add(name)
+        self._readers = {}
+        self._feature_readers = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._locations
+
+    def get(self, key: str) -> Entry:
+        shard_name, i = self._locations[key]
+        if shard_name not in self._readers:
+            self._readers[shard_name] = ShardReader(os.path.join(self.path, shard_name))
+        return self._readers[shard_name][i]
+
+    def get_features(self, key: str) -> tuple:
+        shard_name, i = self._locations[key]
+        if shard_name not in self._feature_readers:
+            self._feature_readers[shard_name] = features.FeatureReader(os.path.join(self.path, shard_name), self.features)
+        return self._feature_readers[shard_name][i]
+
+    def close(self):
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        self._feature_readers = {}
+
+
+class ShardPacker:
+    """
+    Write fragments contiguously into size-bounded shards, each one with an index of
+    (name, offset, length, duration, text). Same interface as `archive.ZipPacker`.
+
+    Given a `previous` release, fragments whose content key did not change are copied from it instead of
+    being encoded again, and new, modified or renamed fragments can also be written to a `delta` zip archive:
+    applying it (then removing the names listed in its removed.txt) to the previous release gives the new one.
+
+    Given feature parameters (see `features.DEFAULT_PARAMS`), log-mel and MFCC features of every fragment
+    are computed by a pool of processes and stored next to each shard.
+    """
+
+    def __init__(self, path_to_release: str, codec: str = 'store', workers: int = None, shard_size: int = 2 ** 30,
+                 previous: str = None, delta: str = None, features_params: dict = None):
+        assert codec in archive.CODECS, f'{codec} not in {archive.CODECS}'
+        self.path = path_to_release
+        self.codec = codec
+        self.workers = workers or os.cpu_count()
+        self.shard_size = shard_size
+        self.shards = []
+        self.reused_count = 0
+        # NB: build aside so that the release being replaced can still be read (ie. as previous release)
+        self._tmp_path = f'{path_to_release}.tmp'
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+        os.makedirs(self._tmp_path)
+        self.previous = PreviousRelease(previous) if previous else None
+        if self.previous and self.previous.codec != codec:
+            self.previous.close()
+            self.previous = None
+        self._delta_path = delta
+        self._delta = zipfile.ZipFile(delta, 'w', allowZip64=True) if delta else None
+        self._delta_rows = []
+        self._names = set()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.features = None
+        self._features_executor = None
+        if features_params is not None:
+            self.features = dict(features.DEFAULT_PARAMS, **features_params)
+            self._features_executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._pending = deque()
+        self._file = None
+        self._features_writer = None
+        self._records = []
+        self._keys = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def shard_name(self) -> str:
+        return f'{len(self.shards):05d}'
+
+    @profiling.profiled()
+    def add(self, name: str, data: bytes, text: str = '', key: str = None) -> str:
+        rate, channels, sampwidth, _, data_size = wav.parse_header(data)
+        duration = data_size / (rate * channels * sampwidth)
+        features_future = None
+        if self.features is not None:
+            features_future = self._features_executor.submit(features.extract, data, self.features)
+        return self._append(name, duration, text, key, self._executor.submit(archive.encode, data, self.codec),
+                            features_future)
+
+    @profiling.profiled()
+    def reuse(self, name: str, key: str):
+        """
+        Copy the fragment from the previous release if its content did not change.
+        Return its path or None if it needs to be encoded (ie. added).
+        """
+        if self.previous is None or key not in self.previous:
+            return None
+        entry = self.previous.get(key)
+        if self._delta is not None and entry.name != f'{name}{archive.EXTENSIONS[self.codec]}':
+            # NB: names are positional => a fragment shifted by an insertion or a removal is written to the delta
+            future = self._executor.submit(archive.precompressed, bytes(entry.data), self.codec)
+        else:
+            future = Future()
+            future.set_result((None, None, None, entry.data))
+        features_future = None
+        if self.features is not None and self.previous.features == self.features:
+            features_future = Future()
+            features_future.set_result(self.previous.get_features(key))
+        elif self.features is not None:
+            features_future = self._features_executor.submit(_extract_features, self.codec, bytes(entry.data), self.features)
+        self.reused_count += 1
+        return self._append(name, entry.duration, entry.text, key, future, features_future, previous_name=entry.name)
+
+    def _append(self, name: str, duration: float, text: str, key: str, future: Future, features_future: Future = None,
+                previous_name: str = None) -> str:
+        arcname = f'{name}{archive.EXTENSIONS[self.codec]}'
+        self._names.add(arcname)
+        self._pending.append((arcname, duration, text, key, future, features_future, previous_name))
+        # keep a bounded number of encoded fragments in memory
+        while len(self._pending) > 2 * self.workers:
+            self._write_next()
+        # NB: shard is only known once previous fragments are written
+        return arcname
+
+    def _write_next(self):
+        arcname, duration, text, key, future, features_future, previous_name = self._pending.popleft()
+        encoded = future.result()
+        payload = encoded[3]
+        if self._file is None:
+            path_to_shard = os.path.join(self._tmp_path, self.shard_name)
+            self._file = open(shard_paths(path_to_shard)[0], 'wb')
+            if self.features is not None:
+                self._features_writer = features.FeatureWriter(path_to_shard)
+        offset = self._file.tell()
+        self._file.write(payload)
+        if features_future is not None:
+            self._features_writer.append(*features_future.result())
+        self._records.append((offset, len(payload), duration, arcname, text))
+        self._keys.append(key)
+        if self._delta is not None and arcname != previous_name:
+            archive.write_precompressed(self._delta, arcname, *encoded)
+            self._delta_rows.append(dict(path=arcname, duration=round(duration, 3), text=text))
+        if self._file.tell() >= self.shard_size:
+            self._close_shard()
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+        size = self._file.tell()
+        self._file.close()
+        self._file = None
+        if self._features_writer is not None:
+            self._features_writer.close()
+            self._features_writer = None
+        write_index(shard_paths(os.path.join(self._tmp_path, self.shard_name))[1], self.codec, self._records)
+        self.shards.append(dict(
+            name=self.shard_name,
+            count=len(self._records),
+            size=size,
+            names=[r[3] for r in self._records],
+            keys=self._keys,
+        ))
+        self._records = []
+        self._keys = []
+
+    def writefile(self, name: str, file_, chunk_size: int = 2 ** 20):
+        mode = 'w' if isinstance(file_.read(0), str) else 'wb'
+        with open(os.path.join(self._tmp_path, name), mode) as dest:
+            while True:
+                chunk = file_.read(chunk_size)
+                if not chunk:
+                    break
+                dest.write(chunk)
+
+    def flush(self):
+        while self._pending:
+            self._write_next()
+
+    @profiling.profiled()
+    def close(self):
+        self.flush()
+        self._close_shard()
+        self._executor.shutdown(wait=True)
+        manifest = dict(codec=self.codec, shards=self.shards)
+        if self.features is not None:
+            self._features_executor.shutdown(wait=True)
+            manifest['features'] = self.features
+        with open(os.path.join(self._tmp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        if self._delta is not None:
+            self._close_delta()
+        if self.previous is not None:
+            self.previous.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.rename(self._tmp_path, self.path)
+
+    def abort(self):
+        """
+        Drop the release being built, leaving the existing one (if any) untouched.
+        """
+        for _, _, _, _, future, features_future, _ in self._pending:
+            future.cancel()
+            if features_future is not None:
+                features_future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        if self._features_executor is not None:
+            self._features_executor.shutdown(wait=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._features_writer is not None:
+            self._features_writer.close()
+            self._features_writer = None
+        if self._delta is not None:
+            self._delta.close()
+            os.unlink(self._delta_path)
+        if self.previous is not None:
+            self.previous.close()
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+
+    def _close_delta(self):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, delimiter=',', fieldnames=['path', 'duration', 'text'])
+        writer.writeheader()
+        writer.writerows(self._delta_rows)
+        self._delta.writestr('data.csv', buffer.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+        removed = sorted(self.previous.names - self._names) if self.previous else []
+        self._delta.writestr('removed.txt', ''.join(f'{name}\n' for name in removed), compress_type=zipfile.ZIP_DEFLATED)
+        self._delta.close()
@@ -0,0 +1,124 @@
+import json
+import os
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from hashlib import sha1
+from typing import Callable, Iterator, List, Tuple
+
+from training_speech import utils, ffmpeg, intervals, profiling
+
+# NB: bump whenever a backend output may change => every cached silences list is computed again
+CACHE_VERSION = 1
+DEFAULT_BACKEND = 'vad'
+MIN_DURATION = 0.0401
+
+Backend = namedtuple('Backend', ['name', 'detect', 'defaults'])
+BACKENDS = OrderedDict()
+
+
+def register(name: str, **defaults):
+    """
+    Register `detect(path_to_audio, audio_hash=None, **params) -> [(begin, end), ...]` as backend `name`.
+    `defaults` lists every param the backend accepts, they are all part of the cache key (`audio_hash` is not a param:
+    it only spares backends hashing the audio again).
+    """
+    def decorator(detect: Callable):
+        BACKENDS[name] = Backend(name, detect, defaults)
+        return detect
+    return decorator
+
+
+def resolve_params(backend: str, **params) -> dict:
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown silence backend {backend}, expected one of {", ".join(BACKENDS)}')
+    unknown = set(params) - set(BACKENDS[backend].defaults)
+    if unknown:
+        raise TypeError(f'unexpected params for silence backend {backend}: {", ".join(sorted(unknown))}')
+    return dict(BACKENDS[backend].defaults, **params)
+
+
+def cached_path(audio_hash: str, backend: str, params: dict) -> str:
+    key = json.dumps(dict(params, version=CACHE_VERSION), sort_keys=True)
+    return os.path.join(utils.CACHE_DIR, f'silences_{backend}_{audio_hash}_{sha1(key.encode()).hexdigest()[:16]}.intervals')
+
+
+@profiling.profiled()
+def list_silences(path_to_audio: str, backend: str = DEFAULT_BACKEND, force: bool = False, audio_hash: str = None,
+                  **params) -> List[Tuple[float, float]]:
+    """
+    Return sorted, non overlapping (begin, end) silences of `path_to_audio` detected by `backend`,
+    cached by (audio digest, backend, params). Missing params take the backend defaults.
+    """
+    params = resolve_params(backend, **params)
+    if audio_hash is None:
+        with open(path_to_audio, 'rb') as f:
+            audio_hash = utils.hash_file(f)
+
+    path = cached_path(audio_hash, backend, params)
+    if not force and os.path.isfile(path):
+        return intervals.load_intervals(path)
+
+    detected = BACKENDS[backend].detect(path_to_audio, audio_hash=audio_hash, **params)
+    silences = [(round(s, 3), round(e, 3)) for s, e in detected]
+    intervals.write_intervals(path, silences)
+    return silences
+
+
+def list_silences_many(paths: List[str], backend: str = DEFAULT_BACKEND, jobs: int = None, force: bool = False,
+                       **params) -> Iterator[Tuple[str, List[Tuple[float, float]], Exception]]:
+    """
+    Run `list_silences` over `paths` in `jobs` processes, yield (path, silences, error) as they complete.
+    NB: backends registered at runtime are only known to workers if processes are forked.
+    """
+    params = resolve_params(backend, **params)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(list_silences, path, backend, force, **params): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error else future.result(), error
+
+
+def intersect(left: List[Tuple[float, float]], right: List[Tuple[float, float]],
+              min_duration: float = MIN_DURATION) -> List[Tuple[float, float]]:
+    """
+    Return spans longer than `min_duration` silent according to both `left` and `right` (sorted, non overlapping).
+    """
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        begin, end = max(left[i][0], right[j][0]), min(left[i][1], right[j][1])
+        if end - begin > min_duration:
+            result.append((begin, end))
+        if left[i][1] < right[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+@register('vad', mode=utils.DEFAULT_VAD_MODE, frame_duration=utils.DEFAULT_VAD_FRAME_DURATION, margin=0.07001,
+          merge=True)
+def detect_vad(path_to_audio: str, **params) -> List[Tuple[float, float]]:
+    # NB: webrtcvad is only required by this backend => imported on use
+    from training_speech import vad
+    return vad.detect_silences(path_to_audio, **params)
+register('ffmpeg', noise_level=-50, min_duration=0.05, margin=0.06001, merge=True)(ffmpeg.detect_silences)
+
+
+@register('combined', mode=utils.DEFAULT_VAD_MODE, frame_duration=utils.DEFAULT_VAD_FRAME_DURATION,
+          noise_level=-50, min_duration=0.05)
+def detect_combined(path_to_audio: str, mode: int, frame_duration: int, noise_level: int, min_duration: float,
+                    audio_hash: str = None) -> List[Tuple[float, float]]:
+    """
+    Spans both without voice (vad) and below `noise_level` (ffmpeg): fewer false positives on breaths and background.
+    """
+    # NB: through the cache => shared with the vad and ffmpeg backends
+    return intersect(
+        list_silences(path_to_audio, 'vad', audio_hash=audio_hash, mode=mode, frame_duration=frame_duration),
+        list_silences(
+            path_to_audio, 'ffmpeg', audio_hash=audio_hash, noise_level=noise_level, min_duration=min_duration,
+        ),
+    )
@@ -1,18 +1,21 @@
 import subprocess
-from contextlib import contextmanager
 
-
-@contextmanager
-def play(path_to_file: str, speed: float=None):
-    options = ''
-    if speed is not None:
-        options += f'tempo {speed}'
-    player = subprocess.Popen(f'play -q {path_to_file} {options}'.strip().split(' '))
-    yield player
-    player.wait()
+from training_speech import runner, profiling
 
 
+@profiling.profiled()
 def trim(input_path: str, output_path: str, from_: float, to: float):
     assert to > from_
     duration = round(to - from_, 4)
-    subprocess.call(f'sox {input_path.strip()} {output_path.strip()} trim {from_} {duration}'.split(' '))
+    runner.run(f'sox {input_path.strip()} {output_path.strip()} trim {from_} {duration}'.split(' '))
+
+
+def play_stream(rate: int, channels: int = 1, bits: int = 16, speed: float = None, buffer_size: int = 2048) -> subprocess.Popen:
+    # NB: raw PCM is read from stdin so that a single process can play many fragments
+    options = ''
+    if speed is not None:
+        options += f'tempo {speed}'
+    return runner.spawn(
+        f'play -q --buffer {buffer_size} -t raw -r {rate} -e signed -b {bits} -c {channels} - {options}'.strip().split(' '),
+        stdin=subprocess.PIPE,
+    )
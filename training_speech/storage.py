@@ -0,0 +1,228 @@
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from training_speech import utils
+
+# NB: same as aws cli and boto3 defaults => digests of existing objects match local ones
+PART_SIZE = 8 * 2 ** 20
+DEFAULT_JOBS = 8
+
+# NB: digest may be a callable computing it lazily (ie. for local files)
+ObjectInfo = namedtuple('ObjectInfo', ['key', 'size', 'digest'])
+SyncResult = namedtuple('SyncResult', ['transferred', 'skipped', 'size'])
+
+
+def etag(path: str, part_size: int = PART_SIZE) -> str:
+    """
+    Return the S3 ETag `path` gets once uploaded in `part_size` parts: md5, or md5 of parts md5 followed by parts count.
+    """
+    digests = []
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(part_size), b''):
+            digests.append(hashlib.md5(chunk).digest())
+    if len(digests) <= 1:
+        return (digests[0] if digests else hashlib.md5().digest()).hex()
+    return f'{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}'
+
+
+def _copy(from_: str, to: str):
+    os.makedirs(os.path.dirname(to), exist_ok=True)
+    shutil.copyfile(from_, f'{to}.tmp')
+    os.replace(f'{to}.tmp', to)
+
+
+class DigestCache:
+    """
+    Digests of local files, persisted by (path, size, mtime) so that unchanged files are not read again.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(utils.CACHE_DIR, 'digests.json')
+        self._lock = threading.Lock()
+        self._digests = {}
+        self._dirty = False
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self._digests = json.load(f)
+
+    def get(self, path: str, stat: os.stat_result = None) -> str:
+        stat = stat or os.stat(path)
+        key = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = etag(path)
+            with self._lock:
+                self._digests[key] = digest
+                self._dirty = True
+        return digest
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f'{self.path}.tmp', 'w') as f:
+                json.dump(self._digests, f)
+            os.replace(f'{self.path}.tmp', self.path)
+            self._dirty = False
+
+
+class Storage:
+    """
+    A flat namespace of objects (keys are '/' separated paths relative to the storage root).
+    """
+    url = None
+
+    def list(self) -> Dict[str, ObjectInfo]:
+        raise NotImplementedError()
+
+    def get(self, key: str, path: str):
+        """
+        Write object `key` to local file `path`.
+        """
+        raise NotImplementedError()
+
+    def put(self, path: str, key: str, public: bool = False):
+        """
+        Write local file `path` as object `key`, readable by anyone if `public`.
+        """
+        raise NotImplementedError()
+
+
+class LocalStorage(Storage):
+    """
+    A local directory (ie. an offline mirror of the bucket, or tests).
+    """
+
+    def __init__(self, root: str, digests: DigestCache = None):
+        self.root = os.path.abspath(root)
+        self.url = self.root
+        self.digests = digests or DigestCache()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def list(self) -> Dict[str, ObjectInfo]:
+        objects = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                stat = os.stat(path)
+                # NB: digest is computed on demand, only if sizes match
+                objects[key] = ObjectInfo(key, stat.st_size, lambda path_=path, stat_=stat: self.digests.get(path_, stat_))
+        return objects
+
+    def get(self, key: str, path: str):
+        _copy(self.path(key), path)
+
+    def put(self, path: str, key: str, public: bool = False):
+        _copy(path, self.path(key))
+
+
+class S3Storage(Storage):
+    """
+    Objects of `bucket` under `prefix`, transferred in `PART_SIZE` parts by `max_concurrency` threads each.
+    """
+
+    def __init__(self, bucket: str, prefix: str = '', client=None, max_concurrency: int = 4):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.url = f's3://{bucket}/{self.prefix}'
+        self.max_concurrency = max_concurrency
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3')
+        return self._client
+
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(multipart_threshold=PART_SIZE, multipart_chunksize=PART_SIZE,
+                              max_concurrency=self.max_concurrency)
+
+    def list(self) -> Dict[str, ObjectInfo]:
+        objects = {}
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                key = item['Key'][len(self.prefix):]
+                objects[key] = ObjectInfo(key, item['Size'], item['ETag'].strip('"'))
+        return objects
+
+    def get(self, key: str, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.client.download_file(self.bucket, self.prefix + key, f'{path}.tmp', Config=self._transfer_config())
+        os.replace(f'{path}.tmp', path)
+
+    def put(self, path: str, key: str, public: bool = False):
+        extra_args = dict(ACL='public-read') if public else None
+        self.client.upload_file(path, self.bucket, self.prefix + key, ExtraArgs=extra_args, Config=self._transfer_config())
+
+
+def open_storage(url: str, **kwargs) -> Storage:
+    """
+    's3://bucket/prefix/' or a local directory ('file:///path/' or '/path/').
+    """
+    if url.startswith('s3://'):
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        return S3Storage(bucket, prefix, **kwargs)
+    if url.startswith('file://'):
+        url = url[len('file://'):]
+    return LocalStorage(url, **kwargs)
+
+
+def _digest(info: ObjectInfo) -> str:
+    return info.digest() if callable(info.digest) else info.digest
+
+
+def matches(key: str, include: List[str] = None, exclude: List[str] = ()) -> bool:
+    name = key.rsplit('/', 1)[-1]
+    if any(fnmatch.fnmatch(key, pattern) or fnmatch.fnmatch(name, pattern) for pattern in exclude):
+        return False
+    return include is None or any(fnmatch.fnmatch(key, pattern) or fnmatch.fnmatch(name, pattern) for pattern in include)
+
+
+def sync(src: Storage, dst: Storage, include: List[str] = None, exclude: List[str] = (), public: bool = False,
+         jobs: int = DEFAULT_JOBS, dry_run: bool = False, on_transfer: Callable[[ObjectInfo], None] = None) -> SyncResult:
+    """
+    Copy objects of `src` (matching `include` if provided and not `exclude`) that `dst` misses or holds with another
+    digest, `jobs` at a time. One of `src` and `dst` must be local.
+    """
+    assert isinstance(src, LocalStorage) or isinstance(dst, LocalStorage), 'at least one storage must be local'
+    dst_objects = dst.list()
+    candidates = [info for key, info in sorted(src.list().items()) if matches(key, include, exclude)]
+
+    def _sync(info: ObjectInfo) -> bool:
+        existing = dst_objects.get(info.key)
+        # NB: digests are compared in workers too => local files are hashed in parallel (once, see `DigestCache`)
+        if existing is not None and existing.size == info.size and _digest(existing) == _digest(info):
+            return False
+        if not dry_run:
+            if isinstance(dst, LocalStorage):
+                src.get(info.key, dst.path(info.key))
+            else:
+                dst.put(src.path(info.key), info.key, public=public)
+        if on_transfer is not None:
+            on_transfer(info)
+        return True
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            transferred = [info for info, done in zip(candidates, executor.map(_sync, candidates)) if done]
+    finally:
+        for storage in (src, dst):
+            if isinstance(storage, LocalStorage):
+                storage.digests.save()
+    return SyncResult([info.key for info in transferred], len(candidates) - len(transferred), sum(info.size for info in transferred))
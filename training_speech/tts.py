@@ -0,0 +1,174 @@
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter, OrderedDict
+from hashlib import sha1
+from typing import List, Tuple
+
+from aeneas.exacttiming import TimeValue
+from aeneas.ttswrappers.espeakttswrapper import ESPEAKTTSWrapper
+
+from training_speech import utils, wav, profiling
+
+# NB: bump whenever synthesized waves may change (ie. espeak upgrade) => every text is synthesized again
+CACHE_VERSION = 1
+MAX_CACHE_SIZE = 2 * 2 ** 30
+# NB: pruning scans the whole cache => done on the first misses of a process, then once every PRUNE_INTERVAL misses
+PRUNE_INTERVAL = 10000
+
+# cached texts found (hits) or synthesized (misses) by the aligner in this process
+STATS = Counter()
+_pruned_at = None
+
+
+def normalize(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def cache_dir() -> str:
+    return os.path.join(utils.CACHE_DIR, 'tts')
+
+
+def cached_path(voice_code: str, text: str, params: list) -> str:
+    key = json.dumps([CACHE_VERSION, params, voice_code, normalize(text)])
+    return os.path.join(cache_dir(), f'{sha1(key.encode()).hexdigest()}.wav')
+
+
+def split_wav(path_to_wav: str, intervals: List[Tuple[float, float]], paths: List[str]):
+    """
+    Write the (begin, end) `intervals` of `path_to_wav` to `paths`.
+    """
+    with wav.PCM(path_to_wav) as pcm:
+        for (begin, end), path in zip(intervals, paths):
+            data = pcm.slice(begin, end)
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(wav.header(pcm.rate, pcm.channels, pcm.sampwidth, len(data)))
+                f.write(data)
+            data.release()
+            os.replace(f'{path}.tmp', path)
+
+
+def maybe_prune():
+    """
+    `prune` unless it already ran in this process less than `PRUNE_INTERVAL` misses ago.
+    """
+    global _pruned_at
+    if _pruned_at is None or STATS['misses'] - _pruned_at >= PRUNE_INTERVAL:
+        _pruned_at = STATS['misses']
+        prune()
+
+
+def prune(max_size: int = MAX_CACHE_SIZE) -> int:
+    """
+    Remove least recently used synthesized waves until the cache holds at most `max_size` bytes.
+    Return the number of removed files.
+    """
+    if not os.path.isdir(cache_dir()):
+        return 0
+    entries = []
+    for entry in os.scandir(cache_dir()):
+        if entry.name.endswith('.wav'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    size = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size_, path in sorted(entries):
+        if size <= max_size:
+            break
+        os.unlink(path)
+        size -= size_
+        removed += 1
+    return removed
+
+
+class CachedTTSWrapper(ESPEAKTTSWrapper):
+    """
+    eSpeak wrapper persisting the wave of every text fragment, keyed by (voice, eSpeak params, normalized text):
+    sub-alignments (ie. `smart_cut` candidates) only synthesize texts that were never synthesized before.
+    Missing texts are synthesized in a single call to the C extension when available, one eSpeak process each otherwise.
+    """
+    HAS_PYTHON_CALL = True
+
+    TAG = u'CachedTTSWrapper'
+
+    def __init__(self, rconf=None, logger=None):
+        super().__init__(rconf=rconf, logger=logger)
+        # NB: tts_path points to the wrapper module aeneas loaded (see `aeneas_tts`) => espeak is looked up in PATH
+        self.tts_path = self.DEFAULT_TTS_PATH
+        self.set_subprocess_arguments([
+            self.tts_path,
+            u'-v',
+            self.CLI_PARAMETER_VOICE_CODE_STRING,
+            u'-w',
+            self.CLI_PARAMETER_WAVE_PATH,
+            self.CLI_PARAMETER_TEXT_STDIN,
+        ])
+        self.params = [ESPEAKTTSWrapper.TAG, list(self.OUTPUT_AUDIO_FORMAT)]
+
+    def _voice_code(self, fragment) -> str:
+        return self._language_to_voice_code(fragment.language or self.DEFAULT_LANGUAGE)
+
+    def _synthesize_multiple_python(self, text_file, output_file_path, quit_after=None, backwards=False):
+        missing = OrderedDict()
+        for fragment in text_file.fragments:
+            text = normalize(fragment.filtered_text or u'')
+            if not text:
+                continue
+            path = cached_path(self._voice_code(fragment), text, self.params)
+            if path in missing or os.path.isfile(path):
+                STATS['hits'] += 1
+            else:
+                missing[path] = (self._voice_code(fragment), text)
+        STATS['misses'] += len(missing)
+
+        if len(missing) > 1:
+            self._synthesize_missing(missing)
+        result = self._synthesize_multiple_generic(
+            helper_function=self._synthesize_single_python_helper,
+            text_file=text_file,
+            output_file_path=output_file_path,
+            quit_after=quit_after,
+            backwards=backwards,
+        )
+        if missing:
+            maybe_prune()
+        return result
+
+    def _synthesize_missing(self, missing: OrderedDict):
+        try:
+            import aeneas.cew.cew
+        except ImportError:
+            # NB: texts are synthesized one by one by `_synthesize_single_python_helper`
+            return
+        os.makedirs(cache_dir(), exist_ok=True)
+        with tempfile.NamedTemporaryFile(suffix='.tmp', dir=cache_dir()) as file_, \
+                profiling.span('tts.synthesize', texts=len(missing)):
+            try:
+                _, count, intervals = aeneas.cew.cew.synthesize_multiple(file_.name, 0., 0, list(missing.values()))
+            except Exception as exc:
+                self.log_exc(u'An unexpected error occurred while running cew', exc, False, None)
+                return
+            split_wav(file_.name, intervals[:count], list(missing)[:count])
+
+    def _synthesize_single_python_helper(self, text, voice_code, output_file_path=None, return_audio_data=True):
+        text = normalize(text)
+        if not text:
+            return True, (TimeValue('0.000'), None, None, None)
+
+        path = cached_path(voice_code, text, self.params)
+        if os.path.isfile(path):
+            # NB: least recently used waves are pruned first
+            os.utime(path)
+        else:
+            os.makedirs(cache_dir(), exist_ok=True)
+            succeeded, _ = self._synthesize_single_subprocess_helper(
+                text, voice_code, output_file_path=f'{path}.tmp', return_audio_data=False,
+            )
+            if not succeeded:
+                return False, None
+            os.replace(f'{path}.tmp', path)
+
+        if output_file_path is not None:
+            shutil.copyfile(path, output_file_path)
+        return self._read_audio_data(path) if return_audio_data else (True, None)
@@ -14,10 +14,11 @@ from typing import Pattern, List, Tuple, Iterator
 from num2words import num2words
 from nltk.tokenize import sent_tokenize
 from aeneas.executetask import ExecuteTask
+from aeneas.runtimeconfiguration import RuntimeConfiguration
 from aeneas.task import Task
 from datadiff import diff
 
-from training_speech import sox
+from training_speech import sox, profiling, accounting, memory, intervals
 from training_speech.exceptions import WrongCutException
 
 EPS = 1e-3
@@ -27,6 +28,10 @@ NO_SPLIT_TOKENS = {'Ah !', 'Oh !', 'Eh !', 'Mais….', 'Mais…', 'Mais', 'Mais
 DEFAULT_VAD_MODE = 3
 DEFAULT_VAD_FRAME_DURATION = 20
 CLEANUP_REG = re.compile(r'\s(!?\.,…)')
+# NB: bump whenever `build_alignment` may produce a different result from the same inputs
+ALIGNMENT_VERSION = 1
+# NB: aeneas loads custom TTS wrappers from their path => synthesized texts are cached, see `training_speech.tts`
+TTS_RCONF = f'tts=custom|tts_path={os.path.abspath(os.path.join(CURRENT_DIR, "aeneas_tts.py"))}'
 
 
 if not os.path.isdir(CACHE_DIR):
@@ -206,6 +211,7 @@ def cleanup_document(full_text):
     return '\n'.join(l for l in lines if l)
 
 
+@profiling.profiled()
 def read_epub(path_to_epub, path_to_xhtmls=None):
     if not isinstance(path_to_xhtmls, list) and not isinstance(path_to_xhtmls, tuple):
         path_to_xhtmls = [path_to_xhtmls]
@@ -241,6 +247,7 @@ def cleanup_fragment(original: dict) -> dict:
     return data
 
 
+@profiling.profiled()
 def fix_alignment(alignment: List[dict], silences: List[Tuple[float, float]], separator=None) -> List[dict]:
     alignment = deepcopy(alignment)
 
@@ -353,6 +360,7 @@ def get_closest_fragment(target: dict, others: List[dict]):
     return sorted(others, key=lambda x: min(abs(x['begin'] - target_center), abs(x['end'] - target_center)))[0]
 
 
+@profiling.profiled()
 def hash_file(file_obj, blocksize=65536):
     hash_ = sha1()
     buf = file_obj.read(blocksize)
@@ -372,6 +380,8 @@ def is_float(x: str):
         return False
 
 
+@profiling.profiled()
+@memory.tracked()
 def get_alignment(path_to_audio_file: str, transcript: List[str], force=False, language='fr_FR') -> List[dict]:
     # see https://github.com/readbeyond/aeneas/blob/9d95535ad63eef4a98530cfdff033b8c35315ee1/aeneas/ttswrappers/espeakngttswrapper.py#L45  # noqa
     language = {
@@ -385,23 +395,31 @@ def get_alignment(path_to_audio_file: str, transcript: List[str], force=False, l
     with open(path_to_audio_file, 'rb') as f:
         audio_file_hash = hash_file(f)
 
-    with open(path_to_transcript, 'w') as f:
-        f.writelines('\n'.join(transcript))
-
-    path_to_alignment_tmp = os.path.join(CACHE_DIR, f'{full_transcript_hash}_{audio_file_hash}.json')
+    path_to_cached = os.path.join(CACHE_DIR, f'{full_transcript_hash}_{audio_file_hash}')
+    if not force and os.path.isfile(f'{path_to_cached}.fragments'):
+        return intervals.read_fragments(f'{path_to_cached}.fragments')
 
+    # NB: a sync map left by a previous version is converted rather than computed again
+    path_to_alignment_tmp = f'{path_to_cached}.json'
     if force or not os.path.isfile(path_to_alignment_tmp):
+        with open(path_to_transcript, 'w') as f:
+            f.writelines('\n'.join(transcript))
+
         # build alignment
         task = Task(f'task_language={language}|os_task_file_format=json|is_text_type=plain')
         task.audio_file_path_absolute = os.path.abspath(path_to_audio_file)
         task.text_file_path_absolute = path_to_transcript
         task.sync_map_file_path_absolute = path_to_alignment_tmp
-        executor = ExecuteTask(task=task)
-        executor.execute()
+        executor = ExecuteTask(task=task, rconf=RuntimeConfiguration(TTS_RCONF))
+        with accounting.track(['aeneas', language], bytes_in=len(full_transcript.encode())):
+            executor.execute()
         task.output_sync_map_file()
 
     with open(path_to_alignment_tmp) as source:
-        return [cleanup_fragment(f) for f in json.load(source)['fragments']]
+        fragments = [cleanup_fragment(f) for f in json.load(source)['fragments']]
+    intervals.write_fragments(f'{path_to_cached}.fragments', fragments)
+    os.unlink(path_to_alignment_tmp)
+    return fragments
 
 
 def get_fragment_hash(fragment: dict, salt: str=None):
@@ -409,6 +427,7 @@ def get_fragment_hash(fragment: dict, salt: str=None):
     return f'{hash_}_{fragment["begin"]}_{fragment["end"]}'
 
 
+@profiling.profiled()
 def smart_cut(fragment: dict, silences: List[Tuple[float, float]], path_to_wav: str, language: str, separator: str=None, depth=0):
     if fragment['end'] - fragment['begin'] < 10 or depth > 0:
         return [fragment]
@@ -494,6 +513,7 @@ def smart_cut(fragment: dict, silences: List[Tuple[float, float]], path_to_wav:
     return sorted_options[0]
 
 
+@profiling.profiled()
 def build_alignment(transcript: List[str], path_to_audio: str, existing_alignment: List[dict], silences: List[Tuple[float, float]], generate_labels=False, language='fr_FR', separator=None, depth=0):
 
     if any(f.get('approved') or f.get('disabled') for f in existing_alignment):
@@ -599,23 +619,70 @@ def build_alignment(transcript: List[str], path_to_audio: str, existing_alignmen
         result += smart_cut(fragment, silences=silences, path_to_wav=path_to_audio, language=language, depth=depth)
 
     if generate_labels:
-        # Generate Audacity labels for DEBUG purpose
-        path_to_labels = os.path.join(CACHE_DIR, 'labels.txt')
-        with open(path_to_labels, 'w') as fragment:
-            fragment.writelines('\n'.join([
-                f'{s}\t{e}\tsilence#{i+1:03d}'
-                for i, (s, e) in enumerate(silences)
-            ] + [
-                f'{f["begin"]}\t{f["end"]}\tf#{i+1:03d}:{f["text"]}'
-                for i, f in enumerate(result)
-            ] + [
-                f'{f["begin"]}\t{f["end"]}\to#{i+1:03d}:{f["text"]}'
-                for i, f in enumerate(existing_alignment)
-            ]) + '\n')
+        write_labels(silences, result, existing_alignment)
 
     return result
 
 
+def write_labels(silences: List[Tuple[float, float]], alignment: List[dict], existing_alignment: List[dict]):
+    # Generate Audacity labels for DEBUG purpose
+    path_to_labels = os.path.join(CACHE_DIR, 'labels.txt')
+    with open(path_to_labels, 'w') as fragment:
+        fragment.writelines('\n'.join([
+            f'{s}\t{e}\tsilence#{i+1:03d}'
+            for i, (s, e) in enumerate(silences)
+        ] + [
+            f'{f["begin"]}\t{f["end"]}\tf#{i+1:03d}:{f["text"]}'
+            for i, f in enumerate(alignment)
+        ] + [
+            f'{f["begin"]}\t{f["end"]}\to#{i+1:03d}:{f["text"]}'
+            for i, f in enumerate(existing_alignment)
+        ]) + '\n')
+
+
+@profiling.profiled()
+@memory.tracked()
+def cached_build_alignment(transcript: List[str], path_to_audio: str, existing_alignment: List[dict], silences: List[Tuple[float, float]], generate_labels=False, language='fr_FR', force=False, audio_hash: str = None) -> List[dict]:
+    """
+    `build_alignment` cached from its inputs, audio being identified by its content (`audio_hash` if already known).
+    """
+    # NB: existing alignment is ignored by `build_alignment` until some fragments get approved or disabled
+    if not any(f.get('approved') or f.get('disabled') for f in existing_alignment):
+        existing_alignment = []
+    if audio_hash is None:
+        with open(path_to_audio, 'rb') as f:
+            audio_hash = hash_file(f)
+    key = sha1(json.dumps(dict(
+        version=ALIGNMENT_VERSION,
+        audio=audio_hash,
+        transcript=transcript,
+        existing_alignment=existing_alignment,
+        silences=[list(s) for s in silences],
+        language=language,
+    ), sort_keys=True).encode()).hexdigest()
+    path_to_cached = os.path.join(CACHE_DIR, f'alignment_{key}.json')
+    if not force and os.path.isfile(path_to_cached):
+        with open(path_to_cached) as f:
+            alignment = json.load(f)
+        if generate_labels:
+            # NB: labels of the last built alignment otherwise, aeneas fragments are not listed though
+            write_labels(silences, alignment, existing_alignment)
+        return alignment
+
+    alignment = build_alignment(
+        transcript=transcript,
+        path_to_audio=path_to_audio,
+        existing_alignment=deepcopy(existing_alignment),
+        silences=silences,
+        generate_labels=generate_labels,
+        language=language,
+    )
+    with open(f'{path_to_cached}.tmp', 'w') as f:
+        json.dump(alignment, f)
+    os.replace(f'{path_to_cached}.tmp', path_to_cached)
+    return alignment
+
+
 def transition_silences(left_fragment, right_fragment, silences):
     silences_between = [
         s
@@ -1,22 +1,19 @@
-import json
-import os
 import wave
 from itertools import zip_longest
+from typing import List, Tuple
 
 import webrtcvad
 
-from training_speech import ffmpeg, utils
+from training_speech import ffmpeg, utils, profiling, memory
 
 
-def list_silences(path_to_wav: str, force: bool = False, mode=utils.DEFAULT_VAD_MODE, frame_duration=utils.DEFAULT_VAD_FRAME_DURATION, merge=True):
-    with open(path_to_wav, 'rb') as f:
-        audio_hash = utils.hash_file(f)
-
-    cached_path = os.path.join(utils.CACHE_DIR, f'wav_{audio_hash}_{mode}_{frame_duration}.json')
-    if not force and os.path.isfile(cached_path):
-        with open(cached_path) as f:
-            return json.load(f)
-
+@profiling.profiled()
+@memory.tracked()
+def detect_silences(path_to_wav: str, mode=utils.DEFAULT_VAD_MODE, frame_duration=utils.DEFAULT_VAD_FRAME_DURATION,
+                    margin=0.07001, merge=True, audio_hash: str = None) -> List[Tuple[float, float]]:
+    """
+    Uncached, see `silence.list_silences` (`audio_hash` is unused: wav files are read as they are).
+    """
     duration_sec = ffmpeg.audio_duration(path_to_wav)
     vad_ = webrtcvad.Vad(mode=mode)
 
@@ -90,10 +87,7 @@ def list_silences(path_to_wav: str, force: bool = False, mode=utils.DEFAULT_VAD_
 
     silences = [
         (round(s, 3), round(e, 3))
-        for s, e in (utils.merge_overlaps(silences, margin=0.07001) if merge else silences)
+        for s, e in (utils.merge_overlaps(silences, margin=margin) if merge else silences)
         if e - s > 0.0401
     ]
-    with open(cached_path, 'w') as f:
-        json.dump(silences, f)
-
     return silences
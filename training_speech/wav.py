@@ -0,0 +1,73 @@
+import mmap
+import struct
+
+
+class PCM:
+    """
+    Read-only, memory-mapped access to the samples of a PCM wav file.
+    """
+
+    def __init__(self, path_to_wav: str):
+        self.path = path_to_wav
+        self._file = open(path_to_wav, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.rate, self.channels, self.sampwidth, self.data_offset, self.data_size = parse_header(self._mmap)
+        self.block_align = self.channels * self.sampwidth
+        self.data = memoryview(self._mmap)[self.data_offset:self.data_offset + self.data_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def nframes(self) -> int:
+        return self.data_size // self.block_align
+
+    @property
+    def duration(self) -> float:
+        return self.nframes / self.rate
+
+    def slice(self, begin: float, end: float) -> memoryview:
+        start_frame = max(int(round(begin * self.rate)), 0)
+        end_frame = min(int(round(end * self.rate)), self.nframes)
+        return self.data[start_frame * self.block_align:max(end_frame, start_frame) * self.block_align]
+
+    def close(self):
+        self.data.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # some slices are still referenced => mapping will be released with them
+            pass
+        self._file.close()
+
+
+def parse_header(buffer) -> tuple:
+    riff, _, wave = struct.unpack_from('<4sI4s', buffer, 0)
+    assert riff == b'RIFF' and wave == b'WAVE', 'not a wav file'
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(buffer):
+        chunk_id, chunk_size = struct.unpack_from('<4sI', buffer, offset)
+        offset += 8
+        if chunk_id == b'fmt ':
+            audio_format, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', buffer, offset)
+            assert audio_format in {1, 0xFFFE}, f'unsupported wav format {audio_format}'
+            fmt = rate, channels, bits // 8
+        elif chunk_id == b'data':
+            assert fmt is not None, 'missing fmt chunk'
+            # NB: streamed wav (ie. written by ffmpeg to a pipe) may not have a valid data size
+            return fmt + (offset, min(chunk_size, len(buffer) - offset))
+        offset += chunk_size + chunk_size % 2
+    raise ValueError('missing data chunk')
+
+
+def header(rate: int, channels: int, sampwidth: int, data_size: int) -> bytes:
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, rate, rate * channels * sampwidth, channels * sampwidth, sampwidth * 8,
+        b'data', data_size,
+    )